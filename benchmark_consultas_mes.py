@@ -0,0 +1,147 @@
+# benchmark_consultas_mes.py
+"""
+Benchmark de las consultas por mes
+Compara el filtro extract('month'/'year') con el rango semiabierto
+[inicio, fin) sobre historial_pagos y gastos_edificio en una base temporal.
+Muestra el plan de ejecución de SQLite y el tiempo de cada variante.
+
+Uso: python benchmark_consultas_mes.py [--filas 1000000] [--repeticiones 5]
+No modifica buildtech.db: trabaja sobre un archivo temporal.
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import extract, func
+from database import db
+
+
+def crear_app(ruta_db):
+    """App mínima con la base temporal (sin blueprints ni Socket.IO)"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{ruta_db}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def poblar(filas):
+    """Inserta filas aleatorias repartidas en 5 años"""
+    from models.finanzas_model import HistorialPago, GastoEdificio
+
+    inicio = datetime(2021, 1, 1)
+    segundos = 5 * 365 * 24 * 3600
+    categorias = ['mantenimiento', 'servicios', 'personal', 'limpieza', 'seguridad', 'otros']
+    lote = 50000
+
+    for desde in range(0, filas, lote):
+        cantidad = min(lote, filas - desde)
+        db.session.execute(HistorialPago.__table__.insert(), [
+            {
+                'tipo_pago': 'cargo_mensual',
+                'objeto_id': desde + i,
+                'departamento': random.randint(1, 500),
+                'monto': random.randint(100, 900),
+                'metodo_pago': 'transferencia',
+                'fecha_pago': inicio + timedelta(seconds=random.randrange(segundos)),
+            }
+            for i in range(cantidad)
+        ])
+        db.session.execute(GastoEdificio.__table__.insert(), [
+            {
+                'concepto': f'Gasto {desde + i}',
+                'monto': random.randint(50, 5000),
+                'categoria': random.choice(categorias),
+                'fecha_gasto': inicio.date() + timedelta(days=random.randrange(5 * 365)),
+            }
+            for i in range(cantidad)
+        ])
+        db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+
+
+def plan(query):
+    """Plan de ejecución de SQLite para una consulta ORM"""
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    filas = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+    return ' | '.join(fila[-1] for fila in filas)
+
+
+def medir(query, repeticiones):
+    """Mediana en milisegundos de ejecutar la consulta"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        query.all()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def comparar(titulo, columna, modelo, mes, anio, repeticiones):
+    from utils.fechas_utils import filtro_mes
+
+    base = db.session.query(func.count(modelo.id), func.sum(modelo.monto))
+    variantes = [
+        ('extract()', base.filter(extract('month', columna) == mes,
+                                  extract('year', columna) == anio)),
+        ('rango [inicio, fin)', base.filter(filtro_mes(columna, mes, anio))),
+    ]
+
+    print(f"\n📊 {titulo} - {mes:02d}/{anio}")
+    resultados = []
+    for nombre, query in variantes:
+        resultado = query.one()
+        ms = medir(query, repeticiones)
+        resultados.append(resultado)
+        print(f"   • {nombre:<20} {ms:9.1f} ms   filas={resultado[0]}")
+        print(f"     plan: {plan(query)}")
+
+    if resultados[0] != resultados[1]:
+        print("   ⚠️  Los resultados no coinciden")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de consultas por mes')
+    parser.add_argument('--filas', type=int, default=1000000, help='Filas por tabla')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='buildtech_bench_')
+    ruta_db = os.path.join(directorio, 'benchmark.db')
+    app = crear_app(ruta_db)
+
+    with app.app_context():
+        import models.reservas_model  # noqa: F401 - registra las tablas
+        import models.finanzas_model  # noqa: F401
+        db.create_all()
+
+        print(f"\n⏳ Insertando {args.filas:,} filas en historial_pagos y gastos_edificio...")
+        inicio = time.perf_counter()
+        random.seed(42)
+        poblar(args.filas)
+        print(f"✅ Datos listos en {time.perf_counter() - inicio:.1f} s ({ruta_db})")
+
+        from models.finanzas_model import HistorialPago, GastoEdificio
+        comparar('historial_pagos.fecha_pago (DateTime)', HistorialPago.fecha_pago,
+                 HistorialPago, 6, 2024, args.repeticiones)
+        comparar('gastos_edificio.fecha_gasto (Date)', GastoEdificio.fecha_gasto,
+                 GastoEdificio, 6, 2024, args.repeticiones)
+
+        db.session.remove()
+        db.engine.dispose()
+
+    os.remove(ruta_db)
+    os.rmdir(directorio)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# benchmark_ocupacion.py
+"""
+Benchmark de la verificación de disponibilidad de áreas comunes
+Compara la consulta SQL de superposición (tres condiciones con OR, la que
+usaba AreaComun.esta_disponible_en) con el índice de ocupación en memoria
+(IndiceOcupacion): lectura en frío (carga el día) y en caliente (bisect).
+
+Uso: python benchmark_ocupacion.py [--reservas 100000] [--consultas 5000]
+No modifica buildtech.db: trabaja sobre un archivo temporal.
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import date, time as hora, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import and_, or_
+from database import db
+
+
+def crear_app(ruta_db):
+    """App mínima con la base temporal (sin blueprints ni Socket.IO)"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{ruta_db}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def poblar(reservas):
+    """Reparte las reservas en las 5 áreas, día por día, sin superponerse"""
+    from models.reservas_model import AreaComun, Reserva, inicializar_areas_comunes
+
+    inicializar_areas_comunes()
+    areas = [area.id for area in AreaComun.get_all()]
+    inicio = date(2024, 1, 1)
+    filas = []
+    dias = 0
+    while len(filas) < reservas:
+        fecha = inicio + timedelta(days=dias)
+        for area_id in areas:
+            # Bloques de 1 o 2 horas entre 8:00 y 22:00
+            hora_actual = 8
+            while hora_actual < 22 and len(filas) < reservas:
+                duracion = random.choice((1, 2))
+                if hora_actual + duracion <= 22 and random.random() < 0.7:
+                    filas.append({
+                        'area_id': area_id, 'departamento': random.randint(1, 200),
+                        'usuario': 'Benchmark', 'fecha': fecha,
+                        'hora_inicio': hora(hora_actual), 'hora_fin': hora(hora_actual + duracion),
+                        'estado': random.choice(('pendiente', 'confirmada', 'confirmada', 'cancelada')),
+                        'costo_total': 0, 'num_personas': 1,
+                    })
+                hora_actual += duracion
+        dias += 1
+    for desde in range(0, len(filas), 50000):
+        db.session.execute(Reserva.__table__.insert(), filas[desde:desde + 50000])
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    return areas, inicio, dias
+
+
+def disponible_sql(area_id, fecha, hora_inicio, hora_fin):
+    """Consulta de superposición anterior al índice"""
+    from models.reservas_model import Reserva
+    return Reserva.query.filter(
+        and_(
+            Reserva.area_id == area_id,
+            Reserva.fecha == fecha,
+            Reserva.estado.in_(['pendiente', 'confirmada']),
+            or_(
+                and_(Reserva.hora_inicio <= hora_inicio, Reserva.hora_fin > hora_inicio),
+                and_(Reserva.hora_inicio < hora_fin, Reserva.hora_fin >= hora_fin),
+                and_(Reserva.hora_inicio >= hora_inicio, Reserva.hora_fin <= hora_fin)
+            )
+        )
+    ).first() is None
+
+
+def disponible_indice(area_id, fecha, hora_inicio, hora_fin):
+    from models.reservas_model import IndiceOcupacion, minutos
+    return not IndiceOcupacion.dia(area_id, fecha).choca(minutos(hora_inicio), minutos(hora_fin))
+
+
+def medir(funcion, consultas, antes=None):
+    """Mediana en microsegundos por consulta"""
+    tiempos = []
+    for argumentos in consultas:
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        funcion(*argumentos)
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del índice de ocupación')
+    parser.add_argument('--reservas', type=int, default=100000)
+    parser.add_argument('--consultas', type=int, default=5000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='buildtech_bench_')
+    ruta_db = os.path.join(directorio, 'benchmark.db')
+    app = crear_app(ruta_db)
+
+    with app.app_context():
+        import models.finanzas_model  # noqa: F401 - registra las tablas
+        from models.reservas_model import cache_ocupacion
+        db.create_all()
+
+        print(f"\n⏳ Insertando {args.reservas:,} reservas...")
+        random.seed(42)
+        areas, inicio, dias = poblar(args.reservas)
+        print(f"✅ Reservas en {len(areas)} áreas y {dias:,} días ({ruta_db})")
+
+        consultas = []
+        for _ in range(args.consultas):
+            hora_inicio = random.randint(8, 21)
+            consultas.append((random.choice(areas), inicio + timedelta(days=random.randrange(dias)),
+                              hora(hora_inicio), hora(min(hora_inicio + random.choice((1, 2)), 22))))
+
+        # Mismo resultado en ambas variantes
+        cache_ocupacion.limpiar()
+        diferencias = sum(disponible_sql(*c) != disponible_indice(*c) for c in consultas)
+
+        sql = medir(disponible_sql, consultas)
+        frio = medir(disponible_indice, consultas, antes=cache_ocupacion.limpiar)
+        for consulta in consultas:
+            disponible_indice(*consulta)  # Carga todos los días consultados
+        caliente = medir(disponible_indice, consultas)
+
+        print(f"\n📊 Verificación de disponibilidad ({args.consultas:,} consultas, mediana)")
+        print(f"   • SQL (OR de tres condiciones) {sql:9.1f} µs")
+        print(f"   • Índice en frío (carga el día) {frio:8.1f} µs")
+        print(f"   • Índice en caliente (bisect)   {caliente:8.1f} µs")
+        print(f"   • Entradas en caché: {cache_ocupacion.estadisticas()['entradas']:,}")
+        if diferencias:
+            print(f"   ⚠️  {diferencias} resultados no coinciden")
+
+        db.session.remove()
+        db.engine.dispose()
+
+    os.remove(ruta_db)
+    os.rmdir(directorio)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,24 +4,66 @@ Controlador de Finanzas - Mejorado con funcionalidades completas
 Gestión de cargos mensuales, pagos, gastos y reportes financieros
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file,
+                   Response, stream_with_context, current_app)
 from flask_login import login_required, current_user
 from utils.decorators import role_required
-from models.finanzas_model import CargoMensual, PagoReserva, GastoEdificio, HistorialPago
+from models.finanzas_model import (CargoMensual, PagoReserva, GastoEdificio, HistorialPago,
+                                   ResumenMensual, ResumenFinanciero, CierreMes, AntiguedadDeuda,
+                                   RecargoMora, SaldoDepartamento, ConciliacionBancaria, LecturasMedidores,
+                                   LibroDepartamento, PagosLote, CuboGastos, PresupuestoGasto,
+                                   consulta_exportacion, iterar_por_lotes,
+                                   SeriesFinancieras, cache_finanzas, etiqueta_mes)
 from models.reservas_model import Reserva
 from models.user_model import User
 from datetime import date, datetime
 from decimal import Decimal
 import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+import csv
+import calendar
+import uuid
+from controllers.reportes_controller import encolar_reporte_financiero
 
 finanzas_bp = Blueprint('finanzas', __name__, url_prefix='/financiera')
 
+# Pagos del historial por página (vista del departamento y API)
+TAMANO_PAGINA_HISTORIAL = 20
+
+# Máximo de ítems por pago en lote
+MAX_ITEMS_LOTE = 500
+
+# Límites de la API de series
+MAX_ANIOS_SERIE = 30
+MAX_MESES_PROYECCION = 24
+
+
+def ttl_cache():
+    """Segundos de vida de las estadísticas en caché (FINANZAS_CACHE_TTL)"""
+    return current_app.config.get('FINANZAS_CACHE_TTL', 30)
+
+
+def clave_idempotencia(datos=None):
+    """Clave del encabezado Idempotency-Key o del campo oculto clave_idempotencia"""
+    datos = request.form if datos is None else datos
+    clave = request.headers.get('Idempotency-Key') or datos.get('clave_idempotencia') or ''
+    return str(clave).strip() or None
+
+
+def pagar_item(tipo, pk, metodo_pago='efectivo', referencia=None, observaciones=None):
+    """
+    Paga un cargo o reserva con UPDATE condicional y la clave de idempotencia
+    de la solicitud. Retorna el resultado del ítem (ver PagosLote.pagar).
+    """
+    return PagosLote.pagar(
+        [(tipo, pk)],
+        metodo_pago=metodo_pago,
+        referencia=referencia,
+        observaciones=observaciones,
+        clave=clave_idempotencia(),
+        usuario_id=current_user.id
+    )[0]
+
+
 # ============================================================================
 # RESUMEN FINANCIERO
 # ============================================================================
@@ -37,61 +79,40 @@ def resumen_financiero():
     mes_actual = hoy.month
     anio_actual = hoy.year
     
-    # Obtener cargos mensuales
-    cargos_pendientes = CargoMensual.get_all_pendientes()
-    total_pendiente_cargos = sum(cargo.total for cargo in cargos_pendientes)
+    # Todas las cifras se calculan con consultas agrupadas en SQL
+    estadisticas = ResumenFinanciero.calcular(mes_actual, anio_actual)
     
-    # Obtener pagos de reservas pendientes
+    # Listados para las tablas del dashboard
+    deuda_minima = request.args.get('deuda_minima', type=float)
+    cargos_pendientes = CargoMensual.get_all_pendientes(deuda_minima)
+    recargos_mora = RecargoMora.get_por_cargos([c.id for c in cargos_pendientes])
     pagos_reservas_pendientes = PagoReserva.get_pendientes()
-    total_pendiente_reservas = sum(float(pago.monto) for pago in pagos_reservas_pendientes)
-    
-    # Calcular ingresos del mes actual
-    ingresos_cargos = CargoMensual.get_total_recaudado_mes(mes_actual, anio_actual)
-    ingresos_reservas = PagoReserva.get_total_recaudado_reservas(mes_actual, anio_actual)
-    total_ingresos = ingresos_cargos + ingresos_reservas
-    
-    # Calcular gastos del mes actual
     gastos_mes = GastoEdificio.get_by_mes(mes_actual, anio_actual)
-    total_gastos = sum(float(gasto.monto) for gasto in gastos_mes)
-    
-    # Balance
-    balance = total_ingresos - total_gastos
-    
-    # Historial reciente
-    historial_reciente = HistorialPago.get_all()[:10]
-    
-    # NUEVO: Estadísticas adicionales
-    total_departamentos = len(set([c.departamento for c in CargoMensual.get_all()]))
-    tasa_morosidad = (len(cargos_pendientes) / max(total_departamentos, 1)) * 100
-    
-    # NUEVO: Gastos por categoría
-    gastos_por_categoria = {}
-    for gasto in gastos_mes:
-        cat = gasto.categoria
-        gastos_por_categoria[cat] = gastos_por_categoria.get(cat, 0) + float(gasto.monto)
+    historial_reciente = ResumenFinanciero.historial_reciente(10)
+    antiguedad = AntiguedadDeuda.calcular(hoy)
+    top_deudores = SaldoDepartamento.get_top_deudores(10)
     
-    # NUEVO: Proyección mensual
-    promedio_ingresos = ingresos_cargos / max(len(set([c.departamento for c in CargoMensual.get_by_mes_pagados(mes_actual, anio_actual)])), 1)
-    ingreso_proyectado = promedio_ingresos * total_departamentos
+    # Cierre del mes anterior
+    mes_anterior = 12 if mes_actual == 1 else mes_actual - 1
+    anio_anterior = anio_actual - 1 if mes_actual == 1 else anio_actual
     
     context = {
         'mes_actual': datetime(anio_actual, mes_actual, 1).strftime('%B %Y'),
-        'total_pendiente_cargos': total_pendiente_cargos,
-        'total_pendiente_reservas': total_pendiente_reservas,
+        'mes_anterior': mes_anterior,
+        'anio_anterior': anio_anterior,
+        'mes_anterior_cerrado': CierreMes.get_by_mes(mes_anterior, anio_anterior) is not None,
         'cargos_pendientes': cargos_pendientes,
+        'deuda_minima': deuda_minima,
+        'recargos_mora': recargos_mora,
         'pagos_reservas_pendientes': pagos_reservas_pendientes,
-        'ingresos_cargos': ingresos_cargos,
-        'ingresos_reservas': ingresos_reservas,
-        'total_ingresos': total_ingresos,
-        'total_gastos': total_gastos,
-        'balance': balance,
         'gastos_mes': gastos_mes,
         'historial_reciente': historial_reciente,
-        # Nuevas estadísticas
-        'total_departamentos': total_departamentos,
-        'tasa_morosidad': round(tasa_morosidad, 2),
-        'gastos_por_categoria': gastos_por_categoria,
-        'ingreso_proyectado': ingreso_proyectado,
+        'antiguedad': antiguedad,
+        'top_deudores': top_deudores,
+        'hoy': hoy,
+        # Prefijo de las claves de idempotencia de los formularios de pago
+        'clave_pagina': uuid.uuid4().hex,
+        **estadisticas,
     }
     
     return render_template('finanzas/resumen.html', **context)
@@ -123,25 +144,21 @@ def calcular_cargos_mensuales(departamento_id):
     # Obtener todos los cargos pendientes
     cargos_pendientes = CargoMensual.get_pendientes_by_departamento(departamento_id)
     
-    # Obtener historial de pagos
-    historial = HistorialPago.get_by_departamento(departamento_id)
-    
-    # Obtener pagos de reservas pendientes
-    reservas_pendientes = []
-    if hasattr(current_user, 'departamento') and current_user.departamento == departamento_id:
-        reservas = Reserva.get_by_departamento(departamento_id)
-        for reserva in reservas:
-            pago = PagoReserva.get_by_reserva(reserva.id)
-            if pago and not pago.pagado:
-                reservas_pendientes.append({
-                    'reserva': reserva,
-                    'pago': pago
-                })
-    
-    # Calcular totales
-    total_pendiente = sum(cargo.total for cargo in cargos_pendientes)
-    total_reservas_pendiente = sum(item['pago'].monto for item in reservas_pendientes)
-    total_pagado = sum(h.monto for h in historial)
+    # Primera página del historial; el resto se carga con la API paginada
+    historial, historial_cursor = HistorialPago.get_pagina_departamento(
+        departamento_id, TAMANO_PAGINA_HISTORIAL
+    )
+    
+    # Obtener pagos de reservas pendientes (reserva + pago + área en una consulta)
+    reservas_pendientes = LibroDepartamento(departamento_id).pagos_pendientes()
+    
+    # Totales (en Decimal): el pendiente es la suma de lo que se muestra,
+    # lo pagado sale del saldo del departamento
+    saldo = SaldoDepartamento.get_by_departamento(departamento_id)
+    total_pendiente = sum((c.total for c in cargos_pendientes), Decimal('0.00'))
+    total_reservas_pendiente = sum((item['pago'].monto for item in reservas_pendientes), Decimal('0.00'))
+    total_general_pendiente = total_pendiente + total_reservas_pendiente
+    total_pagado = Decimal(str(saldo.credito)) if saldo else Decimal('0.00')
     
     # NUEVO: Estadísticas del departamento
     meses_con_deuda = len(cargos_pendientes)
@@ -154,9 +171,10 @@ def calcular_cargos_mensuales(departamento_id):
         'cargos_pendientes': cargos_pendientes,
         'reservas_pendientes': reservas_pendientes,
         'historial': historial,
-        'total_pendiente': total_pendiente,
+        'historial_cursor': historial_cursor,
+        'total_pendiente': float(total_pendiente),
         'total_reservas_pendiente': float(total_reservas_pendiente),
-        'total_general_pendiente': total_pendiente + float(total_reservas_pendiente),
+        'total_general_pendiente': float(total_general_pendiente),
         'total_pagado': float(total_pagado),
         'meses_con_deuda': meses_con_deuda,
         'promedio_mensual': promedio_mensual,
@@ -190,7 +208,8 @@ def pagar_cargo_pendiente(departamento_id, tipo_cargo, objeto_id):
             return redirect(url_for('finanzas.calcular_cargos_mensuales', 
                                   departamento_id=departamento_id))
         
-        if cargo.pagado:
+        # En POST decide el UPDATE condicional (un reintento recibe su resultado original)
+        if cargo.pagado and request.method == 'GET':
             flash('Este cargo ya fue pagado.', 'info')
             return redirect(url_for('finanzas.calcular_cargos_mensuales', 
                                   departamento_id=departamento_id))
@@ -199,29 +218,32 @@ def pagar_cargo_pendiente(departamento_id, tipo_cargo, objeto_id):
             metodo_pago = request.form.get('metodo_pago', 'efectivo')
             referencia = request.form.get('referencia', '')
             
-            # Marcar como pagado
-            cargo.marcar_pagado()
+            # Marcar como pagado y registrar en historial en una sola transacción;
+            # el UPDATE condicional decide si esta solicitud realizó el pago
+            try:
+                resultado = pagar_item('cargo', objeto_id, metodo_pago, referencia,
+                                       observaciones='Pago de cargo mensual')
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('finanzas.calcular_cargos_mensuales', 
+                                      departamento_id=departamento_id))
             
-            # Registrar en historial
-            HistorialPago.registrar_pago(
-                tipo_pago='cargo_mensual',
-                objeto_id=objeto_id,
-                departamento=departamento_id,
-                monto=cargo.total,
-                metodo_pago=metodo_pago,
-                observaciones=f'Pago de cargo mensual {cargo.mes_nombre} {cargo.anio}. Ref: {referencia}'
-            )
+            if resultado['estado'] != 'pagado':
+                flash('Este cargo ya fue pagado.', 'info')
+                return redirect(url_for('finanzas.calcular_cargos_mensuales', 
+                                      departamento_id=departamento_id))
             
-            # NUEVO: Enviar confirmación por email
-            try:
-                usuario = User.query.filter_by(departamento=departamento_id).first()
-                if usuario and usuario.email:
-                    from utils.email_utils import enviar_email_confirmacion_pago
-                    enviar_email_confirmacion_pago(usuario, cargo, metodo_pago, referencia)
-            except Exception as e:
-                print(f"Error al enviar email: {e}")
+            # NUEVO: Enviar confirmación por email (no en los reintentos)
+            if not resultado.get('repetido'):
+                try:
+                    usuario = User.query.filter_by(departamento=departamento_id).first()
+                    if usuario and usuario.email:
+                        from utils.email_utils import enviar_email_confirmacion_pago
+                        enviar_email_confirmacion_pago(usuario, cargo, metodo_pago, referencia)
+                except Exception as e:
+                    print(f"Error al enviar email: {e}")
             
-            flash(f'Pago registrado exitosamente. Monto: Bs. {cargo.total:.2f}', 'success')
+            flash(f'Pago registrado exitosamente. Monto: Bs. {resultado["monto"]:.2f}', 'success')
             return redirect(url_for('finanzas.calcular_cargos_mensuales', 
                                   departamento_id=departamento_id))
         
@@ -239,7 +261,8 @@ def pagar_cargo_pendiente(departamento_id, tipo_cargo, objeto_id):
             'objeto': cargo,
             'departamento': departamento_id,
             'tipo_cargo': tipo_cargo,
-            'objeto_id': objeto_id
+            'objeto_id': objeto_id,
+            'clave_idempotencia': uuid.uuid4().hex
         }
         
         return render_template('finanzas/pagar_pendiente.html', **context)
@@ -251,7 +274,7 @@ def pagar_cargo_pendiente(departamento_id, tipo_cargo, objeto_id):
             return redirect(url_for('finanzas.calcular_cargos_mensuales', 
                                   departamento_id=departamento_id))
         
-        if pago.pagado:
+        if pago.pagado and request.method == 'GET':
             flash('Esta reserva ya fue pagada.', 'info')
             return redirect(url_for('finanzas.calcular_cargos_mensuales', 
                                   departamento_id=departamento_id))
@@ -262,18 +285,22 @@ def pagar_cargo_pendiente(departamento_id, tipo_cargo, objeto_id):
             metodo_pago = request.form.get('metodo_pago', 'efectivo')
             referencia = request.form.get('referencia', '')
             
-            pago.marcar_pagado(metodo_pago=metodo_pago, referencia=referencia)
+            try:
+                resultado = pagar_item(
+                    'reserva', objeto_id, metodo_pago, referencia,
+                    observaciones=f'Pago de reserva - {reserva.area.nombre if reserva else "Área desconocida"}'
+                )
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('finanzas.calcular_cargos_mensuales', 
+                                      departamento_id=departamento_id))
             
-            HistorialPago.registrar_pago(
-                tipo_pago='reserva',
-                objeto_id=pago.reserva_id,
-                departamento=departamento_id,
-                monto=pago.monto,
-                metodo_pago=metodo_pago,
-                observaciones=f'Pago de reserva - {reserva.area.nombre if reserva else "Área desconocida"}. Ref: {referencia}'
-            )
+            if resultado['estado'] != 'pagado':
+                flash('Esta reserva ya fue pagada.', 'info')
+                return redirect(url_for('finanzas.calcular_cargos_mensuales', 
+                                      departamento_id=departamento_id))
             
-            flash(f'Pago de reserva registrado exitosamente. Monto: Bs. {pago.monto:.2f}', 'success')
+            flash(f'Pago de reserva registrado exitosamente. Monto: Bs. {resultado["monto"]:.2f}', 'success')
             return redirect(url_for('finanzas.calcular_cargos_mensuales', 
                                   departamento_id=departamento_id))
         
@@ -291,7 +318,8 @@ def pagar_cargo_pendiente(departamento_id, tipo_cargo, objeto_id):
             'reserva': reserva,
             'departamento': departamento_id,
             'tipo_cargo': tipo_cargo,
-            'objeto_id': objeto_id
+            'objeto_id': objeto_id,
+            'clave_idempotencia': uuid.uuid4().hex
         }
         
         return render_template('finanzas/pagar_pendiente.html', **context)
@@ -350,21 +378,35 @@ def gestionar_gastos():
     if categoria_filtro:
         gastos = [g for g in gastos if g.categoria == categoria_filtro]
     
-    # Calcular totales por categoría
-    totales_categoria = {}
-    for gasto in gastos:
-        cat = gasto.categoria
-        totales_categoria[cat] = totales_categoria.get(cat, 0) + float(gasto.monto)
+    # Totales por categoría desde el cubo de gastos (consulta agrupada en caché)
+    if mes_filtro and anio_filtro:
+        totales_categoria = GastoEdificio.get_total_por_categoria(mes_filtro, anio_filtro)
+    else:
+        totales_categoria = GastoEdificio.get_total_por_categoria()
+    if categoria_filtro:
+        totales_categoria = {cat: total for cat, total in totales_categoria.items()
+                             if cat == categoria_filtro}
+    
+    total_general = sum(totales_categoria.values())
     
-    total_general = sum(float(g.monto) for g in gastos)
+    # Enlace de exportación con los mismos filtros
+    filtros_exportacion = {'tabla': 'gastos'}
+    if mes_filtro and anio_filtro:
+        ultimo_dia = calendar.monthrange(anio_filtro, mes_filtro)[1]
+        filtros_exportacion['desde'] = date(anio_filtro, mes_filtro, 1).isoformat()
+        filtros_exportacion['hasta'] = date(anio_filtro, mes_filtro, ultimo_dia).isoformat()
+    if categoria_filtro:
+        filtros_exportacion['categoria'] = categoria_filtro
     
     context = {
         'gastos': gastos,
         'totales_categoria': totales_categoria,
         'total_general': total_general,
+        'url_exportar': url_for('finanzas.exportar_csv', **filtros_exportacion),
         'mes_filtro': mes_filtro,
         'anio_filtro': anio_filtro,
         'categoria_filtro': categoria_filtro,
+        'hoy': date.today(),
     }
     
     return render_template('finanzas/gastos.html', **context)
@@ -385,110 +427,260 @@ def eliminar_gasto(gasto_id):
 
 
 # ============================================================================
-# REPORTES Y EXPORTACIÓN
+# CONCILIACIÓN BANCARIA
 # ============================================================================
 
-@finanzas_bp.route('/reporte_mensual/<int:mes>/<int:anio>/')
+@finanzas_bp.route('/conciliacion/', methods=['GET', 'POST'])
 @role_required('admin')
-def reporte_mensual(mes, anio):
+def conciliacion_bancaria():
     """
-    Generar reporte mensual en PDF
+    Conciliar un extracto bancario (CSV) con los cargos y reservas pendientes
+    Todas las coincidencias se registran en una sola transacción
     """
-    # Obtener datos del mes
-    ingresos_cargos = CargoMensual.get_total_recaudado_mes(mes, anio)
-    ingresos_reservas = PagoReserva.get_total_recaudado_reservas(mes, anio)
-    gastos = GastoEdificio.get_by_mes(mes, anio)
-    total_gastos = sum(float(g.monto) for g in gastos)
-    
-    # Crear PDF
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
+    context = {'resultado': None}
     
-    # Título
-    mes_nombre = datetime(anio, mes, 1).strftime('%B %Y')
-    title = Paragraph(f"REPORTE FINANCIERO<br/>{mes_nombre.upper()}", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Tabla de resumen
-    data_resumen = [
-        ['CONCEPTO', 'MONTO (Bs.)'],
-        ['Ingresos por Cargos Mensuales', f'{ingresos_cargos:,.2f}'],
-        ['Ingresos por Reservas', f'{ingresos_reservas:,.2f}'],
-        ['TOTAL INGRESOS', f'{ingresos_cargos + ingresos_reservas:,.2f}'],
-        ['', ''],
-        ['TOTAL GASTOS', f'{total_gastos:,.2f}'],
-        ['', ''],
-        ['BALANCE', f'{(ingresos_cargos + ingresos_reservas) - total_gastos:,.2f}'],
-    ]
-    
-    table_resumen = Table(data_resumen, colWidths=[4*inch, 2*inch])
-    table_resumen.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 2), (-1, 2), colors.lightblue),
-        ('BACKGROUND', (0, 4), (-1, 4), colors.lightcoral),
-        ('BACKGROUND', (0, 6), (-1, 6), colors.lightgreen),
-        ('FONTNAME', (0, 2), (-1, 2), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 4), (-1, 4), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 6), (-1, 6), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table_resumen)
-    elements.append(PageBreak())
-    
-    # Detalle de gastos
-    if gastos:
-        elements.append(Paragraph("DETALLE DE GASTOS", styles['Heading2']))
-        elements.append(Spacer(1, 0.2*inch))
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash('Seleccione el archivo CSV del extracto.', 'warning')
+            return redirect(url_for('finanzas.conciliacion_bancaria'))
         
-        data_gastos = [['Fecha', 'Concepto', 'Categoría', 'Monto (Bs.)']]
-        for gasto in gastos:
-            data_gastos.append([
-                gasto.fecha_gasto.strftime('%d/%m/%Y'),
-                gasto.concepto[:40],
-                gasto.categoria,
-                f'{float(gasto.monto):,.2f}'
-            ])
+        aplicar = request.form.get('solo_verificar') != '1'
         
-        table_gastos = Table(data_gastos, colWidths=[1*inch, 3*inch, 1.5*inch, 1.5*inch])
-        table_gastos.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        try:
+            contenido = archivo.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            contenido = None
+        if contenido is None:
+            flash('El archivo debe estar codificado en UTF-8.', 'danger')
+            return redirect(url_for('finanzas.conciliacion_bancaria'))
         
-        elements.append(table_gastos)
+        try:
+            lineas, errores = ConciliacionBancaria.leer_csv(io.StringIO(contenido))
+            conciliadas, no_conciliadas = ConciliacionBancaria.conciliar(
+                lineas, aplicar=aplicar,
+                metodo_pago=request.form.get('metodo_pago', 'transferencia')
+            )
+        except ValueError as e:
+            flash(f'No se pudo conciliar el extracto: {e}', 'danger')
+            return redirect(url_for('finanzas.conciliacion_bancaria'))
+        
+        no_conciliadas = sorted(errores + no_conciliadas, key=lambda l: l['linea'])
+        total_conciliado = sum(float(c['monto']) for c in conciliadas)
+        
+        if aplicar and conciliadas:
+            flash(f'{len(conciliadas)} pagos registrados por Bs. {total_conciliado:,.2f}.', 'success')
+        elif aplicar:
+            flash('No se encontraron coincidencias en el extracto.', 'warning')
+        
+        context['resultado'] = {
+            'archivo': archivo.filename,
+            'aplicado': aplicar,
+            'total_lineas': len(conciliadas) + len(no_conciliadas),
+            'conciliadas': conciliadas,
+            'no_conciliadas': no_conciliadas,
+            'total_conciliado': total_conciliado,
+        }
     
-    doc.build(elements)
-    buffer.seek(0)
+    return render_template('finanzas/conciliacion.html', **context)
+
+
+@finanzas_bp.route('/lecturas/', methods=['GET', 'POST'])
+@role_required('admin')
+def importar_lecturas():
+    """
+    Importar lecturas de medidores (CSV) y calcular luz, agua y gas del mes
+    Todos los cargos del mes se crean o actualizan en una sola transacción
+    """
+    hoy = date.today()
+    context = {
+        'resultado': None,
+        'mes': request.form.get('mes', hoy.month, type=int),
+        'anio': request.form.get('anio', hoy.year, type=int),
+        'tarifas': LecturasMedidores.TARIFAS_CONSUMO,
+    }
+    
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash('Seleccione el archivo CSV de lecturas.', 'warning')
+            return redirect(url_for('finanzas.importar_lecturas'))
+        
+        mes, anio = context['mes'], context['anio']
+        if not 1 <= mes <= 12:
+            flash('Mes no válido.', 'danger')
+            return redirect(url_for('finanzas.importar_lecturas'))
+        
+        tarifas = {
+            servicio: request.form.get(f'tarifa_{servicio}', type=float)
+            for servicio in LecturasMedidores.SERVICIOS
+        }
+        if any(t is not None and t < 0 for t in tarifas.values()):
+            flash('Las tarifas no pueden ser negativas.', 'danger')
+            return redirect(url_for('finanzas.importar_lecturas'))
+        
+        aplicar = request.form.get('solo_verificar') != '1'
+        
+        try:
+            contenido = archivo.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            contenido = None
+        if contenido is None:
+            flash('El archivo debe estar codificado en UTF-8.', 'danger')
+            return redirect(url_for('finanzas.importar_lecturas'))
+        
+        try:
+            datos, errores = LecturasMedidores.leer_csv(io.StringIO(contenido))
+            resultado = LecturasMedidores.importar(datos, mes, anio, tarifas, aplicar=aplicar)
+        except ValueError as e:
+            flash(f'No se pudieron importar las lecturas: {e}', 'danger')
+            return redirect(url_for('finanzas.importar_lecturas'))
+        
+        resultado['errores'] = sorted(errores + resultado['errores'], key=lambda e: e['linea'])
+        resultado['archivo'] = archivo.filename
+        resultado['aplicado'] = aplicar
+        resultado['total_lineas'] = len(resultado['filas']) + len(resultado['errores'])
+        
+        if aplicar and resultado['filas']:
+            flash(f"Cargos de {mes:02d}/{anio}: {resultado['creados']} creados y "
+                  f"{resultado['actualizados']} actualizados.", 'success')
+        elif aplicar:
+            flash('No hay lecturas válidas para importar.', 'warning')
+        
+        context['resultado'] = resultado
+        context['tarifas'] = {k: v if v is not None else LecturasMedidores.TARIFAS_CONSUMO[k]
+                              for k, v in tarifas.items()}
+    
+    return render_template('finanzas/lecturas.html', **context)
+
+
+# ============================================================================
+# REPORTES Y EXPORTACIÓN
+# ============================================================================
+
+@finanzas_bp.route('/reporte_mensual/<int:mes>/<int:anio>/')
+@role_required('admin')
+def reporte_mensual(mes, anio):
+    """
+    Generar reporte mensual en PDF
+    El PDF se cachea en disco por versión de datos y se sirve con ETag.
+    Si todavía se está generando responde 202 con una página que lo descarga
+    al terminar (avisos de Socket.IO y consulta del estado del trabajo).
+    """
+    if not 1 <= mes <= 12:
+        flash('Mes no válido.', 'danger')
+        return redirect(url_for('finanzas.resumen_financiero'))
+    
+    # La generación corre en la cola de reportes, fuera del hilo de la petición
+    trabajo = encolar_reporte_financiero(mes, anio, current_user.id)
+    if trabajo.estado == 'error':
+        flash('No se pudo generar el reporte. Intente nuevamente.', 'danger')
+        return redirect(url_for('finanzas.resumen_financiero'))
+    if trabajo.estado != 'completado':
+        return render_template('reportes/en_preparacion.html', trabajo=trabajo,
+                               volver=url_for('finanzas.resumen_financiero')), 202
+    
+    version = trabajo.parametros['version']
+    cerrado = CierreMes.get_by_mes(mes, anio) is not None
     
     return send_file(
-        buffer,
+        trabajo.ruta,
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'reporte_financiero_{mes}_{anio}.pdf'
+        download_name=f'reporte_financiero_{mes}_{anio}.pdf',
+        etag=version,
+        conditional=True,
+        max_age=31536000 if cerrado else 0
+    )
+
+
+@finanzas_bp.route('/cierre_mes/<int:mes>/<int:anio>/', methods=['POST'])
+@role_required('admin')
+def cierre_mes(mes, anio):
+    """
+    Cerrar o reabrir un mes
+    Al cerrar, el reporte del mes queda fijo con la versión actual de los datos;
+    el PDF se genera en la cola de reportes
+    """
+    accion = request.form.get('accion', 'cerrar')
+    cierre = CierreMes.get_by_mes(mes, anio)
+    
+    if accion == 'reabrir':
+        if cierre:
+            cierre.delete()
+            flash(f'Mes {mes:02d}/{anio} reabierto.', 'success')
+        else:
+            flash('El mes no está cerrado.', 'info')
+    elif cierre:
+        flash('El mes ya está cerrado.', 'info')
+    elif not 1 <= mes <= 12:
+        flash('Mes no válido.', 'danger')
+    else:
+        trabajo = encolar_reporte_financiero(mes, anio, current_user.id)
+        CierreMes(
+            mes=mes,
+            anio=anio,
+            version_reporte=trabajo.parametros['version'],
+            cerrado_por=current_user.get_full_name()
+        ).save()
+        if trabajo.estado == 'completado':
+            flash(f'Mes {mes:02d}/{anio} cerrado. Su reporte queda fijo.', 'success')
+        else:
+            flash(f'Mes {mes:02d}/{anio} cerrado. Su reporte queda fijo y se está generando.', 'success')
+    
+    return redirect(url_for('finanzas.resumen_financiero'))
+
+
+@finanzas_bp.route('/exportar/<string:tabla>/')
+@role_required('admin')
+def exportar_csv(tabla):
+    """
+    Exportar historial de pagos, cargos o gastos en CSV.
+    La respuesta se genera por lotes: la memoria no depende del tamaño de la exportación.
+    Filtros: desde, hasta (YYYY-MM-DD), departamento, categoria
+    """
+    try:
+        desde = request.args.get('desde')
+        hasta = request.args.get('hasta')
+        desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else None
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else None
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido'}), 400
+    
+    exportacion = consulta_exportacion(
+        tabla,
+        desde=desde,
+        hasta=hasta,
+        departamento=request.args.get('departamento', type=int),
+        categoria=request.args.get('categoria') or None
+    )
+    if exportacion is None:
+        return jsonify({'error': 'Tabla no válida'}), 404
+    
+    encabezados, query, columna_id = exportacion
+    
+    def generar():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        # BOM para que Excel reconozca UTF-8
+        buffer.write('\ufeff')
+        writer.writerow(encabezados)
+        
+        for lote in iterar_por_lotes(query, columna_id):
+            writer.writerows(lote)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        
+        if buffer.tell():
+            yield buffer.getvalue()
+    
+    nombre = f'{tabla}_{date.today().strftime("%Y%m%d")}.csv'
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={nombre}'}
     )
 
 
@@ -502,19 +694,25 @@ def api_resumen_mes(mes, anio):
     """
     API para obtener resumen financiero de un mes específico
     """
-    ingresos_cargos = CargoMensual.get_total_recaudado_mes(mes, anio)
-    ingresos_reservas = PagoReserva.get_total_recaudado_reservas(mes, anio)
-    gastos = GastoEdificio.get_total_mes(mes, anio)
+    def calcular():
+        totales = ResumenMensual.get_totales(mes, anio)
+        ingresos_cargos = totales['cargos']
+        ingresos_reservas = totales['reservas']
+        gastos = totales['gastos']
+        return {
+            'ingresos_cargos': ingresos_cargos,
+            'ingresos_reservas': ingresos_reservas,
+            'total_ingresos': ingresos_cargos + ingresos_reservas,
+            'gastos': gastos,
+            'balance': (ingresos_cargos + ingresos_reservas) - gastos,
+            'mes': mes,
+            'anio': anio
+        }
     
-    return jsonify({
-        'ingresos_cargos': ingresos_cargos,
-        'ingresos_reservas': ingresos_reservas,
-        'total_ingresos': ingresos_cargos + ingresos_reservas,
-        'gastos': gastos,
-        'balance': (ingresos_cargos + ingresos_reservas) - gastos,
-        'mes': mes,
-        'anio': anio
-    })
+    return jsonify(cache_finanzas.obtener_o_calcular(
+        ('resumen_mes', mes, anio), calcular,
+        etiquetas=[etiqueta_mes(mes, anio)], ttl=ttl_cache()
+    ))
 
 
 @finanzas_bp.route('/api/estadisticas/')
@@ -525,11 +723,185 @@ def api_estadisticas():
     """
     hoy = date.today()
     
+    def calcular():
+        totales = ResumenMensual.get_totales(hoy.month, hoy.year)
+        return {
+            'total_pendiente': float(CargoMensual.get_total_pendiente()),
+            'total_departamentos': CargoMensual.get_total_departamentos(),
+            'ingresos_mes_actual': totales['cargos'],
+            'gastos_mes_actual': totales['gastos'],
+        }
+    
+    return jsonify(cache_finanzas.obtener_o_calcular(
+        ('estadisticas', hoy.month, hoy.year), calcular,
+        etiquetas=[etiqueta_mes(hoy.month, hoy.year), 'cargos_mensuales'],
+        ttl=ttl_cache()
+    ))
+
+
+@finanzas_bp.route('/api/series')
+@role_required('admin')
+def api_series():
+    """
+    API de series mensuales (ingresos, gastos, balance y morosidad) de un rango de años
+    Parámetros opcionales: desde y hasta (años), ventana (promedio móvil, en meses)
+    y proyeccion (meses a proyectar con la tendencia lineal)
+    """
+    hoy = date.today()
+    anio_desde = request.args.get('desde', hoy.year - 1, type=int)
+    anio_hasta = request.args.get('hasta', hoy.year, type=int)
+    ventana = request.args.get('ventana', 3, type=int)
+    meses_proyeccion = request.args.get('proyeccion', 3, type=int)
+    
+    if anio_desde > anio_hasta or anio_hasta - anio_desde >= MAX_ANIOS_SERIE:
+        return jsonify({'success': False,
+                        'message': f'Rango de años no válido (máximo {MAX_ANIOS_SERIE})'}), 400
+    if not 1 <= ventana <= 24 or not 0 <= meses_proyeccion <= MAX_MESES_PROYECCION:
+        return jsonify({'success': False, 'message': 'Ventana o proyección fuera de rango'}), 400
+    
+    series = SeriesFinancieras.calcular(anio_desde, anio_hasta, ventana, meses_proyeccion, hoy)
+    return jsonify({'success': True, **series})
+
+
+def parametros_analitica_gastos():
+    """Año y mes de corte de las APIs de gastos (por defecto, el año actual a la fecha)"""
+    hoy = date.today()
+    anio = request.args.get('anio', hoy.year, type=int)
+    hasta_mes = request.args.get('hasta_mes', hoy.month if anio == hoy.year else 12, type=int)
+    return anio, hasta_mes
+
+
+@finanzas_bp.route('/api/gastos/cubo/')
+@role_required('admin')
+def api_gastos_cubo():
+    """
+    API de drill-down de gastos: sin parámetros retorna los totales por año,
+    con anio los totales por mes y con anio y mes los totales por categoría.
+    El parámetro opcional categoria filtra cualquier nivel.
+    """
+    anio = request.args.get('anio', type=int)
+    mes = request.args.get('mes', type=int)
+    categoria = request.args.get('categoria') or None
+    
+    if mes is not None and (anio is None or not 1 <= mes <= 12):
+        return jsonify({'success': False, 'message': 'Mes no válido (requiere anio)'}), 400
+    
+    cubo = CuboGastos.obtener()
+    return jsonify({
+        'success': True,
+        'categorias': cubo.categorias,
+        'anios': cubo.anios,
+        **cubo.detalle(anio, mes, categoria),
+    })
+
+
+@finanzas_bp.route('/api/gastos/interanual/')
+@role_required('admin')
+def api_gastos_interanual():
+    """
+    API de variación interanual de gastos por categoría y mes
+    Parámetros opcionales: anio y hasta_mes (último mes comparado)
+    """
+    anio, hasta_mes = parametros_analitica_gastos()
+    if not 1 <= hasta_mes <= 12:
+        return jsonify({'success': False, 'message': 'Mes de corte no válido'}), 400
+    
+    return jsonify({'success': True, **CuboGastos.obtener().interanual(anio, hasta_mes)})
+
+
+@finanzas_bp.route('/api/gastos/presupuesto/', methods=['GET', 'POST'])
+@role_required('admin')
+def api_gastos_presupuesto():
+    """
+    GET: presupuesto contra ejecutado por categoría (anio, hasta_mes)
+    POST: define el presupuesto anual {"categoria", "anio", "monto"}
+    """
+    if request.method == 'POST':
+        datos = request.get_json(silent=True) or {}
+        try:
+            categoria = str(datos['categoria']).strip()
+            anio = int(datos['anio'])
+            monto = Decimal(str(datos['monto']))
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            return jsonify({'success': False, 'message': 'Datos de presupuesto no válidos'}), 400
+        if not categoria or not monto.is_finite() or monto < 0:
+            return jsonify({'success': False, 'message': 'Datos de presupuesto no válidos'}), 400
+        
+        PresupuestoGasto.definir(categoria, anio, monto)
+        return jsonify({'success': True, 'categoria': categoria, 'anio': anio,
+                        'monto': float(monto)})
+    
+    anio, hasta_mes = parametros_analitica_gastos()
+    if not 1 <= hasta_mes <= 12:
+        return jsonify({'success': False, 'message': 'Mes de corte no válido'}), 400
+    
     return jsonify({
-        'total_pendiente': sum(c.total for c in CargoMensual.get_all_pendientes()),
-        'total_departamentos': len(set([c.departamento for c in CargoMensual.get_all()])),
-        'ingresos_mes_actual': CargoMensual.get_total_recaudado_mes(hoy.month, hoy.year),
-        'gastos_mes_actual': GastoEdificio.get_total_mes(hoy.month, hoy.year),
+        'success': True,
+        **CuboGastos.obtener().presupuesto(anio, PresupuestoGasto.get_por_anio(anio), hasta_mes),
+    })
+
+
+@finanzas_bp.route('/api/cache/')
+@role_required('admin')
+def api_cache():
+    """
+    API con los contadores de la caché de estadísticas (aciertos, fallos, invalidaciones)
+    """
+    return jsonify({'success': True, **cache_finanzas.estadisticas()})
+
+
+@finanzas_bp.route('/api/historial/<int:departamento_id>/')
+@login_required
+def api_historial_departamento(departamento_id):
+    """
+    API del historial de pagos de un departamento, paginada por cursor
+    Parámetros opcionales: cursor (de la respuesta anterior) y limite (máx. 100)
+    """
+    if not current_user.has_role('admin') and current_user.departamento != departamento_id:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    
+    limite = min(max(request.args.get('limite', TAMANO_PAGINA_HISTORIAL, type=int), 1), 100)
+    cursor = request.args.get('cursor')
+    
+    try:
+        pagos, siguiente_cursor = HistorialPago.get_pagina_departamento(
+            departamento_id, limite, cursor
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Cursor no válido'}), 400
+    
+    respuesta = {
+        'success': True,
+        'pagos': [pago.to_dict() for pago in pagos],
+        'siguiente_cursor': siguiente_cursor,
+    }
+    if not cursor:
+        respuesta['total_pagado'] = HistorialPago.get_total_pagado(departamento_id)
+    
+    return jsonify(respuesta)
+
+
+@finanzas_bp.route('/api/antiguedad_deuda/')
+@role_required('admin')
+def api_antiguedad_deuda():
+    """
+    API de antigüedad de la deuda por departamento (tramos 0-30, 31-60, 61-90, 90+)
+    Parámetros opcionales: fecha (YYYY-MM-DD, corte) y departamento
+    """
+    fecha_corte = None
+    if request.args.get('fecha'):
+        try:
+            fecha_corte = datetime.strptime(request.args['fecha'], '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Fecha no válida, use YYYY-MM-DD'}), 400
+    
+    departamento = request.args.get('departamento', type=int)
+    antiguedad = AntiguedadDeuda.calcular(fecha_corte, departamento)
+    
+    return jsonify({
+        'success': True,
+        **antiguedad,
+        'fecha_corte': antiguedad['fecha_corte'].isoformat(),
     })
 
 
@@ -543,35 +915,98 @@ def pagar_pendiente(tipo_pago, pk):
     """
     Marcar un pago como realizado (ruta rápida para admin desde el resumen)
     """
+    if tipo_pago not in PagosLote.TIPOS:
+        flash('Tipo de pago no válido.', 'danger')
+        return redirect(url_for('finanzas.resumen_financiero'))
+    
+    try:
+        resultado = pagar_item(tipo_pago, pk, observaciones='Pago procesado por admin')
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('finanzas.resumen_financiero'))
+    
     if tipo_pago == 'cargo':
-        cargo = CargoMensual.get_by_id(pk)
-        if cargo and not cargo.pagado:
-            cargo.marcar_pagado()
-            HistorialPago.registrar_pago(
-                tipo_pago='cargo_mensual',
-                objeto_id=pk,
-                departamento=cargo.departamento,
-                monto=cargo.total,
-                observaciones=f'Pago procesado por admin'
-            )
+        if resultado['estado'] == 'pagado':
             flash('Cargo marcado como pagado.', 'success')
         else:
             flash('Cargo no encontrado o ya pagado.', 'warning')
-    
-    elif tipo_pago == 'reserva':
-        pago = PagoReserva.get_by_id(pk)
-        if pago and not pago.pagado:
-            reserva = Reserva.get_by_id(pago.reserva_id)
-            pago.marcar_pagado()
-            HistorialPago.registrar_pago(
-                tipo_pago='reserva',
-                objeto_id=pago.reserva_id,
-                departamento=reserva.departamento if reserva else 0,
-                monto=pago.monto,
-                observaciones=f'Pago procesado por admin'
-            )
+    else:
+        if resultado['estado'] == 'pagado':
             flash('Pago de reserva marcado como pagado.', 'success')
         else:
             flash('Pago no encontrado o ya realizado.', 'warning')
     
+    return redirect(url_for('finanzas.resumen_financiero'))
+
+
+@finanzas_bp.route('/pagos/lote/', methods=['POST'])
+@role_required('admin')
+def pagar_lote():
+    """
+    Registrar varios pagos (cargos y reservas) en una sola transacción
+    JSON: {"items": [{"tipo": "cargo"|"reserva", "id": 1}, ...], "metodo_pago", "referencia"}
+    Formulario: items = "cargo:<id>" / "reserva:<id>" (selección múltiple del resumen)
+    Retorna el resultado de cada ítem: pagado, ya_pagado o no_encontrado
+    Con Idempotency-Key (o clave_idempotencia) un reintento recibe el resultado original
+    """
+    es_json = request.is_json
+    datos = (request.get_json(silent=True) or {}) if es_json else request.form
+    if not hasattr(datos, 'get'):
+        datos = {}
+    
+    try:
+        if es_json:
+            items = [(item['tipo'], int(item['id'])) for item in datos.get('items') or []]
+        else:
+            items = [(tipo, int(item_id)) for tipo, item_id in
+                     (valor.split(':', 1) for valor in request.form.getlist('items'))]
+    except (KeyError, TypeError, ValueError):
+        items = None
+    
+    error = None
+    if items is None:
+        error = 'Formato de ítems no válido'
+    elif not items:
+        error = 'No se seleccionó ningún pago'
+    elif len(items) > MAX_ITEMS_LOTE:
+        error = f'Máximo {MAX_ITEMS_LOTE} pagos por lote'
+    
+    resultados = None
+    if not error:
+        try:
+            resultados = PagosLote.pagar(
+                items,
+                metodo_pago=datos.get('metodo_pago') or 'efectivo',
+                referencia=datos.get('referencia'),
+                observaciones='Pago en lote procesado por admin',
+                clave=clave_idempotencia(datos),
+                usuario_id=current_user.id
+            )
+        except ValueError as e:
+            error = str(e)
+    
+    if error:
+        if es_json:
+            return jsonify({'success': False, 'message': error}), 400
+        flash(error, 'warning')
+        return redirect(url_for('finanzas.resumen_financiero'))
+    
+    pagados = [r for r in resultados if r['estado'] == 'pagado']
+    total = sum((r['monto'] for r in pagados), Decimal('0.00'))
+    
+    if es_json:
+        return jsonify({
+            'success': True,
+            'repetido': any(r.get('repetido') for r in resultados),
+            'pagados': len(pagados),
+            'total_pagado': float(total),
+            'resultados': [{**r, 'monto': float(r['monto']) if r['monto'] is not None else None}
+                           for r in resultados],
+        })
+    
+    if pagados:
+        flash(f'{len(pagados)} pagos registrados por Bs. {total:,.2f}.', 'success')
+    omitidos = len(resultados) - len(pagados)
+    if omitidos:
+        flash(f'{omitidos} ítems omitidos (ya pagados o inexistentes).', 'warning')
     return redirect(url_for('finanzas.resumen_financiero'))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, redirect, url_for, flash, Response, current_app
+from flask import Blueprint, request, redirect, url_for, flash, send_file, current_app
 from models.mantenimiento_model import Mantenimiento
 from views import mantenimiento_view
 from datetime import datetime
@@ -8,12 +8,7 @@ import os
 from utils.decorators import role_required
 from flask_login import login_required, current_user 
 
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-from io import BytesIO
+from controllers.reportes_controller import encolar_reporte_mantenimiento
 
 mantenimiento_bp = Blueprint("mantenimiento", __name__)
 
@@ -188,51 +183,18 @@ def download_report(id):
         flash("Ticket no encontrado.", "error")
         return redirect(url_for("mantenimiento.list_mantenimiento"))
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-
-    styles = getSampleStyleSheet()
-    title_style = styles['Heading1']
-    # Configurar el estilo del título
-    title_style.alignment = 1 # Centro
-
-    # Título
-    elements.append(Paragraph("REPORTE DE MANTENIMIENTO", title_style))
-    elements.append(Spacer(1, 0.3*inch))
-
-    # Crear tabla con la información
-    data = [
-        ['ID Ticket:', str(ticket.id_mantenimiento)],
-        ['Descripción:', ticket.descripcion or 'N/A'],
-        ['Prioridad:', ticket.prioridad or 'N/A'],
-        ['Responsable:', ticket.responsable or 'N/A'],
-        ['Fecha Inicio:', str(ticket.fecha_ini) if ticket.fecha_ini else 'N/A'],
-        ['Fecha Fin:', str(ticket.fecha_fin) if ticket.fecha_fin else 'N/A'],
-        ['Costo:', f'${ticket.costo}' if ticket.costo else 'N/A'],
-        ['Trabajo Realizado:', 'Sí' if ticket.trabajo_realizado else 'No'],
-        ['Evidencia:', 'Disponible' if ticket.evidencia_url else 'No disponible'],
-    ]
-
-    table = Table(data, colWidths=[2*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-
-    elements.append(table)
-
-    doc.build(elements)
-    buffer.seek(0)
-
-    return Response(
-        buffer, 
-        mimetype='application/pdf', 
-        headers={"Content-Disposition": f"attachment;filename=ticket_{ticket.id_mantenimiento}.pdf"}
+    # El PDF se genera en la cola de reportes, fuera del hilo de la petición;
+    # si no está listo, la página de espera lo descarga al terminar
+    trabajo = encolar_reporte_mantenimiento(ticket, current_user.id)
+    if trabajo.estado == 'error':
+        flash("No se pudo generar el reporte.", "error")
+        return redirect(url_for("mantenimiento.list_mantenimiento"))
+    if trabajo.estado != 'completado':
+        return mantenimiento_view.reporte_en_preparacion(trabajo, ticket), 202
+
+    return send_file(
+        trabajo.ruta,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=trabajo.nombre_descarga
     )
\ No newline at end of file
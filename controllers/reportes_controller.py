@@ -0,0 +1,147 @@
+# app/controllers/reportes_controller.py
+"""
+Controlador de reportes PDF asíncronos
+Encola la generación, consulta el estado y descarga el resultado
+"""
+
+import os
+from flask import Blueprint, jsonify, send_file, url_for, current_app, abort
+from flask_login import login_required, current_user
+from utils.decorators import role_required
+from models.mantenimiento_model import Mantenimiento
+from utils.reportes_utils import preparar_reporte_mensual, datos_reporte_mantenimiento
+from utils.trabajos_reportes import TrabajoReporte, cola_reportes
+
+reportes_bp = Blueprint('reportes', __name__, url_prefix='/reportes')
+
+
+def get_socketio():
+    """Obtener instancia de socketio desde el contexto de la app"""
+    return current_app.extensions.get('socketio')
+
+
+def directorio_reportes():
+    """Directorio de PDFs dentro de instance/"""
+    return os.path.join(current_app.instance_path, 'reportes')
+
+
+def directorio_trabajos():
+    """Directorio de PDFs temporales y estados de trabajos (compartido entre workers)"""
+    return os.path.join(directorio_reportes(), 'trabajos')
+
+
+# ============================================================================
+# CREACIÓN DE TRABAJOS
+# ============================================================================
+
+def _registrar(trabajo):
+    """Completa las URLs y el archivo de estado del trabajo y lo pone en la cola"""
+    trabajo.url_estado = url_for('reportes.estado_trabajo', trabajo_id=trabajo.id)
+    trabajo.url_descarga = url_for('reportes.descargar_trabajo', trabajo_id=trabajo.id)
+    trabajo.archivo_estado = os.path.join(directorio_trabajos(), f'{trabajo.id}.json')
+    return cola_reportes.encolar(trabajo, get_socketio())
+
+
+def encolar_reporte_financiero(mes, anio, usuario_id):
+    """
+    Encola el reporte financiero de un mes
+    Si el PDF de la versión actual ya existe, el trabajo queda completado
+    """
+    directorio = directorio_reportes()
+    ruta, version, datos = preparar_reporte_mensual(directorio, mes, anio)
+
+    activo = cola_reportes.buscar_activo(ruta)
+    if activo:
+        return activo
+
+    trabajo = TrabajoReporte(
+        tipo='financiero',
+        usuario_id=usuario_id,
+        parametros={'directorio': directorio, 'version': version, 'datos': datos},
+        ruta=ruta,
+        nombre_descarga=f'reporte_financiero_{mes}_{anio}.pdf'
+    )
+    if datos is None:
+        trabajo.marcar_completado()
+    return _registrar(trabajo)
+
+
+def encolar_reporte_mantenimiento(ticket, usuario_id):
+    """Encola el reporte PDF de un ticket de mantenimiento"""
+    directorio = directorio_trabajos()
+    trabajo = TrabajoReporte(
+        tipo='mantenimiento',
+        usuario_id=usuario_id,
+        parametros={'filas': datos_reporte_mantenimiento(ticket)},
+        ruta=None,
+        nombre_descarga=f'ticket_{ticket.id_mantenimiento}.pdf',
+        temporal=True
+    )
+    trabajo.ruta = os.path.join(directorio, f'ticket_{ticket.id_mantenimiento}_{trabajo.id}.pdf')
+    trabajo.parametros['ruta'] = trabajo.ruta
+    return _registrar(trabajo)
+
+
+def _obtener_trabajo_usuario(trabajo_id):
+    """
+    Retorna el trabajo si pertenece al usuario actual (o es admin)
+    Los trabajos de otros workers se leen de su archivo de estado
+    """
+    trabajo = cola_reportes.obtener(trabajo_id, directorio_trabajos())
+    if not trabajo:
+        abort(404)
+    if trabajo.usuario_id != current_user.id and not current_user.has_role('admin'):
+        abort(403)
+    return trabajo
+
+
+# ============================================================================
+# RUTAS
+# ============================================================================
+
+@reportes_bp.route('/financiero/<int:mes>/<int:anio>/', methods=['POST'])
+@role_required('admin')
+def solicitar_reporte_financiero(mes, anio):
+    """Encola el reporte financiero mensual"""
+    if not 1 <= mes <= 12:
+        return jsonify({'success': False, 'message': 'Mes no válido'}), 400
+
+    trabajo = encolar_reporte_financiero(mes, anio, current_user.id)
+    return jsonify({'success': True, 'trabajo': trabajo.to_dict()}), 202
+
+
+@reportes_bp.route('/mantenimiento/<int:id>/', methods=['POST'])
+@login_required
+def solicitar_reporte_mantenimiento(id):
+    """Encola el reporte de un ticket de mantenimiento"""
+    ticket = Mantenimiento.get_by_id(id)
+    if not ticket:
+        return jsonify({'success': False, 'message': 'Ticket no encontrado'}), 404
+
+    trabajo = encolar_reporte_mantenimiento(ticket, current_user.id)
+    return jsonify({'success': True, 'trabajo': trabajo.to_dict()}), 202
+
+
+@reportes_bp.route('/trabajos/<string:trabajo_id>/')
+@login_required
+def estado_trabajo(trabajo_id):
+    """Estado de un trabajo: en_cola, en_proceso, completado o error"""
+    trabajo = _obtener_trabajo_usuario(trabajo_id)
+    return jsonify({'success': True, 'trabajo': trabajo.to_dict()})
+
+
+@reportes_bp.route('/trabajos/<string:trabajo_id>/descargar/')
+@login_required
+def descargar_trabajo(trabajo_id):
+    """Descarga el PDF de un trabajo completado"""
+    trabajo = _obtener_trabajo_usuario(trabajo_id)
+    if trabajo.estado != 'completado' or not os.path.exists(trabajo.ruta):
+        return jsonify({'success': False, 'message': 'El reporte no está disponible',
+                        'trabajo': trabajo.to_dict()}), 409
+
+    return send_file(
+        trabajo.ruta,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=trabajo.nombre_descarga
+    )
@@ -11,13 +11,17 @@ Nuevas rutas:
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from utils.decorators import role_required
-from models.reservas_model import AreaComun, Reserva, AreaRating
-from models.finanzas_model import PagoReserva
+from models.reservas_model import AreaComun, Reserva, AreaRating, IndiceOcupacion, GRANULARIDADES
+from models.finanzas_model import LibroDepartamento
 from datetime import datetime, date, time
+import calendar
 from utils.email_utils import enviar_email_confirmacion_reserva
 
 reservas_bp = Blueprint('reservas', __name__)
 
+# Días máximos de la API de ventanas libres
+MAX_DIAS_VENTANAS = 31
+
 
 # ============================================================================
 # RUTAS PRINCIPALES
@@ -30,6 +34,24 @@ def reservas():
     Vista principal de reservas para residentes (OPTIMIZADA PARA MÓVIL)
     """
     if request.method == 'POST':
+        # Reserva recurrente (semanal o quincenal)
+        if request.form.get('frecuencia'):
+            try:
+                creadas, conflictos = crear_serie(request.form)
+            except ValueError as e:
+                flash(f'❌ Error en los datos ingresados: {str(e)}', 'danger')
+                return redirect(url_for('reservas.reservas'))
+            
+            fechas = ', '.join(f.strftime('%d/%m/%Y') for f in conflictos)
+            if creadas:
+                total = sum(r.costo_total for r in creadas)
+                flash(f'✅ Serie creada: {len(creadas)} reservas. Costo total: Bs. {total:.2f}', 'success')
+                if conflictos:
+                    flash(f'⚠️ Fechas omitidas por estar ocupadas: {fechas}', 'warning')
+            else:
+                flash(f'⚠️ No se creó la serie, estas fechas ya están ocupadas: {fechas}', 'warning')
+            return redirect(url_for('reservas.reservas'))
+        
         area_id = int(request.form.get('area_id'))
         fecha_str = request.form.get('fecha')
         hora_inicio_str = request.form.get('hora_inicio')
@@ -80,14 +102,11 @@ def reservas():
                 telefono=current_user.telefono,
                 email=current_user.email
             )
-            reserva.save()
             
-            # Crear pago asociado
-            pago = PagoReserva(
-                reserva_id=reserva.id,
-                monto=reserva.costo_total
-            )
-            pago.save()
+            # Guardar reserva y pago en una sola transacción (evita dobles reservas)
+            if not reserva.registrar():
+                flash('⚠️ Otro residente acaba de reservar ese horario. Elige otro.', 'warning')
+                return redirect(url_for('reservas.reservas'))
             
             # Enviar email de confirmación
             try:
@@ -117,6 +136,51 @@ def reservas():
                          fecha_minima=date.today().isoformat())
 
 
+def crear_serie(datos):
+    """
+    Valida una reserva recurrente (formulario o JSON) del usuario actual y
+    la registra con Reserva.registrar_serie. Retorna (creadas, conflictos).
+    Lanza ValueError con el mensaje para el usuario si los datos no son válidos.
+    """
+    area = AreaComun.get_by_id(int(datos.get('area_id') or 0))
+    if not area:
+        raise ValueError('Área no encontrada')
+    
+    fecha = datetime.strptime(datos.get('fecha') or '', '%Y-%m-%d').date()
+    hora_inicio = datetime.strptime(datos.get('hora_inicio') or '', '%H:%M').time()
+    hora_fin = datetime.strptime(datos.get('hora_fin') or '', '%H:%M').time()
+    num_personas = int(datos.get('num_personas') or 1)
+    
+    if fecha < date.today():
+        raise ValueError('No puedes reservar fechas pasadas')
+    if hora_inicio >= hora_fin:
+        raise ValueError('La hora de inicio debe ser anterior a la hora de fin')
+    if num_personas > area.capacidad:
+        raise ValueError(f'El área tiene capacidad máxima de {area.capacidad} personas')
+    if not area.admite_horario(hora_inicio, hora_fin):
+        raise ValueError('El área no está disponible en ese horario')
+    
+    # Fin de la serie: una fecha límite o un número de reservas
+    if datos.get('hasta'):
+        limite = {'hasta': datetime.strptime(datos.get('hasta'), '%Y-%m-%d').date()}
+    else:
+        limite = {'ocurrencias': int(datos.get('ocurrencias') or 0)}
+    fechas = Reserva.fechas_serie(fecha, datos.get('frecuencia'), **limite)
+    
+    omitir = str(datos.get('omitir_conflictos', '')).lower() in ('1', 'true', 'on')
+    return Reserva.registrar_serie({
+        'area_id': area.id,
+        'departamento': current_user.departamento,
+        'usuario': current_user.get_full_name(),
+        'hora_inicio': hora_inicio,
+        'hora_fin': hora_fin,
+        'motivo': datos.get('motivo', ''),
+        'num_personas': num_personas,
+        'telefono': current_user.telefono,
+        'email': current_user.email,
+    }, fechas, omitir_conflictos=omitir)
+
+
 @reservas_bp.route('/reservas_admin/')
 @role_required('admin')
 def reservas_admin():
@@ -234,24 +298,27 @@ def editar_reserva(reserva_id):
                 nueva_hora_inicio = datetime.strptime(hora_inicio_str, '%H:%M').time()
                 nueva_hora_fin = datetime.strptime(hora_fin_str, '%H:%M').time()
                 
+                reserva.motivo = motivo
+                reserva.num_personas = num_personas
+                
                 # Verificar disponibilidad si cambió fecha u hora
                 if (nueva_fecha != reserva.fecha or 
                     nueva_hora_inicio != reserva.hora_inicio or 
                     nueva_hora_fin != reserva.hora_fin):
                     
                     area = AreaComun.get_by_id(reserva.area_id)
-                    if not area.esta_disponible_en(nueva_fecha, nueva_hora_inicio, nueva_hora_fin):
+                    if not area.esta_disponible_en(nueva_fecha, nueva_hora_inicio, nueva_hora_fin,
+                                                   excluir_id=reserva.id):
                         flash('❌ El área no está disponible en el nuevo horario.', 'danger')
                         return redirect(url_for('reservas.editar_reserva', reserva_id=reserva_id))
-                
-                # Actualizar
-                reserva.fecha = nueva_fecha
-                reserva.hora_inicio = nueva_hora_inicio
-                reserva.hora_fin = nueva_hora_fin
-                reserva.motivo = motivo
-                reserva.num_personas = num_personas
-                reserva.calcular_costo()
-                reserva.save()
+                    
+                    # Cambiar el horario dentro de la transacción de escritura
+                    if not reserva.reprogramar(nueva_fecha, nueva_hora_inicio, nueva_hora_fin):
+                        flash('⚠️ Otro residente acaba de reservar ese horario. Elige otro.', 'warning')
+                        return redirect(url_for('reservas.editar_reserva', reserva_id=reserva_id))
+                else:
+                    reserva.calcular_costo()
+                    reserva.save()
                 
                 flash('✅ Reserva actualizada exitosamente.', 'success')
             except ValueError as e:
@@ -438,6 +505,7 @@ def horarios_disponibles(area_id):
     API: Obtener horarios disponibles de un área en una fecha
     """
     fecha_str = request.args.get('fecha')
+    granularidad = request.args.get('granularidad', 60, type=int)
     
     if not fecha_str:
         return jsonify({'error': 'Fecha no proporcionada'}), 400
@@ -447,11 +515,111 @@ def horarios_disponibles(area_id):
     except ValueError:
         return jsonify({'error': 'Formato de fecha inválido'}), 400
     
-    horarios = Reserva.get_horarios_disponibles(area_id, fecha)
+    if granularidad not in GRANULARIDADES:
+        return jsonify({'error': 'Granularidad no válida (15, 30 o 60)'}), 400
+    
+    horarios = Reserva.get_horarios_disponibles(area_id, fecha, granularidad)
     
     return jsonify({'horarios': horarios})
 
 
+@reservas_bp.route('/api/ventanas_libres/<int:area_id>/')
+@login_required
+def ventanas_libres(area_id):
+    """
+    API: Ventanas libres de un área en un rango de días (por ejemplo, una semana)
+    Parámetros: desde y hasta (YYYY-MM-DD, hasta opcional) y granularidad (15, 30 o 60)
+    """
+    area = AreaComun.get_by_id(area_id)
+    if not area:
+        return jsonify({'error': 'Área no encontrada'}), 404
+    
+    granularidad = request.args.get('granularidad', 60, type=int)
+    try:
+        desde = datetime.strptime(request.args.get('desde', ''), '%Y-%m-%d').date()
+        hasta = datetime.strptime(request.args.get('hasta') or desde.isoformat(), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido'}), 400
+    
+    if not 0 <= (hasta - desde).days < MAX_DIAS_VENTANAS:
+        return jsonify({'error': f'Rango de fechas no válido (máximo {MAX_DIAS_VENTANAS} días)'}), 400
+    if granularidad not in GRANULARIDADES:
+        return jsonify({'error': 'Granularidad no válida (15, 30 o 60)'}), 400
+    
+    dias = Reserva.get_ventanas_libres(area, desde, hasta, granularidad)
+    
+    return jsonify({
+        'area_id': area.id,
+        'granularidad': granularidad,
+        'tiempo_minimo': area.tiempo_minimo,
+        'tiempo_maximo': area.tiempo_maximo,
+        'dias': [
+            {
+                'fecha': dia['fecha'].isoformat(),
+                'ventanas': [
+                    {
+                        'hora_inicio': ventana['inicio'].strftime('%H:%M'),
+                        'hora_fin': ventana['fin'].strftime('%H:%M'),
+                        'ultimo_inicio': ventana['ultimo_inicio'].strftime('%H:%M'),
+                        'duracion_maxima': ventana['duracion_maxima'],
+                    }
+                    for ventana in dia['ventanas']
+                ],
+            }
+            for dia in dias
+        ],
+    })
+
+
+@reservas_bp.route('/api/disponibilidad_mes/')
+@login_required
+def disponibilidad_mes():
+    """
+    API: Disponibilidad de todas las áreas en cada día de un mes
+    Parámetros opcionales: mes y anio (por defecto el mes actual)
+    Cada área trae arreglos con un valor por día: horas_libres, horas_ocupadas
+    y completo (1 si no queda ningún horario del tiempo mínimo de reserva)
+    """
+    hoy = date.today()
+    mes = request.args.get('mes', hoy.month, type=int)
+    anio = request.args.get('anio', hoy.year, type=int)
+    
+    if not 1 <= mes <= 12 or not 2000 <= anio <= 2100:
+        return jsonify({'error': 'Mes o año no válido'}), 400
+    
+    areas = IndiceOcupacion.disponibilidad_mes(AreaComun.get_disponibles(), mes, anio)
+    
+    return jsonify({
+        'mes': mes,
+        'anio': anio,
+        'dias': len(areas[0]['completo']) if areas else calendar.monthrange(anio, mes)[1],
+        'areas': areas,
+    })
+
+
+@reservas_bp.route('/api/reservas/serie/', methods=['POST'])
+@login_required
+def reservar_serie():
+    """
+    API: Reserva recurrente (JSON o formulario)
+    Campos: area_id, fecha (primera reserva), hora_inicio, hora_fin,
+    frecuencia (semanal o quincenal), hasta (YYYY-MM-DD) u ocurrencias,
+    num_personas, motivo y omitir_conflictos (registrar solo las fechas libres)
+    """
+    datos = request.get_json(silent=True) or request.form
+    try:
+        creadas, conflictos = crear_serie(datos)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': bool(creadas),
+        'reservas': [r.to_dict() for r in creadas],
+        'conflictos': [{'fecha': f.isoformat(), 'motivo': 'ocupado'} for f in conflictos],
+        'costo_total': float(sum(r.costo_total for r in creadas)),
+    }), 201 if creadas else 409
+
+
 @reservas_bp.route('/api/areas_populares/')
 @login_required
 def areas_populares():
@@ -475,10 +643,18 @@ def mis_reservas_api():
     if not current_user.departamento:
         return jsonify({'error': 'Sin departamento asignado'}), 400
     
-    reservas = Reserva.get_proximas_by_departamento(current_user.departamento)
+    # Reserva, pago y área en una sola consulta
+    reservas = LibroDepartamento(current_user.departamento).proximas()
     
     return jsonify({
-        'reservas': [r.to_dict() for r in reservas]
+        'reservas': [
+            {
+                **reserva.to_dict(),
+                'pagado': pago.pagado if pago else None,
+                'monto_pago': float(pago.monto) if pago else None,
+            }
+            for reserva, pago in reservas
+        ]
     })
 
 
@@ -0,0 +1,111 @@
+# migrate_finanzas.py
+"""
+Script de migración para el módulo de finanzas
+Crea las tablas e índices nuevos en bases de datos existentes
+Ejecutar: python migrate_finanzas.py
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run import create_app
+from database import db
+
+
+# (nombre, sentencia) - todas las sentencias son idempotentes
+INDICES = [
+    ('uq_cargos_departamento_mes',
+     'CREATE UNIQUE INDEX IF NOT EXISTS uq_cargos_departamento_mes '
+     'ON cargos_mensuales (departamento, mes, anio)'),
+    ('ix_cargos_pagado_vencimiento',
+     'CREATE INDEX IF NOT EXISTS ix_cargos_pagado_vencimiento '
+     'ON cargos_mensuales (pagado, fecha_vencimiento)'),
+    ('ix_historial_departamento_fecha',
+     'CREATE INDEX IF NOT EXISTS ix_historial_departamento_fecha '
+     'ON historial_pagos (departamento, fecha_pago, id)'),
+    ('ix_pagos_reservas_reserva_id',
+     'CREATE INDEX IF NOT EXISTS ix_pagos_reservas_reserva_id '
+     'ON pagos_reservas (reserva_id)'),
+    ('ix_gastos_edificio_fecha_gasto',
+     'CREATE INDEX IF NOT EXISTS ix_gastos_edificio_fecha_gasto '
+     'ON gastos_edificio (fecha_gasto)'),
+    ('ix_historial_pagos_fecha_pago',
+     'CREATE INDEX IF NOT EXISTS ix_historial_pagos_fecha_pago '
+     'ON historial_pagos (fecha_pago)'),
+    ('ix_pagos_reservas_fecha_pago',
+     'CREATE INDEX IF NOT EXISTS ix_pagos_reservas_fecha_pago '
+     'ON pagos_reservas (fecha_pago)'),
+]
+
+
+def cargos_duplicados():
+    """Retorna los (departamento, mes, anio) con más de un cargo"""
+    return db.session.execute(db.text(
+        'SELECT departamento, mes, anio, COUNT(*) FROM cargos_mensuales '
+        'GROUP BY departamento, mes, anio HAVING COUNT(*) > 1'
+    )).fetchall()
+
+
+def migrate_database():
+    """Aplica las migraciones necesarias"""
+
+    print("\n" + "="*70)
+    print("🔄 MIGRACIÓN DE BASE DE DATOS - FINANZAS")
+    print("="*70 + "\n")
+
+    app, socketio = create_app()
+
+    with app.app_context():
+        try:
+            print("📋 Creando/actualizando tablas...")
+            db.create_all()
+            print("✅ Tablas actualizadas correctamente")
+
+            print("\n📇 Creando índices...")
+            for nombre, sentencia in INDICES:
+                if nombre == 'uq_cargos_departamento_mes':
+                    duplicados = cargos_duplicados()
+                    if duplicados:
+                        print(f"   ⚠️ {nombre} omitido: hay cargos duplicados")
+                        for dept, mes, anio, cantidad in duplicados:
+                            print(f"      • Dpto {dept} - {mes:02d}/{anio}: {cantidad} cargos")
+                        continue
+
+                db.session.execute(db.text(sentencia))
+                db.session.commit()
+                print(f"   ✓ {nombre}")
+
+            # Saldos por departamento: se calculan una vez desde las tablas;
+            # luego se mantienen con cada cargo, pago o cancelación
+            from models.finanzas_model import SaldoDepartamento
+            if SaldoDepartamento.query.first() is None:
+                print("\n💰 Calculando saldos por departamento...")
+                print(f"   ✓ {SaldoDepartamento.reconstruir()} departamentos")
+
+            print("\n" + "="*70)
+            print("✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+            print("="*70 + "\n")
+            return True
+
+        except Exception as e:
+            print(f"\n❌ ERROR DURANTE LA MIGRACIÓN: {str(e)}")
+            print("\nSi el error persiste:")
+            print("1. Hacer backup de buildtech.db")
+            print("2. Revisar los datos duplicados reportados")
+            print("3. Ejecutar nuevamente: python migrate_finanzas.py")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    print("\n⚠️  IMPORTANTE: Asegúrate de tener un backup de tu base de datos")
+    print("   antes de ejecutar esta migración.\n")
+
+    respuesta = input("¿Deseas continuar con la migración? (s/n): ")
+
+    if respuesta.lower() in ['s', 'si', 'yes', 'y']:
+        migrate_database()
+    else:
+        print("\n❌ Migración cancelada por el usuario")
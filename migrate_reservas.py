@@ -69,6 +69,15 @@ def migrate_database():
             if reservas:
                 print(f"   ✓ {len(reservas)} reservas actualizadas")
             
+            # Índice para las consultas por área y rango de fechas
+            print("\n📇 Creando índices...")
+            db.session.execute(db.text(
+                'CREATE INDEX IF NOT EXISTS ix_reservas_area_fecha '
+                'ON reservas (area_id, fecha)'
+            ))
+            db.session.commit()
+            print("   ✓ ix_reservas_area_fecha")
+            
             print("\n" + "="*70)
             print("✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
             print("="*70)
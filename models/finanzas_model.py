@@ -4,15 +4,44 @@ Modelos de Finanzas - Mejorado con más funcionalidades
 Gestión de cargos mensuales, pagos y gastos del edificio
 """
 
+import re
+import numpy as np
 from database import db
 from datetime import datetime, date
 from decimal import Decimal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import event
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session
+from utils.fechas_utils import filtro_mes
+from utils.cache_utils import CacheTTL, TODAS
+
+# Tarifas por defecto para los cargos mensuales
+TARIFAS_DEFAULT = {
+    'luz': 150.00,
+    'agua': 80.00,
+    'gas': 60.00,
+    'mantenimiento': 200.00,
+    'expensas_comunes': 150.00,
+}
+
+
+def calcular_fecha_vencimiento(mes, anio):
+    """Fecha de vencimiento de un cargo: día 10 del mes siguiente"""
+    if mes == 12:
+        return date(anio + 1, 1, 10)
+    return date(anio, mes + 1, 10)
+
 
 class CargoMensual(db.Model):
     """
     Cargos mensuales por departamento (luz, agua, gas, etc.)
     """
     __tablename__ = 'cargos_mensuales'
+    __table_args__ = (
+        db.Index('uq_cargos_departamento_mes', 'departamento', 'mes', 'anio', unique=True),
+        db.Index('ix_cargos_pagado_vencimiento', 'pagado', 'fecha_vencimiento'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     departamento = db.Column(db.Integer, nullable=False, index=True)
@@ -49,17 +78,30 @@ class CargoMensual(db.Model):
         self.pagado = False
         
         # Establecer fecha de vencimiento (día 10 del mes siguiente)
-        if mes == 12:
-            self.fecha_vencimiento = date(anio + 1, 1, 10)
-        else:
-            self.fecha_vencimiento = date(anio, mes + 1, 10)
+        self.fecha_vencimiento = calcular_fecha_vencimiento(mes, anio)
     
-    @property
+    @hybrid_property
     def total(self):
-        """Calcula el total del cargo"""
-        return float(
-            self.luz + self.agua + self.gas + 
-            self.mantenimiento + self.expensas_comunes
+        """Calcula el total del cargo (Decimal exacto)"""
+        return sum(
+            (Decimal(str(valor or 0)) for valor in (
+                self.luz, self.agua, self.gas,
+                self.mantenimiento, self.expensas_comunes
+            )),
+            Decimal('0.00')
+        ).quantize(Decimal('0.01'))
+    
+    @total.expression
+    def total(cls):
+        """Expresión SQL del total: permite sumar, ordenar y filtrar en la base"""
+        from sqlalchemy import func, type_coerce
+        return type_coerce(
+            func.coalesce(cls.luz, 0) +
+            func.coalesce(cls.agua, 0) +
+            func.coalesce(cls.gas, 0) +
+            func.coalesce(cls.mantenimiento, 0) +
+            func.coalesce(cls.expensas_comunes, 0),
+            db.Numeric(12, 2)
         )
     
     @property
@@ -79,17 +121,26 @@ class CargoMensual(db.Model):
     @property
     def dias_vencido(self):
         """Calcula los días de mora"""
-        if not self.esta_vencido:
+        return self.dias_vencido_al(date.today())
+    
+    def dias_vencido_al(self, fecha):
+        """Días de mora a una fecha de corte (evita llamar date.today() por fila)"""
+        if self.pagado or not self.fecha_vencimiento or fecha <= self.fecha_vencimiento:
             return 0
-        return (date.today() - self.fecha_vencimiento).days
+        return (fecha - self.fecha_vencimiento).days
     
     def marcar_pagado(self):
         """Marca el cargo como pagado"""
+        if not self.pagado:
+            ResumenMensual.registrar('cargos', self.mes, self.anio, self.total)
+            SaldoDepartamento.registrar(self.departamento, deuda=-self.total, pendientes=-1)
         self.pagado = True
         self.fecha_pago = date.today()
         db.session.commit()
     
     def save(self):
+        if self.id is None and not self.pagado:
+            SaldoDepartamento.registrar(self.departamento, deuda=self.total, pendientes=1)
         db.session.add(self)
         db.session.commit()
     
@@ -98,6 +149,10 @@ class CargoMensual(db.Model):
         db.session.commit()
     
     def delete(self):
+        if self.pagado:
+            ResumenMensual.registrar('cargos', self.mes, self.anio, -self.total, cantidad=-1)
+        else:
+            SaldoDepartamento.registrar(self.departamento, deuda=-self.total, pendientes=-1)
         db.session.delete(self)
         db.session.commit()
     
@@ -135,16 +190,64 @@ class CargoMensual(db.Model):
                 departamento=departamento,
                 mes=hoy.month,
                 anio=hoy.year,
-                luz=150.00,  # Valores por defecto
-                agua=80.00,
-                gas=60.00,
-                mantenimiento=200.00,
-                expensas_comunes=150.00
+                **TARIFAS_DEFAULT
             )
-            cargo.save()
+            try:
+                cargo.save()
+            except IntegrityError:
+                # Otro proceso creó el cargo al mismo tiempo
+                db.session.rollback()
+                cargo = CargoMensual.query.filter_by(
+                    departamento=departamento,
+                    mes=hoy.month,
+                    anio=hoy.year
+                ).first()
         
         return cargo
     
+    @staticmethod
+    def generar_cargos_mes(mes, anio, tarifas=None, departamentos=None):
+        """
+        Genera en una sola transacción los cargos faltantes de un mes.
+        Si no se indican departamentos se usan los de los residentes registrados.
+        Los cargos existentes no se modifican (índice único departamento/mes/año).
+        Retorna la cantidad de cargos creados.
+        """
+        from sqlalchemy import insert, select, literal
+        from models.user_model import User
+        
+        valores = dict(TARIFAS_DEFAULT)
+        valores.update(tarifas or {})
+        columnas = {
+            'mes': mes,
+            'anio': anio,
+            'pagado': False,
+            'fecha_generacion': datetime.utcnow(),
+            'fecha_vencimiento': calcular_fecha_vencimiento(mes, anio),
+        }
+        columnas.update({campo: Decimal(str(valores[campo])) for campo in TARIFAS_DEFAULT})
+        
+        tabla = CargoMensual.__table__
+        stmt = insert(tabla).prefix_with('OR IGNORE')
+        
+        if departamentos is None:
+            origen = select(
+                User.departamento,
+                *[literal(valor, type_=tabla.c[campo].type) for campo, valor in columnas.items()]
+            ).where(User.departamento.isnot(None)).distinct()
+            resultado = db.session.execute(
+                stmt.from_select(['departamento', *columnas.keys()], origen)
+            )
+        else:
+            filas = [dict(columnas, departamento=dept) for dept in set(departamentos)]
+            if not filas:
+                return 0
+            resultado = db.session.execute(stmt, filas)
+        
+        SaldoDepartamento.registrar_cargos_generados(mes, anio, columnas['fecha_generacion'])
+        db.session.commit()
+        return resultado.rowcount
+    
     @staticmethod
     def get_all():
         """Obtiene todos los cargos"""
@@ -154,9 +257,36 @@ class CargoMensual(db.Model):
         ).all()
     
     @staticmethod
-    def get_all_pendientes():
-        """Obtiene todos los cargos pendientes (para admin)"""
-        return CargoMensual.query.filter_by(pagado=False).all()
+    def get_all_pendientes(monto_minimo=None):
+        """
+        Obtiene todos los cargos pendientes (para admin)
+        Con monto_minimo solo las deudas desde ese monto, de mayor a menor
+        """
+        query = CargoMensual.query.filter_by(pagado=False)
+        if monto_minimo is not None:
+            query = query.filter(
+                CargoMensual.total >= Decimal(str(monto_minimo))
+            ).order_by(CargoMensual.total.desc(), CargoMensual.id)
+        return query.all()
+    
+    @staticmethod
+    def get_total_pendiente(departamento=None):
+        """Total adeudado (calculado en SQL), opcionalmente de un departamento"""
+        from sqlalchemy import func
+        query = db.session.query(func.sum(CargoMensual.total)).filter(
+            CargoMensual.pagado == False
+        )
+        if departamento is not None:
+            query = query.filter(CargoMensual.departamento == departamento)
+        return query.scalar() or Decimal('0.00')
+    
+    @staticmethod
+    def get_total_departamentos():
+        """Cantidad de departamentos con algún cargo registrado"""
+        from sqlalchemy import func
+        return db.session.query(
+            func.count(func.distinct(CargoMensual.departamento))
+        ).scalar()
     
     @staticmethod
     def get_by_mes_pagados(mes, anio):
@@ -170,21 +300,25 @@ class CargoMensual(db.Model):
     @staticmethod
     def get_total_recaudado_mes(mes, anio):
         """Calcula el total recaudado en un mes específico"""
-        cargos = CargoMensual.query.filter_by(
+        from sqlalchemy import func
+        total = db.session.query(func.sum(CargoMensual.total)).filter_by(
             mes=mes,
             anio=anio,
             pagado=True
-        ).all()
-        
-        total = sum(cargo.total for cargo in cargos)
-        return float(total)
+        ).scalar()
+        return float(total or 0)
     
     @staticmethod
-    def get_vencidos():
-        """Obtiene todos los cargos vencidos"""
-        hoy = date.today()
-        cargos = CargoMensual.query.filter_by(pagado=False).all()
-        return [c for c in cargos if c.fecha_vencimiento and c.fecha_vencimiento < hoy]
+    def get_vencidos(fecha_corte=None):
+        """Obtiene todos los cargos vencidos (usa el índice pagado + fecha_vencimiento)"""
+        fecha_corte = fecha_corte or date.today()
+        return CargoMensual.query.filter(
+            CargoMensual.pagado == False,
+            CargoMensual.fecha_vencimiento < fecha_corte
+        ).order_by(
+            CargoMensual.fecha_vencimiento,
+            CargoMensual.departamento
+        ).all()
 
 
 class PagoReserva(db.Model):
@@ -194,12 +328,12 @@ class PagoReserva(db.Model):
     __tablename__ = 'pagos_reservas'
     
     id = db.Column(db.Integer, primary_key=True)
-    reserva_id = db.Column(db.Integer, db.ForeignKey('reservas.id'), nullable=False)
+    reserva_id = db.Column(db.Integer, db.ForeignKey('reservas.id'), nullable=False, index=True)
     
     # Información del pago
     monto = db.Column(db.Numeric(10, 2), nullable=False)
     pagado = db.Column(db.Boolean, default=False)
-    fecha_pago = db.Column(db.DateTime, nullable=True)
+    fecha_pago = db.Column(db.DateTime, nullable=True, index=True)
     
     # Método de pago
     metodo_pago = db.Column(db.String(50), nullable=True)
@@ -216,19 +350,43 @@ class PagoReserva(db.Model):
         self.monto = Decimal(str(monto))
         self.pagado = False
     
+    def _reserva_activa(self):
+        """Retorna la reserva si no está cancelada (su pago pendiente cuenta como deuda)"""
+        from models.reservas_model import Reserva
+        reserva = db.session.get(Reserva, self.reserva_id)
+        return reserva if reserva and reserva.estado != 'cancelada' else None
+    
     def marcar_pagado(self, metodo_pago='efectivo', referencia=None):
         """Marca el pago como realizado"""
+        ya_pagado = self.pagado
         self.pagado = True
         self.fecha_pago = datetime.utcnow()
         self.metodo_pago = metodo_pago
         self.referencia = referencia
+        if not ya_pagado:
+            ResumenMensual.registrar('reservas', self.fecha_pago.month,
+                                     self.fecha_pago.year, self.monto)
+            reserva = self._reserva_activa()
+            if reserva:
+                SaldoDepartamento.registrar(reserva.departamento, deuda=-self.monto, pendientes=-1)
         db.session.commit()
     
     def save(self):
+        if self.id is None and not self.pagado:
+            reserva = self._reserva_activa()
+            if reserva:
+                SaldoDepartamento.registrar(reserva.departamento, deuda=self.monto, pendientes=1)
         db.session.add(self)
         db.session.commit()
     
     def delete(self):
+        if self.pagado and self.fecha_pago:
+            ResumenMensual.registrar('reservas', self.fecha_pago.month,
+                                     self.fecha_pago.year, -self.monto, cantidad=-1)
+        elif not self.pagado:
+            reserva = self._reserva_activa()
+            if reserva:
+                SaldoDepartamento.registrar(reserva.departamento, deuda=-self.monto, pendientes=-1)
         db.session.delete(self)
         db.session.commit()
     
@@ -251,12 +409,8 @@ class PagoReserva(db.Model):
         query = PagoReserva.query.filter_by(pagado=True)
         
         if mes and anio:
-            # Filtrar por mes/año si se proporciona
-            from sqlalchemy import extract
-            query = query.filter(
-                extract('month', PagoReserva.fecha_pago) == mes,
-                extract('year', PagoReserva.fecha_pago) == anio
-            )
+            # Filtrar por mes/año si se proporciona (rango indexable)
+            query = query.filter(filtro_mes(PagoReserva.fecha_pago, mes, anio))
         
         pagos = query.all()
         total = sum(float(pago.monto) for pago in pagos)
@@ -283,7 +437,7 @@ class GastoEdificio(db.Model):
     # Valores: 'mantenimiento', 'servicios', 'personal', 'equipamiento', 'limpieza', 'seguridad', 'otros'
     
     # Fecha del gasto
-    fecha_gasto = db.Column(db.Date, nullable=False)
+    fecha_gasto = db.Column(db.Date, nullable=False, index=True)
     
     # Metadatos
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
@@ -301,15 +455,32 @@ class GastoEdificio(db.Model):
         self.descripcion = descripcion
         self.registrado_por = registrado_por
     
+    def _registrar_en_resumen(self, monto, categoria, fecha_gasto, cantidad):
+        ResumenMensual.registrar('gastos', fecha_gasto.month, fecha_gasto.year,
+                                 monto, cantidad=cantidad, categoria=categoria)
+    
     def save(self):
+        if self.id is None:
+            self._registrar_en_resumen(self.monto, self.categoria, self.fecha_gasto, 1)
         db.session.add(self)
         db.session.commit()
     
     def update(self):
         """Actualizar gasto"""
+        # Valores guardados antes de aplicar los cambios pendientes
+        with db.session.no_autoflush:
+            anterior = db.session.query(
+                GastoEdificio.monto, GastoEdificio.categoria, GastoEdificio.fecha_gasto
+            ).filter(GastoEdificio.id == self.id).one()
+
+        if tuple(anterior) != (Decimal(str(self.monto)), self.categoria, self.fecha_gasto):
+            self._registrar_en_resumen(-anterior.monto, anterior.categoria,
+                                       anterior.fecha_gasto, -1)
+            self._registrar_en_resumen(self.monto, self.categoria, self.fecha_gasto, 1)
         db.session.commit()
     
     def delete(self):
+        self._registrar_en_resumen(-self.monto, self.categoria, self.fecha_gasto, -1)
         db.session.delete(self)
         db.session.commit()
     
@@ -326,18 +497,14 @@ class GastoEdificio(db.Model):
     @staticmethod
     def get_by_mes(mes, anio):
         """Obtiene gastos de un mes específico"""
-        from sqlalchemy import extract
         return GastoEdificio.query.filter(
-            extract('month', GastoEdificio.fecha_gasto) == mes,
-            extract('year', GastoEdificio.fecha_gasto) == anio
+            filtro_mes(GastoEdificio.fecha_gasto, mes, anio)
         ).all()
     
     @staticmethod
     def get_total_mes(mes, anio):
         """Calcula el total de gastos de un mes"""
-        gastos = GastoEdificio.get_by_mes(mes, anio)
-        total = sum(float(gasto.monto) for gasto in gastos)
-        return total
+        return sum(CuboGastos.obtener().totales_por_categoria(mes, anio).values())
     
     @staticmethod
     def get_by_categoria(categoria):
@@ -346,18 +513,49 @@ class GastoEdificio(db.Model):
     
     @staticmethod
     def get_total_por_categoria(mes=None, anio=None):
-        """Obtiene totales agrupados por categoría"""
-        if mes and anio:
-            gastos = GastoEdificio.get_by_mes(mes, anio)
-        else:
-            gastos = GastoEdificio.get_all()
-        
-        totales = {}
-        for gasto in gastos:
-            cat = gasto.categoria
-            totales[cat] = totales.get(cat, 0) + float(gasto.monto)
-        
-        return totales
+        """Obtiene totales agrupados por categoría (del cubo de gastos)"""
+        return CuboGastos.obtener().totales_por_categoria(mes, anio)
+
+
+class PresupuestoGasto(db.Model):
+    """
+    Presupuesto anual de gastos por categoría.
+    El presupuesto de cada mes es la doceava parte del anual.
+    """
+    __tablename__ = 'presupuestos_gasto'
+    __table_args__ = (
+        db.UniqueConstraint('categoria', 'anio', name='uq_presupuesto_categoria_anio'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    categoria = db.Column(db.String(50), nullable=False)
+    anio = db.Column(db.Integer, nullable=False, index=True)
+    monto = db.Column(db.Numeric(12, 2), nullable=False)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def definir(categoria, anio, monto):
+        """Crea o reemplaza el presupuesto de la categoría en el año"""
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(PresupuestoGasto).values(
+            categoria=categoria, anio=anio, monto=Decimal(str(monto)),
+            fecha_actualizacion=datetime.utcnow()
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['categoria', 'anio'],
+            set_={'monto': stmt.excluded.monto,
+                  'fecha_actualizacion': stmt.excluded.fecha_actualizacion}
+        ))
+        db.session.commit()
+
+    @staticmethod
+    def get_por_anio(anio):
+        """Retorna {categoria: monto anual} del año"""
+        return {
+            categoria: float(monto) for categoria, monto in db.session.query(
+                PresupuestoGasto.categoria, PresupuestoGasto.monto
+            ).filter(PresupuestoGasto.anio == anio).all()
+        }
 
 
 class HistorialPago(db.Model):
@@ -365,6 +563,9 @@ class HistorialPago(db.Model):
     Historial de todos los pagos realizados (auditoría)
     """
     __tablename__ = 'historial_pagos'
+    __table_args__ = (
+        db.Index('ix_historial_departamento_fecha', 'departamento', 'fecha_pago', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -385,7 +586,7 @@ class HistorialPago(db.Model):
     metodo_pago = db.Column(db.String(50), nullable=True)
     
     # Fecha del pago
-    fecha_pago = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_pago = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Observaciones
     observaciones = db.Column(db.Text, nullable=True)
@@ -415,6 +616,11 @@ class HistorialPago(db.Model):
             metodo_pago=metodo_pago,
             observaciones=observaciones
         )
+        historial.fecha_pago = datetime.utcnow()
+        ResumenMensual.registrar('historial', historial.fecha_pago.month,
+                                 historial.fecha_pago.year, historial.monto)
+        SaldoDepartamento.registrar(departamento, credito=historial.monto,
+                                    fecha_pago=historial.fecha_pago)
         historial.save()
         return historial
     
@@ -425,6 +631,65 @@ class HistorialPago(db.Model):
             departamento=departamento
         ).order_by(HistorialPago.fecha_pago.desc()).all()
     
+    @staticmethod
+    def codificar_cursor(pago):
+        """Cursor de paginación: posición (fecha_pago, id) del último pago mostrado"""
+        return f'{pago.fecha_pago.isoformat()}_{pago.id}'
+    
+    @staticmethod
+    def decodificar_cursor(cursor):
+        """Retorna (fecha_pago, id); lanza ValueError si el cursor no es válido"""
+        fecha, _, pago_id = cursor.rpartition('_')
+        return datetime.fromisoformat(fecha), int(pago_id)
+    
+    @staticmethod
+    def get_pagina_departamento(departamento, limite=20, cursor=None):
+        """
+        Página del historial de un departamento, del más reciente al más antiguo.
+        Paginación keyset sobre (fecha_pago, id): el costo no depende de la página.
+        Retorna (pagos, siguiente_cursor); siguiente_cursor es None en la última página.
+        """
+        from sqlalchemy import tuple_
+        
+        query = HistorialPago.query.filter(HistorialPago.departamento == departamento)
+        if cursor:
+            fecha, pago_id = HistorialPago.decodificar_cursor(cursor)
+            # Comparación de tupla: SQLite la usa como límite del rango en el índice
+            query = query.filter(
+                tuple_(HistorialPago.fecha_pago, HistorialPago.id) < tuple_(fecha, pago_id)
+            )
+        
+        pagos = query.order_by(
+            HistorialPago.fecha_pago.desc(),
+            HistorialPago.id.desc()
+        ).limit(limite + 1).all()
+        
+        if len(pagos) > limite:
+            pagos = pagos[:limite]
+            return pagos, HistorialPago.codificar_cursor(pagos[-1])
+        return pagos, None
+    
+    @staticmethod
+    def get_total_pagado(departamento):
+        """Total pagado por un departamento (calculado en SQL)"""
+        from sqlalchemy import func
+        total = db.session.query(func.sum(HistorialPago.monto)).filter(
+            HistorialPago.departamento == departamento
+        ).scalar()
+        return float(total or 0)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo_pago': self.tipo_pago,
+            'objeto_id': self.objeto_id,
+            'departamento': self.departamento,
+            'monto': float(self.monto),
+            'metodo_pago': self.metodo_pago,
+            'fecha_pago': self.fecha_pago.isoformat() if self.fecha_pago else None,
+            'observaciones': self.observaciones,
+        }
+    
     @staticmethod
     def get_all():
         return HistorialPago.query.order_by(
@@ -434,10 +699,8 @@ class HistorialPago(db.Model):
     @staticmethod
     def get_by_mes(mes, anio):
         """Obtiene pagos de un mes específico"""
-        from sqlalchemy import extract
         return HistorialPago.query.filter(
-            extract('month', HistorialPago.fecha_pago) == mes,
-            extract('year', HistorialPago.fecha_pago) == anio
+            filtro_mes(HistorialPago.fecha_pago, mes, anio)
         ).all()
     
     @staticmethod
@@ -451,50 +714,2358 @@ class HistorialPago(db.Model):
         return sum(float(p.monto) for p in pagos)
 
 
+class ResumenMensual(db.Model):
+    """
+    Totales mensuales mantenidos incrementalmente (ingresos y gastos)
+    Una fila por (anio, mes, tipo, categoria)
+    """
+    __tablename__ = 'resumen_mensual'
+    __table_args__ = (
+        db.UniqueConstraint('anio', 'mes', 'tipo', 'categoria', name='uq_resumen_mensual'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    anio = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+
+    # Tipo de movimiento
+    tipo = db.Column(db.String(20), nullable=False)
+    # Valores: 'cargos', 'reservas', 'historial', 'gastos'
+
+    # Categoría del gasto ('' para ingresos)
+    categoria = db.Column(db.String(50), nullable=False, default='')
+
+    # Acumulados
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def registrar(tipo, mes, anio, monto, cantidad=1, categoria=''):
+        """
+        Suma un monto al acumulado del mes con un UPSERT.
+        No hace commit: se confirma junto con la operación que lo origina.
+        """
+        from sqlalchemy.dialects.sqlite import insert
+        tabla = ResumenMensual.__table__
+        stmt = insert(tabla).values(
+            anio=anio,
+            mes=mes,
+            tipo=tipo,
+            categoria=categoria or '',
+            total=Decimal(str(monto)),
+            cantidad=cantidad,
+            fecha_actualizacion=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['anio', 'mes', 'tipo', 'categoria'],
+            set_={
+                'total': tabla.c.total + stmt.excluded.total,
+                'cantidad': tabla.c.cantidad + stmt.excluded.cantidad,
+                'fecha_actualizacion': stmt.excluded.fecha_actualizacion,
+            }
+        )
+        db.session.execute(stmt)
+
+    @staticmethod
+    def get_totales(mes, anio):
+        """Obtiene los totales de un mes leyendo solo sus filas del resumen"""
+        filas = ResumenMensual.query.filter_by(anio=anio, mes=mes).all()
+
+        totales = {
+            'cargos': 0.0,
+            'reservas': 0.0,
+            'historial': 0.0,
+            'gastos': 0.0,
+            'gastos_por_categoria': {},
+        }
+        for fila in filas:
+            monto = float(fila.total or 0)
+            if fila.tipo == 'gastos':
+                if fila.cantidad > 0:
+                    totales['gastos_por_categoria'][fila.categoria] = monto
+                totales['gastos'] += monto
+            else:
+                totales[fila.tipo] += monto
+
+        return totales
+
+    @staticmethod
+    def calcular_desde_tablas():
+        """
+        Recalcula los acumulados desde las tablas originales.
+        Retorna {(anio, mes, tipo, categoria): (total, cantidad)}
+        """
+        from sqlalchemy import func, extract
+        esperado = {}
+
+        def acumular(filas, tipo):
+            for anio, mes, categoria, total, cantidad in filas:
+                clave = (int(anio), int(mes), tipo, categoria or '')
+                esperado[clave] = (Decimal(str(total or 0)), int(cantidad))
+
+        acumular(db.session.query(
+            CargoMensual.anio, CargoMensual.mes, db.literal(''),
+            func.sum(CargoMensual.total), func.count(CargoMensual.id)
+        ).filter(CargoMensual.pagado == True)
+         .group_by(CargoMensual.anio, CargoMensual.mes).all(), 'cargos')
+
+        for modelo, tipo in ((PagoReserva, 'reservas'), (HistorialPago, 'historial')):
+            anio = extract('year', modelo.fecha_pago)
+            mes = extract('month', modelo.fecha_pago)
+            query = db.session.query(
+                anio, mes, db.literal(''), func.sum(modelo.monto), func.count(modelo.id)
+            ).filter(modelo.fecha_pago.isnot(None))
+            if modelo is PagoReserva:
+                query = query.filter(PagoReserva.pagado == True)
+            acumular(query.group_by(anio, mes).all(), tipo)
+
+        anio = extract('year', GastoEdificio.fecha_gasto)
+        mes = extract('month', GastoEdificio.fecha_gasto)
+        acumular(db.session.query(
+            anio, mes, GastoEdificio.categoria,
+            func.sum(GastoEdificio.monto), func.count(GastoEdificio.id)
+        ).group_by(anio, mes, GastoEdificio.categoria).all(), 'gastos')
+
+        return esperado
+
+    @staticmethod
+    def verificar():
+        """
+        Compara el resumen con las tablas originales.
+        Retorna una lista de (clave, (total, cantidad) actual, (total, cantidad) esperado)
+        """
+        esperado = ResumenMensual.calcular_desde_tablas()
+        actual = {
+            (f.anio, f.mes, f.tipo, f.categoria): (Decimal(str(f.total or 0)), f.cantidad)
+            for f in ResumenMensual.query.all()
+        }
+
+        diferencias = []
+        for clave in sorted(set(esperado) | set(actual)):
+            valor_actual = actual.get(clave, (Decimal('0'), 0))
+            valor_esperado = esperado.get(clave, (Decimal('0'), 0))
+            if abs(valor_actual[0] - valor_esperado[0]) >= Decimal('0.01') or \
+                    valor_actual[1] != valor_esperado[1]:
+                diferencias.append((clave, valor_actual, valor_esperado))
+
+        return diferencias
+
+    @staticmethod
+    def reconstruir():
+        """Reemplaza el resumen con los valores recalculados desde las tablas"""
+        esperado = ResumenMensual.calcular_desde_tablas()
+        ahora = datetime.utcnow()
+
+        ResumenMensual.query.delete()
+        if esperado:
+            db.session.execute(ResumenMensual.__table__.insert(), [
+                {
+                    'anio': anio, 'mes': mes, 'tipo': tipo, 'categoria': categoria,
+                    'total': total, 'cantidad': cantidad, 'fecha_actualizacion': ahora,
+                }
+                for (anio, mes, tipo, categoria), (total, cantidad) in esperado.items()
+            ])
+        db.session.commit()
+        return len(esperado)
+
+
+class SaldoDepartamento(db.Model):
+    """
+    Saldo de cada departamento mantenido incrementalmente
+    deuda: cargos pendientes + pagos pendientes de reservas no canceladas
+    credito: total pagado (suma del historial de pagos)
+    Se actualiza en la misma transacción que cada cargo, pago o cancelación.
+    """
+    __tablename__ = 'saldos_departamento'
+    __table_args__ = (
+        db.Index('ix_saldos_deuda', 'deuda'),
+    )
+
+    departamento = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    deuda = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
+    credito = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
+    cantidad_pendientes = db.Column(db.Integer, nullable=False, default=0)
+    fecha_ultimo_pago = db.Column(db.DateTime, nullable=True)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def registrar(departamento, deuda=0, credito=0, pendientes=0, fecha_pago=None):
+        """
+        Suma un movimiento al saldo del departamento con un UPSERT.
+        No hace commit: se confirma junto con la operación que lo origina.
+        """
+        SaldoDepartamento.registrar_lote([{
+            'departamento': departamento,
+            'deuda': deuda,
+            'credito': credito,
+            'pendientes': pendientes,
+            'fecha_pago': fecha_pago,
+        }])
+
+    @staticmethod
+    def _upsert_incremental(stmt):
+        """Convierte un INSERT en UPSERT que suma los valores al saldo existente"""
+        from sqlalchemy import func
+        tabla = SaldoDepartamento.__table__
+        return stmt.on_conflict_do_update(
+            index_elements=['departamento'],
+            set_={
+                'deuda': func.round(tabla.c.deuda + stmt.excluded.deuda, 2),
+                'credito': func.round(tabla.c.credito + stmt.excluded.credito, 2),
+                'cantidad_pendientes': tabla.c.cantidad_pendientes + stmt.excluded.cantidad_pendientes,
+                # max() de SQLite retorna NULL si algún valor es NULL
+                'fecha_ultimo_pago': func.coalesce(
+                    func.max(tabla.c.fecha_ultimo_pago, stmt.excluded.fecha_ultimo_pago),
+                    stmt.excluded.fecha_ultimo_pago,
+                    tabla.c.fecha_ultimo_pago
+                ),
+                'fecha_actualizacion': stmt.excluded.fecha_actualizacion,
+            }
+        )
+
+    @staticmethod
+    def registrar_lote(movimientos):
+        """
+        Aplica varios movimientos con un solo UPSERT (executemany).
+        Cada movimiento: departamento, deuda, credito, pendientes, fecha_pago.
+        """
+        from sqlalchemy.dialects.sqlite import insert
+        if not movimientos:
+            return
+        ahora = datetime.utcnow()
+        stmt = SaldoDepartamento._upsert_incremental(insert(SaldoDepartamento.__table__))
+        db.session.execute(stmt, [
+            {
+                'departamento': m['departamento'],
+                'deuda': Decimal(str(m.get('deuda') or 0)),
+                'credito': Decimal(str(m.get('credito') or 0)),
+                'cantidad_pendientes': m.get('pendientes') or 0,
+                'fecha_ultimo_pago': m.get('fecha_pago'),
+                'fecha_actualizacion': ahora,
+            }
+            for m in movimientos
+        ])
+
+    @staticmethod
+    def registrar_cargos_generados(mes, anio, fecha_generacion):
+        """
+        Suma a la deuda los cargos creados en bloque (identificados por su
+        fecha de generación) con un UPSERT ... SELECT
+        """
+        from sqlalchemy import select, func, literal
+        from sqlalchemy.dialects.sqlite import insert
+
+        origen = select(
+            CargoMensual.departamento, func.sum(CargoMensual.total), literal(0),
+            func.count(CargoMensual.id), literal(None), literal(datetime.utcnow())
+        ).where(
+            CargoMensual.mes == mes,
+            CargoMensual.anio == anio,
+            CargoMensual.fecha_generacion == fecha_generacion,
+            CargoMensual.pagado == False
+        ).group_by(CargoMensual.departamento)
+
+        db.session.execute(SaldoDepartamento._upsert_incremental(
+            insert(SaldoDepartamento.__table__).from_select(
+                ['departamento', 'deuda', 'credito', 'cantidad_pendientes',
+                 'fecha_ultimo_pago', 'fecha_actualizacion'],
+                origen
+            )
+        ))
+
+    @staticmethod
+    def consulta_desde_tablas(departamentos=None):
+        """
+        SELECT con el saldo de cada departamento calculado desde las tablas
+        originales: (departamento, deuda, credito, pendientes, ultimo_pago)
+        """
+        from sqlalchemy import select, func, literal, union_all
+        from models.reservas_model import Reserva
+
+        cargos = select(
+            CargoMensual.departamento.label('departamento'),
+            func.sum(CargoMensual.total).label('deuda'),
+            literal(0).label('credito'),
+            func.count(CargoMensual.id).label('pendientes'),
+            literal(None).label('ultimo_pago')
+        ).where(CargoMensual.pagado == False)
+
+        reservas = select(
+            Reserva.departamento, func.sum(PagoReserva.monto), literal(0),
+            func.count(PagoReserva.id), literal(None)
+        ).join(
+            Reserva, Reserva.id == PagoReserva.reserva_id
+        ).where(
+            PagoReserva.pagado == False,
+            Reserva.estado != 'cancelada'
+        )
+
+        historial = select(
+            HistorialPago.departamento, literal(0), func.sum(HistorialPago.monto),
+            literal(0), func.max(HistorialPago.fecha_pago)
+        )
+
+        if departamentos is not None:
+            cargos = cargos.where(CargoMensual.departamento.in_(departamentos))
+            reservas = reservas.where(Reserva.departamento.in_(departamentos))
+            historial = historial.where(HistorialPago.departamento.in_(departamentos))
+
+        partes = union_all(
+            cargos.group_by(CargoMensual.departamento),
+            reservas.group_by(Reserva.departamento),
+            historial.group_by(HistorialPago.departamento)
+        ).subquery()
+
+        return select(
+            partes.c.departamento,
+            func.round(func.sum(partes.c.deuda), 2),
+            func.round(func.sum(partes.c.credito), 2),
+            func.sum(partes.c.pendientes),
+            func.max(partes.c.ultimo_pago)
+        ).group_by(partes.c.departamento)
+
+    @staticmethod
+    def recalcular(departamentos=None):
+        """
+        Reemplaza los saldos (de los departamentos indicados o de todos) por
+        los calculados desde las tablas. No hace commit.
+        """
+        from sqlalchemy import insert, literal, select
+
+        borrar = SaldoDepartamento.__table__.delete()
+        if departamentos is not None:
+            departamentos = list(set(departamentos))
+            if not departamentos:
+                return
+            borrar = borrar.where(SaldoDepartamento.departamento.in_(departamentos))
+        db.session.execute(borrar)
+
+        origen = SaldoDepartamento.consulta_desde_tablas(departamentos).subquery()
+        db.session.execute(insert(SaldoDepartamento.__table__).from_select(
+            ['departamento', 'deuda', 'credito', 'cantidad_pendientes',
+             'fecha_ultimo_pago', 'fecha_actualizacion'],
+            select(*origen.c, literal(datetime.utcnow()))
+        ))
+
+    @staticmethod
+    def verificar():
+        """
+        Compara los saldos con las tablas originales.
+        Retorna una lista de (departamento, (deuda, credito, pendientes) actual,
+        (deuda, credito, pendientes) esperado)
+        """
+        esperado = {
+            dept: (Decimal(str(deuda or 0)), Decimal(str(credito or 0)), int(pendientes or 0))
+            for dept, deuda, credito, pendientes, _ in db.session.execute(
+                SaldoDepartamento.consulta_desde_tablas()
+            )
+        }
+        actual = {
+            s.departamento: (Decimal(str(s.deuda or 0)), Decimal(str(s.credito or 0)),
+                             s.cantidad_pendientes)
+            for s in SaldoDepartamento.query.all()
+        }
+
+        cero = (Decimal('0'), Decimal('0'), 0)
+        diferencias = []
+        for dept in sorted(set(esperado) | set(actual)):
+            valor_actual = actual.get(dept, cero)
+            valor_esperado = esperado.get(dept, cero)
+            if abs(valor_actual[0] - valor_esperado[0]) >= Decimal('0.01') or \
+                    abs(valor_actual[1] - valor_esperado[1]) >= Decimal('0.01') or \
+                    valor_actual[2] != valor_esperado[2]:
+                diferencias.append((dept, valor_actual, valor_esperado))
+
+        return diferencias
+
+    @staticmethod
+    def reconstruir():
+        """Reemplaza todos los saldos con los valores recalculados desde las tablas"""
+        SaldoDepartamento.recalcular()
+        db.session.commit()
+        return SaldoDepartamento.query.count()
+
+    @staticmethod
+    def get_by_departamento(departamento):
+        return db.session.get(SaldoDepartamento, departamento)
+
+    @staticmethod
+    def get_top_deudores(limite=10):
+        """Departamentos con mayor deuda (recorre el índice ix_saldos_deuda)"""
+        return SaldoDepartamento.query.filter(
+            SaldoDepartamento.deuda >= 0.01
+        ).order_by(SaldoDepartamento.deuda.desc()).limit(limite).all()
+
+
+class CierreMes(db.Model):
+    """
+    Meses cerrados contablemente.
+    El reporte de un mes cerrado queda fijo con la versión registrada.
+    """
+    __tablename__ = 'cierres_mes'
+    __table_args__ = (
+        db.UniqueConstraint('anio', 'mes', name='uq_cierre_mes'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    anio = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+
+    # Versión (hash de datos) del reporte al momento del cierre
+    version_reporte = db.Column(db.String(64), nullable=False)
+
+    fecha_cierre = db.Column(db.DateTime, default=datetime.utcnow)
+    cerrado_por = db.Column(db.String(100), nullable=True)
+
+    def __init__(self, mes, anio, version_reporte, cerrado_por=None):
+        self.mes = mes
+        self.anio = anio
+        self.version_reporte = version_reporte
+        self.cerrado_por = cerrado_por
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    @staticmethod
+    def get_by_mes(mes, anio):
+        return CierreMes.query.filter_by(mes=mes, anio=anio).first()
+
+
+class RecargoMora(db.Model):
+    """
+    Recargo por mora vigente de cada cargo (uno por cargo).
+    Lo actualiza el cálculo nocturno (CalculoMora); el detalle diario queda
+    en AuditoriaMora.
+    """
+    __tablename__ = 'recargos_mora'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cargo_id = db.Column(db.Integer, db.ForeignKey('cargos_mensuales.id'),
+                         nullable=False, unique=True)
+    departamento = db.Column(db.Integer, nullable=False, index=True)
+    monto = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
+    dias_vencido = db.Column(db.Integer, nullable=False, default=0)
+    fecha_calculo = db.Column(db.Date, nullable=False)
+
+    @staticmethod
+    def get_por_cargos(cargo_ids):
+        """Retorna {cargo_id: monto} de los cargos indicados"""
+        if not cargo_ids:
+            return {}
+        return {
+            cargo_id: monto for cargo_id, monto in db.session.query(
+                RecargoMora.cargo_id, RecargoMora.monto
+            ).filter(RecargoMora.cargo_id.in_(cargo_ids)).all()
+        }
+
+    @staticmethod
+    def get_total_pendiente(departamento=None):
+        """Total de recargos de los cargos aún no pagados"""
+        from sqlalchemy import func
+        query = db.session.query(func.sum(RecargoMora.monto)).join(
+            CargoMensual, CargoMensual.id == RecargoMora.cargo_id
+        ).filter(CargoMensual.pagado == False)
+        if departamento is not None:
+            query = query.filter(RecargoMora.departamento == departamento)
+        return query.scalar() or Decimal('0.00')
+
+
+class AuditoriaMora(db.Model):
+    """
+    Registro diario del cálculo de mora: una fila por cargo y fecha.
+    El índice único (cargo_id, fecha) hace idempotente el cálculo del día.
+    """
+    __tablename__ = 'auditoria_mora'
+    __table_args__ = (
+        db.UniqueConstraint('cargo_id', 'fecha', name='uq_auditoria_mora_cargo_fecha'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cargo_id = db.Column(db.Integer, db.ForeignKey('cargos_mensuales.id'), nullable=False)
+    departamento = db.Column(db.Integer, nullable=False)
+    fecha = db.Column(db.Date, nullable=False, index=True)
+    dias_vencido = db.Column(db.Integer, nullable=False)
+    monto_base = db.Column(db.Numeric(10, 2), nullable=False)
+
+    # Parámetros usados en el cálculo
+    tasa_diaria = db.Column(db.Numeric(8, 6), nullable=False, default=0)
+    tasa_mensual = db.Column(db.Numeric(8, 6), nullable=False, default=0)
+    dias_gracia = db.Column(db.Integer, nullable=False, default=0)
+
+    recargo_anterior = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
+    recargo = db.Column(db.Numeric(10, 2), nullable=False)
+    ejecutado_en = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def get_by_cargo(cargo_id):
+        return AuditoriaMora.query.filter_by(cargo_id=cargo_id).order_by(
+            AuditoriaMora.fecha
+        ).all()
+
+
+class ClaveIdempotencia(db.Model):
+    """
+    Clave de idempotencia de una operación de pago.
+    La clave se inserta en la misma transacción que el pago: si la operación
+    falla se descarta con el rollback y el cliente puede reintentar; si se
+    confirma, los reintentos con la misma clave reciben el resultado guardado
+    en lugar de volver a pagar.
+    """
+    __tablename__ = 'claves_idempotencia'
+
+    clave = db.Column(db.String(100), primary_key=True)
+    usuario_id = db.Column(db.Integer, nullable=True)          # Usuario que hizo el pago
+    huella = db.Column(db.String(64), nullable=False)   # sha256 de los ítems pagados
+    resultado = db.Column(db.Text, nullable=True)       # JSON con los resultados
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @staticmethod
+    def calcular_huella(items, usuario_id=None):
+        """Huella de la operación: mismos ítems y usuario dan la misma huella"""
+        import hashlib
+        texto = f'{usuario_id}|' + ','.join(f'{tipo}:{item_id}' for tipo, item_id in sorted(items))
+        return hashlib.sha256(texto.encode()).hexdigest()
+
+    @staticmethod
+    def reclamar(clave, huella, usuario_id=None):
+        """
+        Inserta la clave (INSERT OR IGNORE) dentro de la transacción en curso.
+        Retorna None si esta operación la reclamó; si ya existía retorna los
+        resultados guardados. Con otra huella lanza ValueError.
+        Mientras la transacción que la reclamó no termine, SQLite bloquea la
+        escritura de las demás: el reintento espera y luego lee el resultado.
+        """
+        import json
+        from sqlalchemy import insert
+
+        reclamada = db.session.execute(
+            insert(ClaveIdempotencia).prefix_with('OR IGNORE').values(
+                clave=clave, usuario_id=usuario_id, huella=huella,
+                fecha_creacion=datetime.utcnow()
+            )
+        ).rowcount
+        if reclamada:
+            return None
+
+        previa = db.session.query(ClaveIdempotencia.huella, ClaveIdempotencia.resultado).filter(
+            ClaveIdempotencia.clave == clave
+        ).one()
+        if previa.huella != huella:
+            raise ValueError('La clave de idempotencia ya se usó para otra operación')
+        return [
+            {**r, 'monto': Decimal(r['monto']) if r['monto'] is not None else None}
+            for r in json.loads(previa.resultado or '[]')
+        ]
+
+    @staticmethod
+    def guardar_resultado(clave, resultados):
+        import json
+        db.session.query(ClaveIdempotencia).filter(ClaveIdempotencia.clave == clave).update(
+            {'resultado': json.dumps([
+                {**r, 'monto': str(r['monto']) if r['monto'] is not None else None}
+                for r in resultados
+            ])},
+            synchronize_session=False
+        )
+
+    @staticmethod
+    def purgar(antes_de):
+        """Elimina las claves creadas antes de la fecha (los reintentos son de minutos)"""
+        eliminadas = ClaveIdempotencia.query.filter(
+            ClaveIdempotencia.fecha_creacion < antes_de
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return eliminadas
+
+
 # ============================================================================
-# FUNCIONES DE INICIALIZACIÓN
+# AGREGACIONES SQL (DASHBOARD FINANCIERO)
 # ============================================================================
 
-def generar_cargos_todos_departamentos():
+class ResumenFinanciero:
     """
-    Función auxiliar para generar cargos del mes actual para todos los departamentos
-    Útil para ejecutar al inicio de cada mes
+    Capa de agregación para el resumen financiero.
+    Cada método ejecuta una consulta agrupada y retorna tuplas simples
+    en lugar de objetos ORM.
     """
-    from models.user_model import User
-    
-    residentes = User.query.filter(User.departamento.isnot(None)).all()
-    departamentos = list(set([r.departamento for r in residentes]))
-    
-    hoy = date.today()
-    mes_actual = hoy.month
-    anio_actual = hoy.year
-    
-    for dept in departamentos:
-        cargo = CargoMensual.get_or_create_mes_actual(dept)
-        print(f"✓ Cargo generado para Dpto {dept}: Bs. {cargo.total:.2f}")
-    
-    print(f"\n✅ Cargos generados para {len(departamentos)} departamentos")
 
+    @staticmethod
+    def resumen_cargos(mes, anio):
+        """
+        Retorna (total_pendiente, cantidad_pendientes, total_departamentos,
+                 departamentos_pagados_mes)
+        """
+        from sqlalchemy import func, case, and_
+        pagado_mes = and_(
+            CargoMensual.pagado == True,
+            CargoMensual.mes == mes,
+            CargoMensual.anio == anio
+        )
+
+        fila = db.session.query(
+            func.sum(case((CargoMensual.pagado == False, CargoMensual.total), else_=0)),
+            func.sum(case((CargoMensual.pagado == False, 1), else_=0)),
+            func.count(func.distinct(CargoMensual.departamento)),
+            func.count(func.distinct(case((pagado_mes, CargoMensual.departamento))))
+        ).one()
 
-def enviar_recordatorios_pago():
+        return (
+            float(fila[0] or 0),
+            int(fila[1] or 0),
+            int(fila[2] or 0),
+            int(fila[3] or 0),
+        )
+
+    @staticmethod
+    def resumen_reservas():
+        """Retorna (total_pendiente, cantidad_pendientes)"""
+        from sqlalchemy import func
+        fila = db.session.query(
+            func.sum(PagoReserva.monto),
+            func.count(PagoReserva.id)
+        ).filter(PagoReserva.pagado == False).one()
+
+        return (float(fila[0] or 0), int(fila[1] or 0))
+
+    @staticmethod
+    def historial_reciente(limit=10):
+        """Retorna las últimas filas del historial como tuplas con nombre"""
+        return db.session.query(
+            HistorialPago.id,
+            HistorialPago.fecha_pago,
+            HistorialPago.tipo_pago,
+            HistorialPago.departamento,
+            HistorialPago.monto,
+            HistorialPago.metodo_pago,
+            HistorialPago.observaciones
+        ).order_by(HistorialPago.fecha_pago.desc()).limit(limit).all()
+
+    @staticmethod
+    def calcular(mes, anio):
+        """Calcula todas las cifras del dashboard para un mes"""
+        (total_pendiente_cargos, cantidad_cargos_pendientes, total_departamentos,
+         departamentos_pagados) = ResumenFinanciero.resumen_cargos(mes, anio)
+        (total_pendiente_reservas,
+         cantidad_reservas_pendientes) = ResumenFinanciero.resumen_reservas()
+        totales_mes = ResumenMensual.get_totales(mes, anio)
+
+        ingresos_cargos = totales_mes['cargos']
+        ingresos_reservas = totales_mes['reservas']
+        total_ingresos = ingresos_cargos + ingresos_reservas
+        total_gastos = totales_mes['gastos']
+        tasa_morosidad = (cantidad_cargos_pendientes / max(total_departamentos, 1)) * 100
+        # Tendencia de los meses anteriores; sin historial, se estima con el
+        # promedio de los departamentos que ya pagaron este mes
+        ingreso_proyectado = SeriesFinancieras.ingreso_proyectado(mes, anio)
+        if ingreso_proyectado is None:
+            promedio_ingresos = ingresos_cargos / max(departamentos_pagados, 1)
+            ingreso_proyectado = promedio_ingresos * total_departamentos
+
+        return {
+            'total_pendiente_cargos': total_pendiente_cargos,
+            'cantidad_cargos_pendientes': cantidad_cargos_pendientes,
+            'total_pendiente_reservas': total_pendiente_reservas,
+            'cantidad_reservas_pendientes': cantidad_reservas_pendientes,
+            'ingresos_cargos': ingresos_cargos,
+            'ingresos_reservas': ingresos_reservas,
+            'total_ingresos': total_ingresos,
+            'total_gastos': total_gastos,
+            'balance': total_ingresos - total_gastos,
+            'total_departamentos': total_departamentos,
+            'tasa_morosidad': round(tasa_morosidad, 2),
+            'gastos_por_categoria': totales_mes['gastos_por_categoria'],
+            'ingreso_proyectado': ingreso_proyectado,
+        }
+
+
+class AntiguedadDeuda:
     """
-    Función auxiliar para enviar recordatorios de pago
-    Se puede ejecutar como tarea programada
+    Antigüedad de la deuda por departamento (aging).
+    Los cargos vencidos se agrupan en tramos según los días de mora con una
+    sola consulta agrupada sobre el índice (pagado, fecha_vencimiento).
     """
-    from models.user_model import User
-    from utils.email_utils import enviar_email_recordatorio_pago
-    
-    cargos_vencidos = CargoMensual.get_vencidos()
-    
-    departamentos_morosos = {}
-    for cargo in cargos_vencidos:
-        dept = cargo.departamento
-        if dept not in departamentos_morosos:
-            departamentos_morosos[dept] = []
-        departamentos_morosos[dept].append(cargo)
+
+    # (clave, días mínimos, días máximos) - None = sin límite
+    TRAMOS = [
+        ('0_30', 0, 30),
+        ('31_60', 31, 60),
+        ('61_90', 61, 90),
+        ('90_mas', 91, None),
+    ]
+
+    @staticmethod
+    def _tramo_sql(fecha_corte):
+        """Expresión CASE con la clave del tramo de cada cargo"""
+        from datetime import timedelta
+        from sqlalchemy import case
+
+        condiciones = []
+        for clave, _, maximo in AntiguedadDeuda.TRAMOS:
+            if maximo is not None:
+                # Días de mora <= maximo  <=>  vencimiento >= corte - maximo
+                condiciones.append((
+                    CargoMensual.fecha_vencimiento >= fecha_corte - timedelta(days=maximo),
+                    clave
+                ))
+        return case(*condiciones, else_=AntiguedadDeuda.TRAMOS[-1][0])
+
+    @staticmethod
+    def _tramos_vacios():
+        return {clave: {'monto': 0.0, 'cantidad': 0} for clave, _, _ in AntiguedadDeuda.TRAMOS}
+
+    @staticmethod
+    def calcular(fecha_corte=None, departamento=None):
+        """
+        Retorna un dict con la fecha de corte, el detalle por departamento
+        (ordenado por deuda) y los totales por tramo
+        """
+        from sqlalchemy import func
+
+        fecha_corte = fecha_corte or date.today()
+        tramo = AntiguedadDeuda._tramo_sql(fecha_corte).label('tramo')
+
+        query = db.session.query(
+            CargoMensual.departamento,
+            tramo,
+            func.sum(CargoMensual.total),
+            func.count(CargoMensual.id),
+            func.min(CargoMensual.fecha_vencimiento)
+        ).filter(
+            CargoMensual.pagado == False,
+            CargoMensual.fecha_vencimiento < fecha_corte
+        )
+        if departamento is not None:
+            query = query.filter(CargoMensual.departamento == departamento)
+        filas = query.group_by(CargoMensual.departamento, tramo).all()
+
+        por_departamento = {}
+        totales = {'tramos': AntiguedadDeuda._tramos_vacios(), 'monto': 0.0, 'cantidad': 0}
+        for dept, clave, monto, cantidad, vencimiento_min in filas:
+            monto = float(monto or 0)
+            fila = por_departamento.setdefault(dept, {
+                'departamento': dept,
+                'tramos': AntiguedadDeuda._tramos_vacios(),
+                'monto': 0.0,
+                'cantidad': 0,
+                'dias_max': 0,
+            })
+            fila['tramos'][clave]['monto'] += monto
+            fila['tramos'][clave]['cantidad'] += cantidad
+            fila['monto'] += monto
+            fila['cantidad'] += cantidad
+            fila['dias_max'] = max(fila['dias_max'], (fecha_corte - vencimiento_min).days)
+
+            totales['tramos'][clave]['monto'] += monto
+            totales['tramos'][clave]['cantidad'] += cantidad
+            totales['monto'] += monto
+            totales['cantidad'] += cantidad
+
+        departamentos = sorted(por_departamento.values(),
+                               key=lambda f: (-f['monto'], f['departamento']))
+
+        return {
+            'fecha_corte': fecha_corte,
+            'tramos': [clave for clave, _, _ in AntiguedadDeuda.TRAMOS],
+            'departamentos': departamentos,
+            'totales': totales,
+        }
+
+
+class LibroDepartamento:
+    """
+    Libro de reservas de un departamento.
+    Cada consulta trae las reservas junto con su pago y su área en una sola
+    sentencia (sin una consulta adicional por reserva).
+    """
+
+    def __init__(self, departamento):
+        self.departamento = departamento
+
+    def _query(self):
+        from sqlalchemy.orm import contains_eager
+        from models.reservas_model import Reserva, AreaComun
+
+        return db.session.query(Reserva, PagoReserva).join(
+            AreaComun, AreaComun.id == Reserva.area_id
+        ).outerjoin(
+            PagoReserva, PagoReserva.reserva_id == Reserva.id
+        ).options(
+            contains_eager(Reserva.area)
+        ).filter(
+            Reserva.departamento == self.departamento
+        )
+
+    def reservas(self):
+        """Todas las reservas como (reserva, pago), de la más reciente a la más antigua"""
+        from models.reservas_model import Reserva
+        return self._query().order_by(Reserva.fecha.desc(), Reserva.hora_inicio.desc()).all()
+
+    def proximas(self):
+        """Reservas pendientes o confirmadas desde hoy, como (reserva, pago)"""
+        from models.reservas_model import Reserva
+        return self._query().filter(
+            Reserva.fecha >= date.today(),
+            Reserva.estado.in_(['pendiente', 'confirmada'])
+        ).order_by(Reserva.fecha, Reserva.hora_inicio).all()
+
+    def pagos_pendientes(self):
+        """Reservas con pago pendiente: lista de {'reserva', 'pago'}"""
+        from models.reservas_model import Reserva
+        filas = self._query().filter(
+            PagoReserva.pagado == False
+        ).order_by(Reserva.fecha.desc()).all()
+        return [{'reserva': reserva, 'pago': pago} for reserva, pago in filas]
+
+
+# ============================================================================
+# CONCILIACIÓN BANCARIA
+# ============================================================================
+
+class ConciliacionBancaria:
+    """
+    Conciliación de un extracto bancario (CSV) con los cobros pendientes.
+    Cada línea se concilia por referencia (CARGO-<id> / RES-<reserva>) o,
+    si no trae referencia, por departamento y monto exacto (el pendiente
+    más antiguo primero). Los pendientes se cargan una sola vez en índices
+    hash en memoria y todas las coincidencias se aplican en una transacción.
+    """
+
+    PATRON_REFERENCIA = re.compile(r'\b(CARGO|RES(?:ERVA)?)\s*[-#:]?\s*(\d+)\b', re.IGNORECASE)
+
+    # Nombres de columna aceptados en el CSV
+    COLUMNAS = {
+        'fecha': ('fecha', 'fecha_operacion', 'fecha operacion'),
+        'monto': ('monto', 'importe', 'abono', 'credito'),
+        'referencia': ('referencia', 'ref', 'nro_referencia', 'comprobante'),
+        'departamento': ('departamento', 'dpto', 'depto'),
+        'descripcion': ('descripcion', 'concepto', 'glosa', 'detalle'),
+    }
+
+    FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+    @staticmethod
+    def _normalizar(texto):
+        import unicodedata
+        texto = unicodedata.normalize('NFKD', (texto or '').strip().lower())
+        return ''.join(c for c in texto if not unicodedata.combining(c))
+
+    @staticmethod
+    def _leer_monto(valor):
+        """Interpreta montos como '1234.50', '1.234,50' o 'Bs. 1,234.50'"""
+        from decimal import InvalidOperation
+        texto = re.sub(r'[^\d,.\-]', '', valor or '')
+        if ',' in texto and '.' in texto:
+            if texto.rfind(',') > texto.rfind('.'):
+                texto = texto.replace('.', '').replace(',', '.')
+            else:
+                texto = texto.replace(',', '')
+        elif ',' in texto:
+            texto = texto.replace(',', '.')
+        try:
+            return Decimal(texto).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f'Monto no válido: {valor!r}')
+
+    @staticmethod
+    def _leer_fecha(valor):
+        valor = (valor or '').strip()
+        if not valor:
+            return None
+        for formato in ConciliacionBancaria.FORMATOS_FECHA:
+            try:
+                return datetime.strptime(valor, formato).date()
+            except ValueError:
+                pass
+        raise ValueError(f'Fecha no válida: {valor!r}')
+
+    @staticmethod
+    def leer_csv(flujo):
+        """
+        Lee el extracto desde un flujo de texto.
+        Retorna (lineas, errores); los errores tienen el mismo formato que las
+        líneas no conciliadas para mostrarse juntos en el reporte.
+        """
+        import csv
+
+        lector = csv.reader(flujo)
+        encabezado = next(lector, None)
+        if not encabezado:
+            raise ValueError('El archivo está vacío')
+
+        nombres = [ConciliacionBancaria._normalizar(c) for c in encabezado]
+        posiciones = {}
+        for campo, alias in ConciliacionBancaria.COLUMNAS.items():
+            for i, nombre in enumerate(nombres):
+                if nombre in alias:
+                    posiciones[campo] = i
+                    break
+        if 'monto' not in posiciones:
+            raise ValueError('El archivo no tiene columna de monto')
+
+        lineas, errores = [], []
+        for numero, fila in enumerate(lector, start=2):
+            if not any(celda.strip() for celda in fila):
+                continue
+
+            def valor(campo):
+                i = posiciones.get(campo)
+                return fila[i].strip() if i is not None and i < len(fila) else ''
+
+            linea = {
+                'linea': numero,
+                'referencia': valor('referencia'),
+                'descripcion': valor('descripcion'),
+                'monto': None,
+                'departamento': None,
+                'fecha': None,
+            }
+            try:
+                linea['monto'] = ConciliacionBancaria._leer_monto(valor('monto'))
+                linea['fecha'] = ConciliacionBancaria._leer_fecha(valor('fecha'))
+                if valor('departamento'):
+                    digitos = re.sub(r'\D', '', valor('departamento'))
+                    if not digitos:
+                        raise ValueError(f'Departamento no válido: {valor("departamento")!r}')
+                    linea['departamento'] = int(digitos)
+            except ValueError as e:
+                errores.append({**linea, 'motivo': str(e)})
+                continue
+
+            if linea['monto'] <= 0:
+                errores.append({**linea, 'motivo': 'El monto no es un abono'})
+                continue
+            lineas.append(linea)
+
+        return lineas, errores
+
+    @staticmethod
+    def _cargar_pendientes():
+        """
+        Carga los pendientes en dos índices hash:
+        por referencia {(tipo, id): item} y por (departamento, monto) → cola
+        """
+        from collections import defaultdict, deque
+        from models.reservas_model import Reserva
+
+        por_referencia = {}
+        por_monto = defaultdict(deque)
+
+        cargos = db.session.query(
+            CargoMensual.id, CargoMensual.departamento, CargoMensual.mes,
+            CargoMensual.anio, CargoMensual.total
+        ).filter(
+            CargoMensual.pagado == False
+        ).order_by(CargoMensual.anio, CargoMensual.mes, CargoMensual.id).all()
+
+        for cargo_id, dept, mes, anio, total in cargos:
+            item = {
+                'tipo': 'cargo', 'id': cargo_id, 'objeto_id': cargo_id,
+                'departamento': dept, 'mes': mes, 'anio': anio,
+                'monto': Decimal(str(total or 0)).quantize(Decimal('0.01')),
+                'descripcion': f'Cargo {mes:02d}/{anio}', 'linea': None,
+            }
+            por_referencia[('cargo', cargo_id)] = item
+            por_monto[(dept, item['monto'])].append(item)
+
+        reservas = db.session.query(
+            PagoReserva.id, PagoReserva.reserva_id, Reserva.departamento,
+            Reserva.fecha, PagoReserva.monto
+        ).join(
+            Reserva, Reserva.id == PagoReserva.reserva_id
+        ).filter(
+            PagoReserva.pagado == False,
+            Reserva.estado != 'cancelada'
+        ).order_by(Reserva.fecha, PagoReserva.id).all()
+
+        for pago_id, reserva_id, dept, fecha, monto in reservas:
+            item = {
+                'tipo': 'reserva', 'id': pago_id, 'objeto_id': reserva_id,
+                'departamento': dept, 'fecha': fecha,
+                'monto': Decimal(str(monto or 0)).quantize(Decimal('0.01')),
+                'descripcion': f'Reserva #{reserva_id} ({fecha.strftime("%d/%m/%Y")})',
+                'linea': None,
+            }
+            por_referencia[('reserva', reserva_id)] = item
+            por_monto[(dept, item['monto'])].append(item)
+
+        return por_referencia, por_monto
+
+    @staticmethod
+    def _buscar(linea, por_referencia, por_monto):
+        """Retorna (item, regla) o (None, motivo)"""
+        texto = f"{linea['referencia']} {linea['descripcion']}"
+        referencias = ConciliacionBancaria.PATRON_REFERENCIA.findall(texto)
+
+        if referencias:
+            prefijo, numero = referencias[0]
+            tipo = 'cargo' if prefijo.upper() == 'CARGO' else 'reserva'
+            etiqueta = f'{prefijo.upper()}-{numero}'
+            item = por_referencia.get((tipo, int(numero)))
+            if not item:
+                return None, f'{etiqueta} no existe o ya está pagado'
+            if item['linea'] is not None:
+                return None, f'{etiqueta} ya se concilió en la línea {item["linea"]}'
+            if item['monto'] != linea['monto']:
+                return None, f'El monto no coincide con {etiqueta} (Bs. {item["monto"]:,.2f})'
+            if linea['departamento'] is not None and linea['departamento'] != item['departamento']:
+                return None, f'{etiqueta} pertenece al Dpto {item["departamento"]}'
+            return item, 'referencia'
+
+        if linea['departamento'] is None:
+            return None, 'Sin referencia ni departamento'
+
+        cola = por_monto.get((linea['departamento'], linea['monto']))
+        while cola:
+            item = cola.popleft()
+            if item['linea'] is None:
+                return item, 'departamento_monto'
+        return None, (f'Sin pendientes de Bs. {linea["monto"]:,.2f} '
+                      f'para el Dpto {linea["departamento"]}')
+
+    @staticmethod
+    def conciliar(lineas, aplicar=True, metodo_pago='transferencia'):
+        """
+        Concilia las líneas del extracto y, si aplicar es True, registra todos
+        los pagos en una sola transacción. Retorna (conciliadas, no_conciliadas).
+        """
+        por_referencia, por_monto = ConciliacionBancaria._cargar_pendientes()
+
+        conciliadas, no_conciliadas = [], []
+        for linea in lineas:
+            item, regla = ConciliacionBancaria._buscar(linea, por_referencia, por_monto)
+            if item is None:
+                no_conciliadas.append({**linea, 'motivo': regla})
+                continue
+            item['linea'] = linea['linea']
+            conciliadas.append({**linea, 'item': item, 'regla': regla})
+
+        if aplicar and conciliadas:
+            ConciliacionBancaria._aplicar(conciliadas, metodo_pago)
+
+        return conciliadas, no_conciliadas
+
+    @staticmethod
+    def _aplicar(conciliadas, metodo_pago):
+        """Marca los pendientes como pagados e inserta el historial en bloque"""
+        from sqlalchemy import bindparam, insert
+
+        ahora = datetime.utcnow()
+        cargos, reservas, historial = [], [], []
+        resumen = {}
+        saldos = {}
+
+        def acumular(clave, monto):
+            total, cantidad = resumen.get(clave, (Decimal('0'), 0))
+            resumen[clave] = (total + monto, cantidad + 1)
+
+        for c in conciliadas:
+            item = c['item']
+            fecha_pago = datetime.combine(c['fecha'], datetime.min.time()) if c['fecha'] else ahora
+            referencia = (c['referencia'] or f'Extracto línea {c["linea"]}')[:100]
+
+            if item['tipo'] == 'cargo':
+                cargos.append({'b_id': item['id'], 'b_fecha': fecha_pago.date()})
+                acumular(('cargos', item['mes'], item['anio']), item['monto'])
+                tipo_pago = 'cargo_mensual'
+                observaciones = f'Conciliación bancaria: cargo {item["mes"]:02d}/{item["anio"]}. Ref: {referencia}'
+            else:
+                reservas.append({'b_id': item['id'], 'b_fecha': fecha_pago, 'b_referencia': referencia})
+                acumular(('reservas', fecha_pago.month, fecha_pago.year), item['monto'])
+                tipo_pago = 'reserva'
+                observaciones = f'Conciliación bancaria: reserva #{item["objeto_id"]}. Ref: {referencia}'
+
+            acumular(('historial', fecha_pago.month, fecha_pago.year), item['monto'])
+            saldo = saldos.setdefault(item['departamento'], {
+                'departamento': item['departamento'], 'deuda': Decimal('0'),
+                'credito': Decimal('0'), 'pendientes': 0, 'fecha_pago': fecha_pago,
+            })
+            saldo['deuda'] -= item['monto']
+            saldo['credito'] += item['monto']
+            saldo['pendientes'] -= 1
+            saldo['fecha_pago'] = max(saldo['fecha_pago'], fecha_pago)
+            historial.append({
+                'tipo_pago': tipo_pago,
+                'objeto_id': item['objeto_id'],
+                'departamento': item['departamento'],
+                'monto': item['monto'],
+                'metodo_pago': metodo_pago,
+                'fecha_pago': fecha_pago,
+                'observaciones': observaciones,
+            })
+
+        tabla_cargos = CargoMensual.__table__
+        tabla_reservas = PagoReserva.__table__
+        try:
+            if cargos:
+                resultado = db.session.execute(
+                    tabla_cargos.update()
+                    .where(tabla_cargos.c.id == bindparam('b_id'))
+                    .where(tabla_cargos.c.pagado == False)
+                    .values(pagado=True, fecha_pago=bindparam('b_fecha')),
+                    cargos
+                )
+                if resultado.rowcount != len(cargos):
+                    raise ValueError('Algunos cargos fueron pagados mientras se conciliaba')
+
+            if reservas:
+                resultado = db.session.execute(
+                    tabla_reservas.update()
+                    .where(tabla_reservas.c.id == bindparam('b_id'))
+                    .where(tabla_reservas.c.pagado == False)
+                    .values(pagado=True, fecha_pago=bindparam('b_fecha'),
+                            metodo_pago=metodo_pago, referencia=bindparam('b_referencia')),
+                    reservas
+                )
+                if resultado.rowcount != len(reservas):
+                    raise ValueError('Algunas reservas fueron pagadas mientras se conciliaba')
+
+            db.session.execute(insert(HistorialPago), historial)
+
+            for (tipo, mes, anio), (monto, cantidad) in resumen.items():
+                ResumenMensual.registrar(tipo, mes, anio, monto, cantidad)
+            SaldoDepartamento.registrar_lote(list(saldos.values()))
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+# ============================================================================
+# PAGOS EN LOTE
+# ============================================================================
+
+class PagosLote:
+    """
+    Registro de uno o varios pagos (cargos y reservas) en una sola transacción.
+    Cada tabla se actualiza con un UPDATE ... WHERE id IN (...) AND pagado = 0
+    RETURNING: solo los pagos que esta operación cambió de estado generan
+    historial, así dos solicitudes concurrentes (doble clic, reintentos,
+    varios workers) nunca registran el mismo pago. Con una clave de
+    idempotencia el reintento recibe además el resultado original.
+    """
+
+    TIPOS = ('cargo', 'reserva')
+
+    @staticmethod
+    def pagar(items, metodo_pago='efectivo', referencia=None, observaciones=None,
+              clave=None, usuario_id=None):
+        """
+        items: lista de (tipo, id) con tipo 'cargo' o 'reserva' (id del PagoReserva)
+        Retorna la lista de resultados en el orden recibido; el estado de cada
+        ítem es 'pagado', 'ya_pagado' o 'no_encontrado'. Si la clave ya se
+        procesó, los resultados guardados se retornan con 'repetido': True.
+        """
+        from sqlalchemy import insert
+        from models.reservas_model import Reserva
+
+        if clave is not None and not 0 < len(clave) <= 100:
+            raise ValueError('Clave de idempotencia no válida')
+
+        ahora = datetime.utcnow()
+        referencia = (referencia or '').strip()[:100] or None
+        nota = f'. Ref: {referencia}' if referencia else ''
+
+        # Ítems únicos conservando el orden
+        resultados = {}
+        for tipo, item_id in items:
+            if tipo not in PagosLote.TIPOS:
+                raise ValueError(f'Tipo de pago no válido: {tipo!r}')
+            resultados.setdefault((tipo, int(item_id)), {
+                'tipo': tipo, 'id': int(item_id), 'estado': 'no_encontrado',
+                'departamento': None, 'monto': None,
+            })
+        ids = {tipo: [i for t, i in resultados if t == tipo] for tipo in PagosLote.TIPOS}
+
+        historial, saldos, resumen = [], {}, {}
+
+        def acumular(clave, monto):
+            total, cantidad = resumen.get(clave, (Decimal('0'), 0))
+            resumen[clave] = (total + monto, cantidad + 1)
+
+        def registrar(tipo, item_id, departamento, monto, tipo_pago, objeto_id, detalle, deuda=True):
+            monto = Decimal(str(monto)).quantize(Decimal('0.01'))
+            resultados[(tipo, item_id)].update(estado='pagado', departamento=departamento,
+                                               monto=monto)
+            acumular(('historial', ahora.month, ahora.year), monto)
+            historial.append({
+                'tipo_pago': tipo_pago,
+                'objeto_id': objeto_id,
+                'departamento': departamento,
+                'monto': monto,
+                'metodo_pago': metodo_pago,
+                'fecha_pago': ahora,
+                'observaciones': (observaciones or 'Pago en lote') + f': {detalle}{nota}',
+            })
+            saldo = saldos.setdefault(departamento, {
+                'departamento': departamento, 'deuda': Decimal('0'), 'credito': Decimal('0'),
+                'pendientes': 0, 'fecha_pago': ahora,
+            })
+            saldo['credito'] += monto
+            if deuda:
+                saldo['deuda'] -= monto
+                saldo['pendientes'] -= 1
+
+        tabla_cargos = CargoMensual.__table__
+        tabla_reservas = PagoReserva.__table__
+        try:
+            if clave:
+                previos = ClaveIdempotencia.reclamar(
+                    clave, ClaveIdempotencia.calcular_huella(resultados, usuario_id), usuario_id
+                )
+                if previos is not None:
+                    db.session.rollback()
+                    return [{**r, 'repetido': True} for r in previos]
+
+            if ids['cargo']:
+                pagados = db.session.execute(
+                    tabla_cargos.update()
+                    .where(tabla_cargos.c.id.in_(ids['cargo']), tabla_cargos.c.pagado == False)
+                    .values(pagado=True, fecha_pago=ahora.date())
+                    .returning(tabla_cargos.c.id, tabla_cargos.c.departamento,
+                               tabla_cargos.c.mes, tabla_cargos.c.anio, CargoMensual.total)
+                ).all()
+                for cargo_id, departamento, mes, anio, total in pagados:
+                    acumular(('cargos', mes, anio), Decimal(str(total)))
+                    registrar('cargo', cargo_id, departamento, total, 'cargo_mensual', cargo_id,
+                              f'cargo {mes:02d}/{anio}')
+
+            if ids['reserva']:
+                pagados = db.session.execute(
+                    tabla_reservas.update()
+                    .where(tabla_reservas.c.id.in_(ids['reserva']), tabla_reservas.c.pagado == False)
+                    .values(pagado=True, fecha_pago=ahora, metodo_pago=metodo_pago,
+                            referencia=referencia)
+                    .returning(tabla_reservas.c.id, tabla_reservas.c.reserva_id,
+                               tabla_reservas.c.monto)
+                ).all()
+                reservas = {
+                    r.id: r for r in db.session.query(
+                        Reserva.id, Reserva.departamento, Reserva.estado, Reserva.fecha
+                    ).filter(Reserva.id.in_([fila.reserva_id for fila in pagados])).all()
+                } if pagados else {}
+                for pago_id, reserva_id, monto in pagados:
+                    reserva = reservas.get(reserva_id)
+                    acumular(('reservas', ahora.month, ahora.year), Decimal(str(monto)))
+                    registrar('reserva', pago_id, reserva.departamento if reserva else 0, monto,
+                              'reserva', reserva_id, f'reserva #{reserva_id}',
+                              deuda=bool(reserva) and reserva.estado != 'cancelada')
+
+            # Los que no se actualizaron: ya pagados o inexistentes
+            for tipo, modelo in (('cargo', CargoMensual), ('reserva', PagoReserva)):
+                faltantes = [i for i in ids[tipo] if resultados[(tipo, i)]['estado'] != 'pagado']
+                if faltantes:
+                    for (item_id,) in db.session.query(modelo.id).filter(modelo.id.in_(faltantes)):
+                        resultados[(tipo, item_id)]['estado'] = 'ya_pagado'
+
+            if historial:
+                db.session.execute(insert(HistorialPago), historial)
+                for (tipo, mes, anio), (monto, cantidad) in resumen.items():
+                    ResumenMensual.registrar(tipo, mes, anio, monto, cantidad)
+                SaldoDepartamento.registrar_lote(list(saldos.values()))
+            if clave:
+                ClaveIdempotencia.guardar_resultado(clave, list(resultados.values()))
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return list(resultados.values())
+
+
+# ============================================================================
+# LECTURAS DE MEDIDORES
+# ============================================================================
+
+class LecturasMedidores:
+    """
+    Importación de lecturas de medidores (CSV) para calcular luz, agua y gas.
+    Los consumos y montos de todo el archivo se calculan en bloque con NumPy
+    y los cargos del mes se insertan o actualizan con un UPSERT en una sola
+    transacción. Los cargos ya pagados no se modifican.
+    """
+
+    SERVICIOS = ('luz', 'agua', 'gas')
+
+    # Tarifa por unidad consumida (Bs/kWh para luz, Bs/m³ para agua y gas)
+    TARIFAS_CONSUMO = {
+        'luz': 1.10,
+        'agua': 6.50,
+        'gas': 3.20,
+    }
+
+    COLUMNAS_DEPARTAMENTO = ('departamento', 'dpto', 'depto')
+
+    @staticmethod
+    def _leer_numero(valor):
+        """Interpreta lecturas como '1234.5' o '1.234,5'; vacío retorna NaN"""
+        texto = re.sub(r'[^\d,.\-]', '', valor or '')
+        if not texto:
+            if (valor or '').strip():
+                raise ValueError(f'Valor no válido: {valor!r}')
+            return float('nan')
+        if ',' in texto and '.' in texto:
+            if texto.rfind(',') > texto.rfind('.'):
+                texto = texto.replace('.', '').replace(',', '.')
+            else:
+                texto = texto.replace(',', '')
+        elif ',' in texto:
+            texto = texto.replace(',', '.')
+        try:
+            return float(texto)
+        except ValueError:
+            raise ValueError(f'Valor no válido: {valor!r}')
+
+    @staticmethod
+    def leer_csv(flujo):
+        """
+        Lee las lecturas desde un flujo de texto.
+        Columnas: departamento y, por servicio, <servicio>_anterior y
+        <servicio>_actual o <servicio>_consumo; opcionalmente tarifa_<servicio>.
+        Retorna (datos, errores): datos tiene arreglos NumPy alineados por fila.
+        """
+        import csv
+
+        lector = csv.reader(flujo)
+        encabezado = next(lector, None)
+        if not encabezado:
+            raise ValueError('El archivo está vacío')
+
+        nombres = [ConciliacionBancaria._normalizar(c).replace(' ', '_') for c in encabezado]
+        posicion = {nombre: i for i, nombre in reversed(list(enumerate(nombres)))}
+
+        columna_departamento = next(
+            (posicion[n] for n in LecturasMedidores.COLUMNAS_DEPARTAMENTO if n in posicion), None
+        )
+        if columna_departamento is None:
+            raise ValueError('El archivo no tiene columna de departamento')
+
+        # Por servicio: columnas de lectura anterior, actual, consumo y tarifa
+        columnas = {}
+        for servicio in LecturasMedidores.SERVICIOS:
+            anterior = posicion.get(f'{servicio}_anterior')
+            actual = posicion.get(f'{servicio}_actual')
+            consumo = posicion.get(f'{servicio}_consumo')
+            if consumo is None and (anterior is None) != (actual is None):
+                raise ValueError(f'Faltan las lecturas anterior y actual de {servicio}')
+            if consumo is None and anterior is None:
+                continue
+            columnas[servicio] = {
+                'anterior': anterior, 'actual': actual, 'consumo': consumo,
+                'tarifa': posicion.get(f'tarifa_{servicio}'),
+            }
+        if not columnas:
+            raise ValueError('El archivo no tiene lecturas de luz, agua ni gas')
+
+        lineas, departamentos, errores = [], [], []
+        valores = {servicio: {campo: [] for campo in ('anterior', 'actual', 'consumo', 'tarifa')}
+                   for servicio in columnas}
+
+        for numero, fila in enumerate(lector, start=2):
+            if not any(celda.strip() for celda in fila):
+                continue
+
+            def celda(i):
+                return fila[i].strip() if i is not None and i < len(fila) else ''
+
+            texto_departamento = celda(columna_departamento)
+            try:
+                digitos = re.sub(r'\D', '', texto_departamento)
+                if not digitos:
+                    raise ValueError(f'Departamento no válido: {texto_departamento!r}')
+                departamento = int(digitos)
+                leidos = {
+                    servicio: {campo: LecturasMedidores._leer_numero(celda(i))
+                               for campo, i in posiciones.items()}
+                    for servicio, posiciones in columnas.items()
+                }
+            except ValueError as e:
+                errores.append({'linea': numero, 'departamento': texto_departamento or None,
+                                'motivo': str(e)})
+                continue
+
+            lineas.append(numero)
+            departamentos.append(departamento)
+            for servicio, campos in leidos.items():
+                for campo, valor in campos.items():
+                    valores[servicio][campo].append(valor)
+
+        datos = {
+            'lineas': np.array(lineas, dtype=np.int64),
+            'departamentos': np.array(departamentos, dtype=np.int64),
+            'servicios': {
+                servicio: {campo: np.array(lista, dtype=float) for campo, lista in campos.items()}
+                for servicio, campos in valores.items()
+            },
+        }
+        return datos, errores
+
+    @staticmethod
+    def calcular(datos, tarifas=None):
+        """
+        Calcula consumos y montos de todas las filas a la vez.
+        Retorna (montos, valida, motivos): montos {servicio: arreglo}, la máscara
+        de filas válidas y los motivos de error por índice de fila.
+        """
+        tarifas_base = dict(LecturasMedidores.TARIFAS_CONSUMO)
+        tarifas_base.update({k: v for k, v in (tarifas or {}).items() if v is not None})
+
+        cantidad = len(datos['lineas'])
+        valida = np.ones(cantidad, dtype=bool)
+        motivos = {}
+
+        def marcar(mascara, motivo):
+            for i in np.flatnonzero(mascara & valida):
+                motivos[int(i)] = motivo
+            valida[mascara] = False
+
+        # Departamentos repetidos: vale la primera aparición
+        _, primeras = np.unique(datos['departamentos'], return_index=True)
+        repetida = np.ones(cantidad, dtype=bool)
+        repetida[primeras] = False
+        marcar(repetida, 'Departamento repetido en el archivo')
+
+        montos = {}
+        for servicio, columnas in datos['servicios'].items():
+            consumo = np.where(np.isnan(columnas['consumo']),
+                               columnas['actual'] - columnas['anterior'],
+                               columnas['consumo'])
+            tarifa = np.where(np.isnan(columnas['tarifa']),
+                              tarifas_base[servicio], columnas['tarifa'])
+
+            marcar(np.isnan(consumo), f'Falta la lectura de {servicio}')
+            marcar(consumo < 0, f'La lectura actual de {servicio} es menor que la anterior')
+            marcar(tarifa < 0, f'Tarifa de {servicio} no válida')
+
+            montos[servicio] = np.round(np.nan_to_num(consumo) * tarifa, 2)
+
+        return montos, valida, motivos
+
+    @staticmethod
+    def importar(datos, mes, anio, tarifas=None, aplicar=True):
+        """
+        Calcula los servicios y, si aplicar es True, inserta o actualiza los
+        cargos del mes en una transacción. Retorna un dict con las filas
+        calculadas, los errores por línea y las cantidades creadas/actualizadas.
+        """
+        from sqlalchemy.dialects.sqlite import insert
+        from models.user_model import User
+
+        montos, valida, motivos = LecturasMedidores.calcular(datos, tarifas)
+        lineas = datos['lineas']
+        departamentos = datos['departamentos']
+        servicios = list(montos)
+
+        # Estado actual de los cargos del mes (una consulta por el índice único)
+        # y departamentos con residentes registrados, como en generar_cargos_mes
+        existentes, registrados = {}, set()
+        if valida.any():
+            leidos = departamentos[valida].tolist()
+            existentes = dict(db.session.query(
+                CargoMensual.departamento, CargoMensual.pagado
+            ).filter(
+                CargoMensual.departamento.in_(leidos),
+                CargoMensual.mes == mes,
+                CargoMensual.anio == anio
+            ).all())
+            registrados = {dept for (dept,) in db.session.query(User.departamento).filter(
+                User.departamento.in_(leidos)
+            ).distinct()}
+
+        errores, filas = [], []
+        for i in range(len(lineas)):
+            departamento = int(departamentos[i])
+            if not valida[i]:
+                errores.append({'linea': int(lineas[i]), 'departamento': departamento,
+                                'motivo': motivos[i]})
+                continue
+            if departamento not in existentes and departamento not in registrados:
+                errores.append({'linea': int(lineas[i]), 'departamento': departamento,
+                                'motivo': 'El departamento no tiene residentes registrados'})
+                continue
+            if existentes.get(departamento):
+                errores.append({'linea': int(lineas[i]), 'departamento': departamento,
+                                'motivo': f'El cargo {mes:02d}/{anio} ya está pagado'})
+                continue
+            filas.append({
+                'linea': int(lineas[i]),
+                'departamento': departamento,
+                'nuevo': departamento not in existentes,
+                **{servicio: Decimal(f'{montos[servicio][i]:.2f}') for servicio in servicios},
+            })
+
+        resultado = {
+            'filas': filas,
+            'errores': errores,
+            'servicios': servicios,
+            'creados': sum(1 for f in filas if f['nuevo']),
+            'actualizados': sum(1 for f in filas if not f['nuevo']),
+        }
+        if not aplicar or not filas:
+            return resultado
+
+        # Los cargos nuevos toman las tarifas fijas por defecto para el resto
+        # de los conceptos; los existentes solo cambian los servicios leídos
+        base = {campo: Decimal(str(valor)) for campo, valor in TARIFAS_DEFAULT.items()}
+        base.update({
+            'mes': mes,
+            'anio': anio,
+            'pagado': False,
+            'fecha_generacion': datetime.utcnow(),
+            'fecha_vencimiento': calcular_fecha_vencimiento(mes, anio),
+        })
+
+        tabla = CargoMensual.__table__
+        stmt = insert(tabla)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['departamento', 'mes', 'anio'],
+            set_={servicio: stmt.excluded[servicio] for servicio in servicios},
+            where=tabla.c.pagado == False
+        )
+        try:
+            db.session.execute(stmt, [
+                dict(base, departamento=f['departamento'],
+                     **{servicio: f[servicio] for servicio in servicios})
+                for f in filas
+            ])
+            SaldoDepartamento.recalcular([f['departamento'] for f in filas])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return resultado
+
+
+# ============================================================================
+# RECARGOS POR MORA
+# ============================================================================
+
+# Parámetros por defecto del cálculo de mora
+CONFIG_MORA = {
+    'tasa_diaria': 0.0005,      # 0,05 % del cargo por día de mora
+    'tasa_mensual': 0.0,        # % del cargo por mes (o fracción) de mora
+    'dias_gracia': 5,           # Días después del vencimiento sin recargo
+    'tope': 0.20,               # Recargo máximo como fracción del cargo (None = sin tope)
+}
+
+
+class CalculoMora:
+    """
+    Cálculo nocturno de recargos por mora de los cargos vencidos.
+    Todo se resuelve en SQL sobre el índice (pagado, fecha_vencimiento):
+    un INSERT ... SELECT registra la auditoría del día y un UPSERT ... SELECT
+    actualiza el recargo vigente de cada cargo. Volver a ejecutarlo el mismo
+    día no cambia nada: la auditoría es única por (cargo, fecha) y el recargo
+    vigente se copia de ella.
+    """
+
+    @staticmethod
+    def _recargo(base, dias, config):
+        """Expresión SQL del recargo para un monto base y días vencido"""
+        from sqlalchemy import func
+
+        dias_mora = dias - config['dias_gracia']
+        meses_mora = (dias_mora + 29) // 30         # Meses completos, la fracción cuenta como mes
+
+        recargo = base * (config['tasa_diaria'] * dias_mora +
+                          config['tasa_mensual'] * meses_mora)
+        if config.get('tope') is not None:
+            recargo = func.min(recargo, base * config['tope'])
+        return func.round(recargo, 2)
+
+    @staticmethod
+    def _expresiones(fecha, config):
+        """Expresiones SQL de (días vencido, monto base, recargo) de cada cargo"""
+        from sqlalchemy import func, cast, literal
+
+        dias = cast(
+            func.julianday(literal(fecha.isoformat())) -
+            func.julianday(CargoMensual.fecha_vencimiento),
+            db.Integer
+        )
+        base = CargoMensual.total
+        return dias, base, CalculoMora._recargo(base, dias, config)
+
+    @staticmethod
+    def _otros_parametros(fecha, config):
+        """
+        Cantidad de filas de la auditoría del día calculadas con otros
+        parámetros: tasas o días de gracia distintos, o un recargo que no
+        coincide al recalcularlo con config (así se detecta también el tope,
+        que no se guarda en la auditoría).
+        """
+        from sqlalchemy import func, or_
+
+        return db.session.query(func.count(AuditoriaMora.id)).filter(
+            AuditoriaMora.fecha == fecha,
+            or_(
+                AuditoriaMora.tasa_diaria != config['tasa_diaria'],
+                AuditoriaMora.tasa_mensual != config['tasa_mensual'],
+                AuditoriaMora.dias_gracia != config['dias_gracia'],
+                AuditoriaMora.recargo != CalculoMora._recargo(
+                    AuditoriaMora.monto_base, AuditoriaMora.dias_vencido, config
+                ),
+            )
+        ).scalar()
+
+    @staticmethod
+    def ejecutar(fecha=None, **parametros):
+        """
+        Calcula los recargos a la fecha (por defecto hoy) y los guarda en una
+        transacción. Los parámetros reemplazan a CONFIG_MORA.
+        Lanza ValueError si la mora de esa fecha ya se calculó con otros
+        parámetros: la auditoría del día no mezcla configuraciones.
+        Retorna un resumen con la cantidad de cargos y los montos del día.
+        """
+        from sqlalchemy import select, func, literal
+        from sqlalchemy.dialects.sqlite import insert
+        from datetime import timedelta
+
+        fecha = fecha or date.today()
+        config = dict(CONFIG_MORA)
+        config.update({k: v for k, v in parametros.items() if v is not None})
+        for campo in ('tasa_diaria', 'tasa_mensual', 'dias_gracia'):
+            if config[campo] < 0:
+                raise ValueError(f'{campo} no puede ser negativo')
+
+        dias, base, recargo = CalculoMora._expresiones(fecha, config)
+        limite = fecha - timedelta(days=config['dias_gracia'])
+
+        # Auditoría del día: una fila por cargo vencido; las repetidas se ignoran
+        origen = select(
+            CargoMensual.id, CargoMensual.departamento, literal(fecha), dias, base,
+            literal(config['tasa_diaria']), literal(config['tasa_mensual']),
+            literal(config['dias_gracia']),
+            func.coalesce(RecargoMora.monto, 0), recargo, literal(datetime.utcnow())
+        ).outerjoin(
+            RecargoMora, RecargoMora.cargo_id == CargoMensual.id
+        ).where(
+            CargoMensual.pagado == False,
+            CargoMensual.fecha_vencimiento < limite
+        )
+        auditoria = insert(AuditoriaMora.__table__).prefix_with('OR IGNORE').from_select(
+            ['cargo_id', 'departamento', 'fecha', 'dias_vencido', 'monto_base',
+             'tasa_diaria', 'tasa_mensual', 'dias_gracia',
+             'recargo_anterior', 'recargo', 'ejecutado_en'],
+            origen
+        )
+
+        # Recargo vigente = el de la auditoría del día
+        tabla = RecargoMora.__table__
+        vigente = insert(tabla).from_select(
+            ['cargo_id', 'departamento', 'monto', 'dias_vencido', 'fecha_calculo'],
+            select(
+                AuditoriaMora.cargo_id, AuditoriaMora.departamento, AuditoriaMora.recargo,
+                AuditoriaMora.dias_vencido, AuditoriaMora.fecha
+            ).where(AuditoriaMora.fecha == fecha)
+        )
+        vigente = vigente.on_conflict_do_update(
+            index_elements=['cargo_id'],
+            set_={
+                'monto': vigente.excluded.monto,
+                'dias_vencido': vigente.excluded.dias_vencido,
+                'fecha_calculo': vigente.excluded.fecha_calculo,
+            },
+            where=tabla.c.fecha_calculo <= vigente.excluded.fecha_calculo
+        )
+
+        try:
+            if CalculoMora._otros_parametros(fecha, config):
+                raise ValueError(
+                    f"La mora del {fecha.strftime('%d/%m/%Y')} ya se calculó con otros "
+                    f"parámetros; no se puede recalcular el mismo día con una configuración distinta"
+                )
+            nuevos = db.session.execute(auditoria).rowcount
+            db.session.execute(vigente)
+            cantidad, total, incremento = db.session.query(
+                func.count(AuditoriaMora.id),
+                func.sum(AuditoriaMora.recargo),
+                func.sum(AuditoriaMora.recargo - AuditoriaMora.recargo_anterior)
+            ).filter(AuditoriaMora.fecha == fecha).one()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {
+            'fecha': fecha,
+            'cargos': int(cantidad or 0),
+            'nuevos': nuevos,
+            'ya_calculado': nuevos == 0 and bool(cantidad),
+            'total_recargos': Decimal(str(total or 0)).quantize(Decimal('0.01')),
+            'incremento': Decimal(str(incremento or 0)).quantize(Decimal('0.01')),
+            'config': config,
+        }
+
+
+# ============================================================================
+# EXPORTACIÓN POR LOTES
+# ============================================================================
+
+def iterar_por_lotes(query, columna_id, tamano_lote=1000):
+    """
+    Recorre una consulta por lotes con paginación keyset sobre columna_id.
+    La consulta debe seleccionar columna_id como primera columna.
+    Cada lote es una lista de tuplas; nunca se carga la tabla completa.
+    """
+    ultimo_id = None
+    while True:
+        lote_query = query
+        if ultimo_id is not None:
+            lote_query = lote_query.filter(columna_id > ultimo_id)
+        filas = lote_query.order_by(columna_id).limit(tamano_lote).all()
+        if not filas:
+            return
+        yield filas
+        if len(filas) < tamano_lote:
+            return
+        ultimo_id = filas[-1][0]
+
+
+def consulta_exportacion(tabla, desde=None, hasta=None, departamento=None, categoria=None):
+    """
+    Construye la consulta de exportación de una tabla financiera.
+    Retorna (encabezados, query, columna_id) o None si la tabla no es exportable.
+    Filtros: rango de fechas (inclusive), departamento y categoría
+    (tipo de pago en el historial, categoría en gastos).
+    """
+    from datetime import timedelta
+
+    if tabla == 'historial_pagos':
+        encabezados = ['id', 'fecha_pago', 'tipo_pago', 'objeto_id', 'departamento',
+                       'monto', 'metodo_pago', 'observaciones']
+        query = db.session.query(
+            HistorialPago.id, HistorialPago.fecha_pago, HistorialPago.tipo_pago,
+            HistorialPago.objeto_id, HistorialPago.departamento, HistorialPago.monto,
+            HistorialPago.metodo_pago, HistorialPago.observaciones
+        )
+        if desde:
+            query = query.filter(HistorialPago.fecha_pago >= datetime.combine(desde, datetime.min.time()))
+        if hasta:
+            query = query.filter(HistorialPago.fecha_pago < datetime.combine(
+                hasta + timedelta(days=1), datetime.min.time()))
+        if departamento is not None:
+            query = query.filter(HistorialPago.departamento == departamento)
+        if categoria:
+            query = query.filter(HistorialPago.tipo_pago == categoria)
+        return encabezados, query, HistorialPago.id
+
+    if tabla == 'cargos_mensuales':
+        encabezados = ['id', 'departamento', 'mes', 'anio', 'luz', 'agua', 'gas',
+                       'mantenimiento', 'expensas_comunes', 'total', 'pagado',
+                       'fecha_pago', 'fecha_vencimiento']
+        query = db.session.query(
+            CargoMensual.id, CargoMensual.departamento, CargoMensual.mes, CargoMensual.anio,
+            CargoMensual.luz, CargoMensual.agua, CargoMensual.gas,
+            CargoMensual.mantenimiento, CargoMensual.expensas_comunes,
+            CargoMensual.total, CargoMensual.pagado,
+            CargoMensual.fecha_pago, CargoMensual.fecha_vencimiento
+        )
+        periodo = CargoMensual.anio * 12 + CargoMensual.mes
+        if desde:
+            query = query.filter(periodo >= desde.year * 12 + desde.month)
+        if hasta:
+            query = query.filter(periodo <= hasta.year * 12 + hasta.month)
+        if departamento is not None:
+            query = query.filter(CargoMensual.departamento == departamento)
+        return encabezados, query, CargoMensual.id
+
+    if tabla == 'gastos':
+        encabezados = ['id', 'fecha_gasto', 'concepto', 'categoria', 'monto',
+                       'descripcion', 'registrado_por']
+        query = db.session.query(
+            GastoEdificio.id, GastoEdificio.fecha_gasto, GastoEdificio.concepto,
+            GastoEdificio.categoria, GastoEdificio.monto,
+            GastoEdificio.descripcion, GastoEdificio.registrado_por
+        )
+        if desde:
+            query = query.filter(GastoEdificio.fecha_gasto >= desde)
+        if hasta:
+            query = query.filter(GastoEdificio.fecha_gasto <= hasta)
+        if categoria:
+            query = query.filter(GastoEdificio.categoria == categoria)
+        return encabezados, query, GastoEdificio.id
+
+    return None
+
+
+# ============================================================================
+# SERIES FINANCIERAS
+# ============================================================================
+
+class SeriesFinancieras:
+    """
+    Series mensuales de ingresos, gastos, balance y morosidad.
+    Los meses terminados se guardan en cache_finanzas (una entrada por mes);
+    solo los meses que faltan se leen con una consulta agrupada sobre
+    resumen_mensual y cargos_mensuales. Los promedios móviles y la proyección
+    lineal se calculan sobre arreglos de NumPy.
+    """
+
+    # Los meses terminados solo cambian con pagos atrasados o ajustes, que
+    # invalidan su entrada; el TTL es un límite de seguridad
+    TTL_MES_TERMINADO = 24 * 3600
+
+    # Meses terminados usados para ajustar la recta de la proyección
+    MESES_AJUSTE = 12
+
+    # Columnas de cada mes: cargos, reservas, gastos, cargos emitidos, cargos impagos
+    COLUMNAS = 5
+
+    @staticmethod
+    def periodos(anio_desde, anio_hasta):
+        """Lista de (anio, mes) de enero de anio_desde a diciembre de anio_hasta"""
+        return [(anio, mes) for anio in range(anio_desde, anio_hasta + 1)
+                for mes in range(1, 13)]
+
+    @staticmethod
+    def _consultar(desde, hasta):
+        """
+        Totales de los meses entre desde y hasta (tuplas (anio, mes), inclusive)
+        Retorna {(anio, mes): [cargos, reservas, gastos, emitidos, impagos]}
+        """
+        from sqlalchemy import select, func, case, literal, tuple_, union_all
+
+        def suma_tipo(tipo):
+            return func.sum(case((ResumenMensual.tipo == tipo, ResumenMensual.total), else_=0))
+
+        periodo = tuple_(ResumenMensual.anio, ResumenMensual.mes)
+        resumen = select(
+            ResumenMensual.anio, ResumenMensual.mes,
+            suma_tipo('cargos'), suma_tipo('reservas'), suma_tipo('gastos'),
+            literal(0), literal(0)
+        ).where(periodo >= desde, periodo <= hasta).group_by(
+            ResumenMensual.anio, ResumenMensual.mes
+        )
+
+        periodo = tuple_(CargoMensual.anio, CargoMensual.mes)
+        cargos = select(
+            CargoMensual.anio, CargoMensual.mes,
+            literal(0), literal(0), literal(0),
+            func.count(CargoMensual.id),
+            func.sum(case((CargoMensual.pagado == False, 1), else_=0))
+        ).where(periodo >= desde, periodo <= hasta).group_by(
+            CargoMensual.anio, CargoMensual.mes
+        )
+
+        datos = {}
+        for anio, mes, *valores in db.session.execute(union_all(resumen, cargos)):
+            fila = datos.setdefault((anio, mes), [0.0] * SeriesFinancieras.COLUMNAS)
+            for i, valor in enumerate(valores):
+                fila[i] += float(valor or 0)
+        return datos
+
+    @staticmethod
+    def matriz(periodos, hoy=None):
+        """
+        Matriz NumPy (len(periodos) x COLUMNAS) con los totales de cada mes
+        Los meses terminados salen de la caché cuando están disponibles.
+        """
+        hoy = hoy or date.today()
+        actual = (hoy.year, hoy.month)
+        generacion = cache_finanzas.generacion
+        filas = {}
+        faltantes = []
+        for periodo in periodos:
+            fila = None
+            if periodo < actual:
+                fila = cache_finanzas.obtener(('serie_mes',) + periodo)
+            if fila is None:
+                faltantes.append(periodo)
+            else:
+                filas[periodo] = fila
+
+        if faltantes:
+            datos = SeriesFinancieras._consultar(min(faltantes), max(faltantes))
+            vacia = [0.0] * SeriesFinancieras.COLUMNAS
+            for periodo in faltantes:
+                fila = datos.get(periodo, vacia)
+                filas[periodo] = fila
+                if periodo < actual:
+                    cache_finanzas.guardar(
+                        ('serie_mes',) + periodo, fila,
+                        etiquetas=[etiqueta_mes(periodo[1], periodo[0]), 'cargos_emitidos'],
+                        ttl=SeriesFinancieras.TTL_MES_TERMINADO,
+                        generacion=generacion
+                    )
+
+        return np.array([filas[periodo] for periodo in periodos],
+                        dtype=float).reshape(len(periodos), SeriesFinancieras.COLUMNAS)
+
+    @staticmethod
+    def promedio_movil(valores, ventana):
+        """Promedio de los últimos `ventana` meses; None mientras no haya suficientes"""
+        if ventana <= 1:
+            return np.round(valores, 2).tolist()
+        if len(valores) < ventana:
+            return [None] * len(valores)
+        acumulado = np.cumsum(np.concatenate(([0.0], valores)))
+        medias = (acumulado[ventana:] - acumulado[:-ventana]) / ventana
+        return [None] * (ventana - 1) + np.round(medias, 2).tolist()
+
+    @staticmethod
+    def proyectar(valores, meses):
+        """
+        Proyección lineal (mínimos cuadrados) de los próximos meses
+        a partir de los últimos MESES_AJUSTE valores
+        """
+        valores = valores[-SeriesFinancieras.MESES_AJUSTE:]
+        if meses <= 0 or len(valores) == 0:
+            return np.zeros(max(meses, 0))
+        if len(valores) == 1:
+            return np.full(meses, valores[0])
+        x = np.arange(len(valores))
+        pendiente, intercepto = np.polyfit(x, valores, 1)
+        return intercepto + pendiente * np.arange(len(valores), len(valores) + meses)
+
+    @staticmethod
+    def calcular(anio_desde, anio_hasta, ventana=3, meses_proyeccion=3, hoy=None):
+        """
+        Series mensuales del rango de años con promedios móviles y proyección
+        La proyección usa solo meses terminados y empieza en el mes siguiente
+        al último mes terminado del rango.
+        """
+        hoy = hoy or date.today()
+        actual = (hoy.year, hoy.month)
+        periodos = SeriesFinancieras.periodos(anio_desde, anio_hasta)
+        matriz = SeriesFinancieras.matriz(periodos, hoy)
+
+        ingresos = matriz[:, 0] + matriz[:, 1]
+        gastos = matriz[:, 2]
+        balance = ingresos - gastos
+        emitidos = matriz[:, 3]
+        impagos = matriz[:, 4]
+        morosidad = np.divide(impagos, emitidos, out=np.zeros_like(impagos),
+                              where=emitidos > 0) * 100
+
+        # Proyección desde los meses terminados
+        terminados = sum(1 for periodo in periodos if periodo < actual)
+        proyeccion_ingresos = np.clip(
+            SeriesFinancieras.proyectar(ingresos[:terminados], meses_proyeccion), 0, None)
+        proyeccion_gastos = np.clip(
+            SeriesFinancieras.proyectar(gastos[:terminados], meses_proyeccion), 0, None)
+        proyeccion_morosidad = np.clip(
+            SeriesFinancieras.proyectar(morosidad[:terminados], meses_proyeccion), 0, 100)
+
+        anio, mes = periodos[terminados - 1] if terminados else (anio_desde, 0)
+        periodos_proyeccion = []
+        for _ in range(meses_proyeccion):
+            anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+            periodos_proyeccion.append(f'{anio}-{mes:02d}')
+
+        def lista(valores):
+            return np.round(valores, 2).tolist()
+
+        return {
+            'anio_desde': anio_desde,
+            'anio_hasta': anio_hasta,
+            'ventana': ventana,
+            'periodos': [f'{anio}-{mes:02d}' for anio, mes in periodos],
+            'ingresos': lista(ingresos),
+            'gastos': lista(gastos),
+            'balance': lista(balance),
+            'morosidad': lista(morosidad),
+            'promedio_movil': {
+                'ingresos': SeriesFinancieras.promedio_movil(ingresos, ventana),
+                'gastos': SeriesFinancieras.promedio_movil(gastos, ventana),
+                'balance': SeriesFinancieras.promedio_movil(balance, ventana),
+                'morosidad': SeriesFinancieras.promedio_movil(morosidad, ventana),
+            },
+            'proyeccion': {
+                'periodos': periodos_proyeccion,
+                'ingresos': lista(proyeccion_ingresos),
+                'gastos': lista(proyeccion_gastos),
+                'balance': lista(proyeccion_ingresos - proyeccion_gastos),
+                'morosidad': lista(proyeccion_morosidad),
+            },
+        }
+
+    @staticmethod
+    def ingreso_proyectado(mes, anio):
+        """
+        Ingreso esperado del mes según la tendencia de los MESES_AJUSTE meses
+        anteriores. Retorna None si no hay meses anteriores con ingresos.
+        """
+        periodos = []
+        for _ in range(SeriesFinancieras.MESES_AJUSTE):
+            anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+            periodos.insert(0, (anio, mes))
+
+        matriz = SeriesFinancieras.matriz(periodos)
+        ingresos = matriz[:, 0] + matriz[:, 1]
+        if not ingresos.any():
+            return None
+        # Se ajusta desde el primer mes con movimiento
+        ingresos = ingresos[np.flatnonzero(ingresos)[0]:]
+        return max(float(SeriesFinancieras.proyectar(ingresos, 1)[0]), 0.0)
+
+
+# ============================================================================
+# ANALÍTICA DE GASTOS
+# ============================================================================
+
+class CuboGastos:
+    """
+    Cubo de gastos categoría × mes × año en un arreglo de NumPy.
+    Se construye con una sola consulta agrupada sobre gastos_edificio y se
+    guarda en cache_finanzas hasta la próxima escritura de un gasto (etiqueta
+    'gastos_edificio'). Los cortes (drill-down), la comparación interanual y
+    el presupuesto contra lo ejecutado se calculan sobre el arreglo.
+    """
+
+    CLAVE_CACHE = 'cubo_gastos'
+    ETIQUETA = 'gastos_edificio'
+
+    # Solo se invalida con escrituras de gastos; el TTL es un límite de seguridad
+    TTL = 24 * 3600
+
+    def __init__(self, categorias, anios, totales, cantidades):
+        self.categorias = categorias          # Lista ordenada de categorías
+        self.anios = anios                    # Años consecutivos del primero al último gasto
+        self.totales = totales                # Arreglo (categorías, 12, años) en Bs.
+        self.cantidades = cantidades          # Arreglo (categorías, 12, años) de gastos
+
+    @staticmethod
+    def construir():
+        """Arma el cubo con una consulta agrupada por año, mes y categoría"""
+        from sqlalchemy import extract, func
+
+        anio = extract('year', GastoEdificio.fecha_gasto)
+        mes = extract('month', GastoEdificio.fecha_gasto)
+        filas = db.session.query(
+            anio, mes, GastoEdificio.categoria,
+            func.sum(GastoEdificio.monto), func.count(GastoEdificio.id)
+        ).group_by(anio, mes, GastoEdificio.categoria).all()
+
+        if not filas:
+            vacio = np.zeros((0, 12, 0))
+            return CuboGastos([], [], vacio, vacio.astype(int))
+
+        anios_filas = np.array([int(f[0]) for f in filas])
+        meses_filas = np.array([int(f[1]) for f in filas])
+        categorias = sorted({f[2] for f in filas})
+        indice = {categoria: i for i, categoria in enumerate(categorias)}
+        categorias_filas = np.array([indice[f[2]] for f in filas])
+
+        primero = int(anios_filas.min())
+        anios = list(range(primero, int(anios_filas.max()) + 1))
+        forma = (len(categorias), 12, len(anios))
+        totales = np.zeros(forma)
+        cantidades = np.zeros(forma, dtype=int)
+        posicion = (categorias_filas, meses_filas - 1, anios_filas - primero)
+        totales[posicion] = [float(f[3] or 0) for f in filas]
+        cantidades[posicion] = [int(f[4]) for f in filas]
+        return CuboGastos(categorias, anios, totales, cantidades)
+
+    @staticmethod
+    def obtener():
+        """Cubo vigente (desde la caché si no hubo gastos nuevos)"""
+        return cache_finanzas.obtener_o_calcular(
+            CuboGastos.CLAVE_CACHE, CuboGastos.construir,
+            etiquetas=[CuboGastos.ETIQUETA], ttl=CuboGastos.TTL
+        )
+
+    def _anio(self, anio, totales=None):
+        """Matriz (categorías, 12) del año; ceros si no hay gastos ese año"""
+        totales = self.totales if totales is None else totales
+        if anio in self.anios:
+            return totales[:, :, self.anios.index(anio)]
+        return np.zeros(totales.shape[:2], dtype=totales.dtype)
+
+    def _categorias(self, categoria=None):
+        """Índices de las categorías a incluir (todas o una)"""
+        if categoria is None:
+            return list(range(len(self.categorias)))
+        return [self.categorias.index(categoria)] if categoria in self.categorias else []
+
+    def totales_por_categoria(self, mes=None, anio=None):
+        """{categoria: total} de un mes, de un año o de todo el cubo (mayor a menor)"""
+        if anio is None:
+            totales = self.totales.sum(axis=(1, 2))
+        elif mes is None:
+            totales = self._anio(anio).sum(axis=1)
+        else:
+            totales = self._anio(anio)[:, mes - 1]
+        orden = np.argsort(-totales, kind='stable')
+        return {self.categorias[i]: round(float(totales[i]), 2) for i in orden if totales[i]}
+
+    def detalle(self, anio=None, mes=None, categoria=None):
+        """
+        Drill-down: sin año retorna los totales por año; con año, por mes;
+        con año y mes, por categoría. La categoría filtra cualquier nivel.
+        """
+        indices = self._categorias(categoria)
+        totales = self.totales[indices]
+        cantidades = self.cantidades[indices]
+        categorias = [self.categorias[i] for i in indices]
+
+        if anio is None:
+            nivel = 'anio'
+            etiquetas = list(self.anios)
+            por_categoria = totales.sum(axis=1)                     # (categorías, años)
+            conteo = cantidades.sum(axis=(0, 1))
+        elif mes is None:
+            nivel = 'mes'
+            etiquetas = list(range(1, 13))
+            por_categoria = self._anio(anio, totales)               # (categorías, 12)
+            conteo = self._anio(anio, cantidades).sum(axis=0)
+        else:
+            nivel = 'categoria'
+            etiquetas = categorias
+            montos = self._anio(anio, totales)[:, mes - 1]
+            return {
+                'nivel': nivel,
+                'filtros': {'anio': anio, 'mes': mes, 'categoria': categoria},
+                'etiquetas': etiquetas,
+                'totales': np.round(montos, 2).tolist(),
+                'cantidades': self._anio(anio, cantidades)[:, mes - 1].tolist(),
+                'total': round(float(montos.sum()), 2),
+            }
+
+        totales_etiqueta = por_categoria.sum(axis=0) if categorias else np.zeros(len(etiquetas))
+        return {
+            'nivel': nivel,
+            'filtros': {'anio': anio, 'mes': mes, 'categoria': categoria},
+            'etiquetas': etiquetas,
+            'totales': np.round(totales_etiqueta, 2).tolist(),
+            'cantidades': np.asarray(conteo).tolist() if categorias else [0] * len(etiquetas),
+            'por_categoria': {
+                nombre: np.round(fila, 2).tolist()
+                for nombre, fila in zip(categorias, por_categoria)
+            },
+            'total': round(float(totales_etiqueta.sum()), 2),
+        }
+
+    @staticmethod
+    def _variacion(actual, anterior):
+        """Variación porcentual; None donde el año anterior no tuvo gastos"""
+        porcentaje = np.divide(actual - anterior, anterior, out=np.zeros_like(actual),
+                               where=anterior > 0) * 100
+        return [round(float(v), 2) if base > 0 else None
+                for v, base in zip(np.ravel(porcentaje), np.ravel(anterior))]
+
+    def interanual(self, anio, hasta_mes=12):
+        """
+        Comparación de cada categoría y mes con el mismo mes del año anterior.
+        Los totales anuales usan solo los meses 1..hasta_mes de ambos años.
+        """
+        actual = self._anio(anio)[:, :hasta_mes]
+        anterior = self._anio(anio - 1)[:, :hasta_mes]
+        total_actual = actual.sum(axis=1)
+        total_anterior = anterior.sum(axis=1)
+
+        categorias = {}
+        for i, nombre in enumerate(self.categorias):
+            if not (total_actual[i] or total_anterior[i]):
+                continue
+            categorias[nombre] = {
+                'actual': np.round(actual[i], 2).tolist(),
+                'anterior': np.round(anterior[i], 2).tolist(),
+                'diferencia': np.round(actual[i] - anterior[i], 2).tolist(),
+                'variacion': CuboGastos._variacion(actual[i], anterior[i]),
+                'total_actual': round(float(total_actual[i]), 2),
+                'total_anterior': round(float(total_anterior[i]), 2),
+                'variacion_total': CuboGastos._variacion(total_actual[i:i + 1],
+                                                         total_anterior[i:i + 1])[0],
+            }
+
+        mensual_actual = actual.sum(axis=0)
+        mensual_anterior = anterior.sum(axis=0)
+        return {
+            'anio': anio,
+            'hasta_mes': hasta_mes,
+            'meses': list(range(1, hasta_mes + 1)),
+            'categorias': categorias,
+            'total': {
+                'actual': np.round(mensual_actual, 2).tolist(),
+                'anterior': np.round(mensual_anterior, 2).tolist(),
+                'diferencia': np.round(mensual_actual - mensual_anterior, 2).tolist(),
+                'variacion': CuboGastos._variacion(mensual_actual, mensual_anterior),
+                'total_actual': round(float(mensual_actual.sum()), 2),
+                'total_anterior': round(float(mensual_anterior.sum()), 2),
+                'variacion_total': CuboGastos._variacion(
+                    np.array([mensual_actual.sum()]), np.array([mensual_anterior.sum()]))[0],
+            },
+        }
+
+    def presupuesto(self, anio, presupuestos, hasta_mes=12):
+        """
+        Presupuesto contra ejecutado por categoría al mes hasta_mes.
+        presupuestos: {categoria: monto anual}; el presupuesto a la fecha es
+        la parte proporcional de los meses transcurridos.
+        """
+        nombres = sorted(set(self.categorias) | set(presupuestos))
+        ejecutado_mensual = np.zeros((len(nombres), 12))
+        for i, nombre in enumerate(nombres):
+            if nombre in self.categorias:
+                ejecutado_mensual[i] = self._anio(anio)[self.categorias.index(nombre)]
+
+        anual = np.array([float(presupuestos.get(nombre, 0)) for nombre in nombres])
+        a_la_fecha = anual * hasta_mes / 12
+        ejecutado = ejecutado_mensual[:, :hasta_mes].sum(axis=1)
+        diferencia = a_la_fecha - ejecutado
+        porcentaje = np.divide(ejecutado, a_la_fecha, out=np.zeros_like(ejecutado),
+                               where=a_la_fecha > 0) * 100
+
+        categorias = {}
+        for i, nombre in enumerate(nombres):
+            if not (anual[i] or ejecutado_mensual[i].any()):
+                continue
+            categorias[nombre] = {
+                'presupuesto_anual': round(float(anual[i]), 2),
+                'presupuesto_a_la_fecha': round(float(a_la_fecha[i]), 2),
+                'ejecutado': round(float(ejecutado[i]), 2),
+                'diferencia': round(float(diferencia[i]), 2),
+                'porcentaje_ejecutado': round(float(porcentaje[i]), 2) if a_la_fecha[i] else None,
+                'excedido': bool(ejecutado[i] > a_la_fecha[i]),
+                'sin_presupuesto': not anual[i],
+                'ejecutado_mensual': np.round(ejecutado_mensual[i], 2).tolist(),
+            }
+
+        total_a_la_fecha = float(a_la_fecha.sum())
+        total_ejecutado = float(ejecutado.sum())
+        return {
+            'anio': anio,
+            'hasta_mes': hasta_mes,
+            'categorias': categorias,
+            'total': {
+                'presupuesto_anual': round(float(anual.sum()), 2),
+                'presupuesto_a_la_fecha': round(total_a_la_fecha, 2),
+                'ejecutado': round(total_ejecutado, 2),
+                'diferencia': round(total_a_la_fecha - total_ejecutado, 2),
+                'porcentaje_ejecutado': (round(total_ejecutado / total_a_la_fecha * 100, 2)
+                                         if total_a_la_fecha else None),
+            },
+        }
+
+
+# ============================================================================
+# CACHÉ DE ESTADÍSTICAS
+# ============================================================================
+
+# Caché de las APIs de estadísticas. Las entradas se etiquetan con los datos
+# que leen: ('mes', mes, anio) para el resumen mensual, 'cargos_mensuales'
+# para los totales pendientes y 'gastos_edificio' para el cubo de gastos. Los eventos de la sesión invalidan las
+# etiquetas afectadas cuando se confirma una transacción.
+cache_finanzas = CacheTTL()
+
+
+def etiqueta_mes(mes, anio):
+    return ('mes', int(mes), int(anio))
+
+
+def _etiquetas_sesion(session):
+    return session.info.setdefault('cache_finanzas', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _cambios_orm(session, contexto):
+    """Cambios hechos con objetos del ORM"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, CargoMensual):
+            _etiquetas_sesion(session).update({'cargos_mensuales', etiqueta_mes(obj.mes, obj.anio)})
+        elif isinstance(obj, ResumenMensual):
+            _etiquetas_sesion(session).add(etiqueta_mes(obj.mes, obj.anio))
+        elif isinstance(obj, GastoEdificio):
+            _etiquetas_sesion(session).add(CuboGastos.ETIQUETA)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _cambios_sql(estado):
+    """Cambios hechos con sentencias INSERT/UPDATE/DELETE en bloque"""
+    if not (estado.is_insert or estado.is_update or estado.is_delete):
+        return
+
+    tabla = getattr(getattr(estado.statement, 'table', None), 'name', None)
+    if tabla == 'cargos_mensuales':
+        _etiquetas_sesion(estado.session).add('cargos_mensuales')
+        if estado.is_insert or estado.is_delete:
+            # Cambia la cantidad de cargos emitidos (morosidad de las series)
+            _etiquetas_sesion(estado.session).add('cargos_emitidos')
+    elif tabla == 'gastos_edificio':
+        _etiquetas_sesion(estado.session).add(CuboGastos.ETIQUETA)
+    elif tabla == 'resumen_mensual':
+        # UPSERT de ResumenMensual.registrar: el mes viene en los valores
+        parametros = {}
+        if estado.is_insert and not isinstance(estado.parameters, (list, tuple)):
+            parametros = estado.statement.compile().params
+        if parametros.get('mes') and parametros.get('anio'):
+            _etiquetas_sesion(estado.session).add(
+                etiqueta_mes(parametros['mes'], parametros['anio'])
+            )
+        else:
+            _etiquetas_sesion(estado.session).add(TODAS)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_cache(session):
+    etiquetas = session.info.pop('cache_finanzas', None)
+    if etiquetas:
+        cache_finanzas.invalidar(etiquetas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cambios(session):
+    session.info.pop('cache_finanzas', None)
+
+
+# ============================================================================
+# FUNCIONES DE INICIALIZACIÓN
+# ============================================================================
+
+def generar_cargos_todos_departamentos(mes=None, anio=None, tarifas=None):
+    """
+    Función auxiliar para generar cargos del mes para todos los departamentos
+    Útil para ejecutar al inicio de cada mes
+    """
+    import time as _time
+    
+    hoy = date.today()
+    mes = mes or hoy.month
+    anio = anio or hoy.year
+    
+    inicio = _time.perf_counter()
+    creados = CargoMensual.generar_cargos_mes(mes, anio, tarifas)
+    duracion = _time.perf_counter() - inicio
+    
+    print(f"\n✅ {creados} cargos generados para {mes:02d}/{anio} en {duracion * 1000:.1f} ms")
+    return creados, duracion
+
+
+def enviar_recordatorios_pago():
+    """
+    Función auxiliar para enviar recordatorios de pago
+    Se puede ejecutar como tarea programada
+    """
+    from models.user_model import User
+    from utils.email_utils import enviar_email_recordatorio_pago
+    
+    # El filtro de vencidos se resuelve en SQL con el índice (pagado, fecha_vencimiento)
+    cargos_vencidos = CargoMensual.get_vencidos()
+    
+    departamentos_morosos = {}
+    for cargo in cargos_vencidos:
+        departamentos_morosos.setdefault(cargo.departamento, []).append(cargo)
+    
+    # Un usuario por departamento, en una sola consulta
+    usuarios = {}
+    if departamentos_morosos:
+        for usuario in User.query.filter(
+            User.departamento.in_(list(departamentos_morosos))
+        ).order_by(User.id).all():
+            usuarios.setdefault(usuario.departamento, usuario)
     
     for dept, cargos in departamentos_morosos.items():
-        usuario = User.query.filter_by(departamento=dept).first()
+        usuario = usuarios.get(dept)
         if usuario and usuario.email:
             try:
                 enviar_email_recordatorio_pago(usuario, cargos)
@@ -8,9 +8,24 @@ Nuevas funcionalidades:
 - Estadísticas de uso
 """
 
+from bisect import bisect_left
+from itertools import accumulate
 from database import db
 from datetime import datetime, date, time, timedelta
 from decimal import Decimal
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from utils.cache_utils import CacheTTL, TODAS
+
+# Estados de reserva que ocupan el área
+ESTADOS_ACTIVOS = ('pendiente', 'confirmada')
+
+# Granularidades (minutos) admitidas para los horarios disponibles
+GRANULARIDADES = (15, 30, 60)
+
+# Reservas recurrentes: días entre ocurrencias y largo máximo de una serie
+FRECUENCIAS = {'semanal': 7, 'quincenal': 14}
+MAX_OCURRENCIAS = 52
 
 
 class AreaComun(db.Model):
@@ -116,38 +131,30 @@ class AreaComun(db.Model):
             .order_by(AreaComun.total_reservas.desc())\
             .limit(limit).all()
     
-    def esta_disponible_en(self, fecha, hora_inicio, hora_fin):
-        """Verifica si el área está disponible en un horario específico"""
-        if not self.disponible:
-            return False
-        
-        if hora_inicio < self.hora_apertura or hora_fin > self.hora_cierre:
+    @property
+    def horario_minutos(self):
+        """
+        Apertura y cierre en minutos desde la medianoche
+        (un cierre a las 00:00 es el final del día)
+        """
+        return minutos(self.hora_apertura), minutos(self.hora_cierre) or 24 * 60
+    
+    def admite_horario(self, hora_inicio, hora_fin):
+        """Verifica que el área esté habilitada y abierta en ese horario"""
+        apertura, cierre = self.horario_minutos
+        return (self.disponible and
+                minutos(hora_inicio) >= apertura and (minutos(hora_fin) or 24 * 60) <= cierre)
+    
+    def esta_disponible_en(self, fecha, hora_inicio, hora_fin, excluir_id=None):
+        """
+        Verifica si el área está disponible en un horario específico
+        excluir_id: reserva que se está editando (no choca consigo misma)
+        """
+        if not self.admite_horario(hora_inicio, hora_fin):
             return False
         
-        from sqlalchemy import and_, or_
-        conflictos = Reserva.query.filter(
-            and_(
-                Reserva.area_id == self.id,
-                Reserva.fecha == fecha,
-                Reserva.estado.in_(['pendiente', 'confirmada']),
-                or_(
-                    and_(
-                        Reserva.hora_inicio <= hora_inicio,
-                        Reserva.hora_fin > hora_inicio
-                    ),
-                    and_(
-                        Reserva.hora_inicio < hora_fin,
-                        Reserva.hora_fin >= hora_fin
-                    ),
-                    and_(
-                        Reserva.hora_inicio >= hora_inicio,
-                        Reserva.hora_fin <= hora_fin
-                    )
-                )
-            )
-        ).first()
-        
-        return conflictos is None
+        ocupacion = IndiceOcupacion.dia(self.id, fecha)
+        return not ocupacion.choca(minutos(hora_inicio), minutos(hora_fin), excluir_id)
     
     def to_dict(self):
         """Serializa el área para API"""
@@ -168,6 +175,9 @@ class Reserva(db.Model):
     Reservas de áreas comunes - Mejorado
     """
     __tablename__ = 'reservas'
+    __table_args__ = (
+        db.Index('ix_reservas_area_fecha', 'area_id', 'fecha'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -306,6 +316,12 @@ class Reserva(db.Model):
     
     def cancelar(self, motivo=None):
         """Cancela la reserva"""
+        if self.estado != 'cancelada':
+            # El pago pendiente deja de contar como deuda del departamento
+            from models.finanzas_model import PagoReserva, SaldoDepartamento
+            pago = PagoReserva.get_by_reserva(self.id)
+            if pago and not pago.pagado:
+                SaldoDepartamento.registrar(self.departamento, deuda=-pago.monto, pendientes=-1)
         self.estado = 'cancelada'
         self.fecha_cancelacion = datetime.utcnow()
         if motivo:
@@ -333,6 +349,139 @@ class Reserva(db.Model):
             return True
         return False
     
+    @staticmethod
+    def bloquear_area(area_id):
+        """
+        Toma el bloqueo de escritura antes de verificar un horario.
+        El UPDATE sin cambios abre la transacción de escritura (en SQLite
+        equivale a BEGIN IMMEDIATE; en otros motores bloquea la fila del
+        área), así las reservas simultáneas de la misma área se atienden
+        de a una y cada una ve lo que confirmó la anterior.
+        """
+        tabla = AreaComun.__table__
+        db.session.execute(
+            tabla.update().where(tabla.c.id == area_id)
+            .values(ultima_modificacion=tabla.c.ultima_modificacion)
+        )
+    
+    def _horario_tomado(self, fecha, hora_inicio, hora_fin):
+        """Verifica contra la base (no la caché) si el horario choca con otra reserva"""
+        ocupacion = IndiceOcupacion.cargar_dia(self.area_id, fecha)
+        return ocupacion.choca(minutos(hora_inicio), minutos(hora_fin), self.id)
+    
+    def registrar(self):
+        """
+        Guarda una reserva nueva junto con su PagoReserva en una sola
+        transacción de escritura: bloqueo, verificación del horario e
+        inserción. Retorna False (sin guardar nada) si otro residente
+        tomó el horario primero.
+        """
+        from models.finanzas_model import PagoReserva
+        try:
+            Reserva.bloquear_area(self.area_id)
+            if self._horario_tomado(self.fecha, self.hora_inicio, self.hora_fin):
+                db.session.rollback()
+                return False
+            db.session.add(self)
+            db.session.flush()
+            PagoReserva(reserva_id=self.id, monto=self.costo_total).save()
+        except Exception:
+            db.session.rollback()
+            raise
+        return True
+    
+    def reprogramar(self, fecha, hora_inicio, hora_fin):
+        """
+        Cambia el horario de la reserva con la misma garantía que registrar():
+        retorna False (y descarta los cambios pendientes) si el nuevo horario
+        ya está tomado.
+        """
+        try:
+            Reserva.bloquear_area(self.area_id)
+            if self._horario_tomado(fecha, hora_inicio, hora_fin):
+                db.session.rollback()
+                return False
+            self.fecha = fecha
+            self.hora_inicio = hora_inicio
+            self.hora_fin = hora_fin
+            self.calcular_costo()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return True
+    
+    @staticmethod
+    def fechas_serie(fecha_inicio, frecuencia, hasta=None, ocurrencias=None):
+        """
+        Fechas de una serie recurrente a partir de fecha_inicio, semanal o
+        quincenal, hasta una fecha (inclusive) o por N ocurrencias.
+        Lanza ValueError si la frecuencia o el límite no son válidos.
+        """
+        if frecuencia not in FRECUENCIAS:
+            raise ValueError(f"Frecuencia no válida: '{frecuencia}'")
+        if (hasta is None) == (ocurrencias is None):
+            raise ValueError('Indica una fecha límite o un número de ocurrencias')
+        
+        paso = timedelta(days=FRECUENCIAS[frecuencia])
+        if hasta is not None:
+            if hasta < fecha_inicio:
+                raise ValueError('La fecha límite es anterior a la primera reserva')
+            ocurrencias = (hasta - fecha_inicio) // paso + 1
+        if not 1 <= ocurrencias <= MAX_OCURRENCIAS:
+            raise ValueError(f'Una serie admite de 1 a {MAX_OCURRENCIAS} reservas')
+        return [fecha_inicio + paso * n for n in range(ocurrencias)]
+    
+    @staticmethod
+    def registrar_serie(datos, fechas, omitir_conflictos=False):
+        """
+        Registra la misma reserva en varias fechas con su PagoReserva cada
+        una, en una sola transacción de escritura como registrar(): la
+        ocupación de toda la serie se lee con una consulta por rango, cada
+        fecha se verifica en memoria y reservas y pagos se insertan en lote.
+        
+        datos: argumentos de Reserva(...) salvo la fecha.
+        Retorna (creadas, conflictos) con las reservas registradas y las
+        fechas ocupadas. Si hay conflictos y no se pide omitirlos no se
+        registra ninguna.
+        """
+        from sqlalchemy import insert
+        from models.finanzas_model import PagoReserva, SaldoDepartamento
+        area_id = datos['area_id']
+        inicio, fin = minutos(datos['hora_inicio']), minutos(datos['hora_fin'])
+        try:
+            Reserva.bloquear_area(area_id)
+            ocupacion = IndiceOcupacion.cargar_rango([area_id], min(fechas), max(fechas))
+            conflictos = [
+                fecha for fecha in fechas
+                if (area_id, fecha) in ocupacion and ocupacion[(area_id, fecha)].choca(inicio, fin)
+            ]
+            ocupadas = set(conflictos)
+            libres = [fecha for fecha in fechas if fecha not in ocupadas]
+            if not libres or (conflictos and not omitir_conflictos):
+                db.session.rollback()
+                return [], conflictos
+            
+            # Todas las fechas tienen el mismo horario y, por lo tanto, el mismo costo
+            plantilla = Reserva(fecha=libres[0], **datos)
+            ids = dict(db.session.execute(
+                insert(Reserva).returning(Reserva.fecha, Reserva.id),
+                [{**datos, 'fecha': fecha, 'estado': 'pendiente',
+                  'costo_total': plantilla.costo_total} for fecha in libres]
+            ).all())
+            monto = Decimal(str(plantilla.costo_total))
+            db.session.execute(insert(PagoReserva), [
+                {'reserva_id': ids[fecha], 'monto': monto, 'pagado': False} for fecha in libres
+            ])
+            SaldoDepartamento.registrar(datos['departamento'],
+                                        deuda=monto * len(libres), pendientes=len(libres))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        creadas = Reserva.query.filter(Reserva.id.in_(ids.values())).order_by(Reserva.fecha).all()
+        return creadas, conflictos
+    
     def save(self):
         db.session.add(self)
         db.session.commit()
@@ -419,56 +568,80 @@ class Reserva(db.Model):
         )
         
         if mes and anio:
-            from sqlalchemy import extract
-            query = query.filter(
-                extract('month', Reserva.fecha) == mes,
-                extract('year', Reserva.fecha) == anio
-            )
+            from utils.fechas_utils import filtro_mes
+            query = query.filter(filtro_mes(Reserva.fecha, mes, anio))
         
-        reservas = query.all()
-        fechas = set(r.fecha for r in reservas)
-        return sorted(list(fechas))
+        # Solo las fechas distintas; el índice (area_id, fecha) resuelve el filtro
+        fechas = query.with_entities(Reserva.fecha).distinct().order_by(Reserva.fecha).all()
+        return [fecha for (fecha,) in fechas]
     
     @staticmethod
-    def get_horarios_disponibles(area_id, fecha):
+    def get_horarios_disponibles(area_id, fecha, granularidad=60):
         """
-        Retorna los horarios disponibles para una fecha específica
+        Retorna los bloques libres de una fecha (de `granularidad` minutos)
         """
         area = AreaComun.get_by_id(area_id)
         if not area or not area.disponible:
             return []
         
-        # Obtener reservas del día
-        reservas_dia = Reserva.query.filter(
-            Reserva.area_id == area_id,
-            Reserva.fecha == fecha,
-            Reserva.estado.in_(['pendiente', 'confirmada'])
-        ).order_by(Reserva.hora_inicio).all()
-        
-        # Generar horarios disponibles (bloques de 1 hora)
         horarios_disponibles = []
-        hora_actual = area.hora_apertura
-        
-        while hora_actual < area.hora_cierre:
-            hora_fin = (datetime.combine(date.today(), hora_actual) + timedelta(hours=1)).time()
-            
-            # Verificar si hay conflicto con alguna reserva
-            conflicto = False
-            for reserva in reservas_dia:
-                if not (hora_fin <= reserva.hora_inicio or hora_actual >= reserva.hora_fin):
-                    conflicto = True
-                    break
-            
-            if not conflicto:
+        for ventana in Reserva.get_ventanas_libres(area, fecha, fecha, granularidad)[0]['ventanas']:
+            inicio = minutos(ventana['inicio'])
+            fin = minutos(ventana['fin']) or 24 * 60
+            for bloque in range(inicio, fin - granularidad + 1, granularidad):
                 horarios_disponibles.append({
-                    'hora_inicio': hora_actual.strftime('%H:%M'),
-                    'hora_fin': hora_fin.strftime('%H:%M')
+                    'hora_inicio': hora_de_minutos(bloque).strftime('%H:%M'),
+                    'hora_fin': hora_de_minutos(bloque + granularidad).strftime('%H:%M')
                 })
-            
-            hora_actual = hora_fin
         
         return horarios_disponibles
     
+    @staticmethod
+    def get_ventanas_libres(area, desde, hasta, granularidad=60, ahora=None):
+        """
+        Ventanas libres maximales del área en cada día desde..hasta
+        Los intervalos de cada día se fusionan en un solo barrido
+        (OcupacionDia.huecos); los bordes de cada ventana se ajustan a la
+        granularidad y se descartan las que no alcanzan el tiempo mínimo.
+        Cada ventana indica el último inicio posible y la duración máxima
+        de una reserva dentro de ella (limitada por el tiempo máximo).
+        """
+        if granularidad not in GRANULARIDADES:
+            raise ValueError(f'Granularidad no válida: {granularidad}')
+        
+        ahora = ahora or datetime.now()
+        apertura, cierre = area.horario_minutos
+        minimo = (area.tiempo_minimo or 1) * 60
+        maximo = (area.tiempo_maximo or 24) * 60
+        ocupacion = IndiceOcupacion.rango([area.id], desde, hasta)
+        
+        dias = []
+        for n in range((hasta - desde).days + 1):
+            fecha = desde + timedelta(days=n)
+            desde_minuto = apertura
+            if fecha < ahora.date():
+                desde_minuto = cierre
+            elif fecha == ahora.date():
+                desde_minuto = max(apertura, ahora.hour * 60 + ahora.minute)
+            
+            ventanas = []
+            if area.disponible and desde_minuto < cierre:
+                for inicio, fin in ocupacion[(area.id, fecha)].huecos(desde_minuto, cierre):
+                    # Inicio redondeado hacia arriba y fin hacia abajo a la grilla
+                    inicio = -(-inicio // granularidad) * granularidad
+                    fin = fin // granularidad * granularidad
+                    if fin - inicio < minimo:
+                        continue
+                    ventanas.append({
+                        'inicio': hora_de_minutos(inicio),
+                        'fin': hora_de_minutos(fin),
+                        'ultimo_inicio': hora_de_minutos(fin - minimo),
+                        'duracion_maxima': min(fin - inicio, maximo),
+                    })
+            dias.append({'fecha': fecha, 'ventanas': ventanas})
+        
+        return dias
+    
     def to_dict(self):
         """Serializa la reserva para API"""
         return {
@@ -553,6 +726,255 @@ class AreaRating(db.Model):
         return sum(r.rating for r in ratings) / len(ratings)
 
 
+# ============================================================================
+# ÍNDICE DE OCUPACIÓN
+# ============================================================================
+
+def minutos(hora):
+    """Minutos desde la medianoche"""
+    return hora.hour * 60 + hora.minute
+
+
+def hora_de_minutos(total):
+    """Hora del día a partir de los minutos desde la medianoche (1440 es 00:00)"""
+    return time((total // 60) % 24, total % 60)
+
+
+class OcupacionDia:
+    """
+    Intervalos ocupados de un área en un día, en minutos y ordenados por
+    inicio. max_fines[i] es el mayor fin de los intervalos 0..i, así la
+    consulta de superposición es una búsqueda binaria: O(log n).
+    """
+    __slots__ = ('inicios', 'fines', 'ids', 'max_fines')
+
+    def __init__(self, intervalos=()):
+        """intervalos: iterable de (inicio, fin, reserva_id) en minutos"""
+        intervalos = sorted(intervalos)
+        self.inicios = [inicio for inicio, _, _ in intervalos]
+        self.fines = [fin for _, fin, _ in intervalos]
+        self.ids = [reserva_id for _, _, reserva_id in intervalos]
+        self.max_fines = list(accumulate(self.fines, max))
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def choca(self, inicio, fin, excluir_id=None):
+        """True si [inicio, fin) se superpone con algún intervalo ocupado"""
+        # Candidatos: intervalos que empiezan antes del fin pedido
+        i = bisect_left(self.inicios, fin) - 1
+        if i < 0 or self.max_fines[i] <= inicio:
+            return False
+        if excluir_id is None:
+            return True
+        # Solo se recorren los intervalos que terminan después del inicio
+        while i >= 0 and self.max_fines[i] > inicio:
+            if self.fines[i] > inicio and self.ids[i] != excluir_id:
+                return True
+            i -= 1
+        return False
+
+    def huecos(self, apertura, cierre):
+        """
+        Ventanas libres maximales entre apertura y cierre (minutos).
+        Un solo recorrido de los intervalos ordenados: los que se superponen
+        se fusionan al avanzar el cursor.
+        """
+        libres = []
+        cursor = apertura
+        for inicio, fin in zip(self.inicios, self.fines):
+            inicio, fin = max(inicio, apertura), min(fin, cierre)
+            if inicio >= fin or fin <= cursor:
+                continue
+            if inicio > cursor:
+                libres.append((cursor, inicio))
+            cursor = fin
+        if cursor < cierre:
+            libres.append((cursor, cierre))
+        return libres
+
+
+class IndiceOcupacion:
+    """
+    Ocupación por área y día en una caché de proceso (cache_ocupacion).
+    Cada día se carga con una consulta la primera vez que se pide; los
+    eventos de la sesión invalidan los días afectados cuando se confirma
+    una reserva nueva, editada, confirmada o cancelada en este proceso.
+    Con varios workers, los cambios hechos en otro proceso se ven al
+    vencer el TTL.
+    """
+
+    TTL = 60
+
+    @staticmethod
+    def etiqueta(area_id, fecha):
+        return ('ocupacion', int(area_id), fecha)
+
+    @staticmethod
+    def _consulta():
+        return db.session.query(
+            Reserva.area_id, Reserva.fecha, Reserva.hora_inicio, Reserva.hora_fin, Reserva.id
+        ).filter(Reserva.estado.in_(ESTADOS_ACTIVOS))
+
+    @staticmethod
+    def _intervalo(hora_inicio, hora_fin, reserva_id):
+        # Una reserva que termina a medianoche ocupa hasta el final del día
+        return minutos(hora_inicio), minutos(hora_fin) or 24 * 60, reserva_id
+
+    @staticmethod
+    def cargar_dia(area_id, fecha):
+        """Lee de la base la ocupación de un área en un día"""
+        filas = IndiceOcupacion._consulta().filter(
+            Reserva.area_id == area_id, Reserva.fecha == fecha
+        ).all()
+        return OcupacionDia(IndiceOcupacion._intervalo(*fila[2:]) for fila in filas)
+
+    @staticmethod
+    def dia(area_id, fecha):
+        """Ocupación del área en el día (desde la caché si está vigente)"""
+        clave = IndiceOcupacion.etiqueta(area_id, fecha)
+        return cache_ocupacion.obtener_o_calcular(
+            clave, lambda: IndiceOcupacion.cargar_dia(area_id, fecha),
+            etiquetas=[clave], ttl=IndiceOcupacion.TTL
+        )
+
+    @staticmethod
+    def cargar_rango(area_ids, desde, hasta):
+        """
+        Lee de la base, con una sola consulta, la ocupación de varias áreas
+        en los días desde..hasta. Retorna {(area_id, fecha): OcupacionDia}
+        solo para los días que tienen reservas.
+        """
+        intervalos = {}
+        filas = IndiceOcupacion._consulta().filter(
+            Reserva.area_id.in_(area_ids), Reserva.fecha >= desde, Reserva.fecha <= hasta
+        ).all()
+        for area_id, fecha, hora_inicio, hora_fin, reserva_id in filas:
+            intervalos.setdefault((area_id, fecha), []).append(
+                IndiceOcupacion._intervalo(hora_inicio, hora_fin, reserva_id)
+            )
+        return {clave: OcupacionDia(dia) for clave, dia in intervalos.items()}
+
+    @staticmethod
+    def rango(area_ids, desde, hasta):
+        """
+        Ocupación de varias áreas en los días desde..hasta (inclusive)
+        Retorna {(area_id, fecha): OcupacionDia}. Los días que no están en la
+        caché se leen con una sola consulta por rango.
+        """
+        generacion = cache_ocupacion.generacion
+        dias = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+        resultado = {}
+        faltantes = set()
+        for area_id in area_ids:
+            for fecha in dias:
+                ocupacion = cache_ocupacion.obtener(IndiceOcupacion.etiqueta(area_id, fecha))
+                if ocupacion is None:
+                    faltantes.add(area_id)
+                else:
+                    resultado[(area_id, fecha)] = ocupacion
+
+        if faltantes:
+            leidos = IndiceOcupacion.cargar_rango(faltantes, desde, hasta)
+            for area_id in faltantes:
+                for fecha in dias:
+                    if (area_id, fecha) in resultado:
+                        continue
+                    ocupacion = leidos.get((area_id, fecha)) or OcupacionDia()
+                    resultado[(area_id, fecha)] = ocupacion
+                    clave = IndiceOcupacion.etiqueta(area_id, fecha)
+                    cache_ocupacion.guardar(clave, ocupacion, [clave],
+                                            IndiceOcupacion.TTL, generacion)
+        return resultado
+
+    @staticmethod
+    def disponibilidad_mes(areas, mes, anio):
+        """
+        Horas libres, horas ocupadas y día completo de cada área en cada día
+        del mes, en arreglos paralelos (un valor por día). Un día está completo
+        cuando no queda ninguna ventana del tiempo mínimo de reserva del área.
+        """
+        import calendar
+        dias = calendar.monthrange(anio, mes)[1]
+        desde = date(anio, mes, 1)
+        ocupacion = IndiceOcupacion.rango([area.id for area in areas],
+                                          desde, date(anio, mes, dias))
+
+        resultado = []
+        for area in areas:
+            apertura, cierre = area.horario_minutos
+            minimo = (area.tiempo_minimo or 1) * 60
+            libres, ocupadas, completo = [], [], []
+            for n in range(dias):
+                huecos = ocupacion[(area.id, desde + timedelta(days=n))].huecos(apertura, cierre)
+                minutos_libres = sum(fin - inicio for inicio, fin in huecos)
+                libres.append(round(minutos_libres / 60, 2))
+                ocupadas.append(round((cierre - apertura - minutos_libres) / 60, 2))
+                completo.append(int(all(fin - inicio < minimo for inicio, fin in huecos)))
+            resultado.append({
+                'id': area.id,
+                'nombre': area.nombre,
+                'horas_libres': libres,
+                'horas_ocupadas': ocupadas,
+                'completo': completo,
+            })
+        return resultado
+
+
+# Caché de proceso de la ocupación; la invalidan los eventos de la sesión
+cache_ocupacion = CacheTTL(ttl=IndiceOcupacion.TTL)
+
+
+def _dias_sesion(session):
+    return session.info.setdefault('cache_ocupacion', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _reservas_modificadas(session, contexto):
+    """Días afectados por reservas nuevas, editadas o eliminadas (valores nuevos y anteriores)"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Reserva):
+            continue
+        estado = inspect(obj)
+        areas = {obj.area_id, *estado.attrs.area_id.history.deleted}
+        fechas = {obj.fecha, *estado.attrs.fecha.history.deleted}
+        _dias_sesion(session).update(
+            IndiceOcupacion.etiqueta(area_id, fecha)
+            for area_id in areas for fecha in fechas
+            if area_id is not None and fecha is not None
+        )
+
+
+# Al cambiar el área o la fecha se carga el valor anterior (aunque el objeto
+# esté expirado) para invalidar también el día de origen
+@event.listens_for(Reserva.area_id, 'set', active_history=True)
+@event.listens_for(Reserva.fecha, 'set', active_history=True)
+def _cargar_valor_anterior(reserva, valor, anterior, iniciador):
+    pass
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _reservas_en_bloque(estado):
+    """INSERT/UPDATE/DELETE en bloque sobre reservas: se descarta todo el índice"""
+    if not (estado.is_insert or estado.is_update or estado.is_delete):
+        return
+    tabla = getattr(getattr(estado.statement, 'table', None), 'name', None)
+    if tabla == 'reservas':
+        _dias_sesion(estado.session).add(TODAS)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_ocupacion(session):
+    dias = session.info.pop('cache_ocupacion', None)
+    if dias:
+        cache_ocupacion.invalidar(dias)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_ocupacion(session):
+    session.info.pop('cache_ocupacion', None)
+
+
 # Función helper para inicializar áreas comunes por defecto
 def inicializar_areas_comunes():
     """Crea áreas comunes predeterminadas si no existen"""
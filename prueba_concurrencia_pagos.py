@@ -0,0 +1,178 @@
+# prueba_concurrencia_pagos.py
+"""
+Prueba de concurrencia del pago de cargos
+Lanza N solicitudes simultáneas (procesos independientes, como workers de
+gunicorn) contra el pago de un mismo cargo y verifica que solo una lo
+registre: un único HistorialPago, saldos y resumen mensual consistentes.
+
+Escenarios:
+  misma_clave      todas reenvían el mismo formulario (doble clic / reintento):
+                   todas reciben el resultado del único pago
+  claves_distintas cada solicitud con su propia clave de idempotencia
+  sin_clave        sin clave: decide solo el UPDATE ... WHERE pagado = 0
+
+Uso: python prueba_concurrencia_pagos.py [--solicitudes 50]
+No modifica buildtech.db: trabaja sobre un archivo temporal.
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from flask_login import LoginManager
+from database import db
+
+ESCENARIOS = ('misma_clave', 'claves_distintas', 'sin_clave')
+
+
+def crear_app(ruta_db):
+    """App mínima con la base temporal y el blueprint de finanzas"""
+    from controllers.finanzas_controller import finanzas_bp
+    from models.user_model import User
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{ruta_db}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'prueba-concurrencia'
+    db.init_app(app)
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return User.get_by_id(int(user_id))
+
+    app.register_blueprint(finanzas_bp)
+    return app
+
+
+def preparar(app):
+    """Crea las tablas, un administrador y un cargo pendiente por escenario"""
+    from models.user_model import User
+    from models.finanzas_model import CargoMensual
+
+    with app.app_context():
+        import models.reservas_model  # noqa: F401 - registra las tablas
+        db.create_all()
+        admin = User('admin', 'admin@buildtech.local', 'admin', 'Admin', 'Prueba', role='admin')
+        admin.save()
+        cargos = {}
+        for departamento, escenario in enumerate(ESCENARIOS, start=101):
+            cargo = CargoMensual(departamento, 1, 2025)
+            cargo.save()
+            cargos[escenario] = (departamento, cargo.id)
+        return admin.id, cargos
+
+
+def solicitud(ruta_db, usuario_id, departamento, cargo_id, clave, barrera):
+    """Un worker: espera a los demás y envía el formulario de pago"""
+    app = crear_app(ruta_db)
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['_user_id'] = str(usuario_id)
+        sesion['_fresh'] = True
+
+    datos = {'metodo_pago': 'transferencia', 'referencia': 'OP-1'}
+    if clave:
+        datos['clave_idempotencia'] = clave
+
+    barrera.wait()
+    respuesta = cliente.post(
+        f'/financiera/pagar/cargo/{departamento}/cargo_mensual/{cargo_id}/', data=datos
+    )
+    with cliente.session_transaction() as sesion:
+        categorias = [categoria for categoria, _ in sesion.get('_flashes', [])]
+    return respuesta.status_code, categorias[-1] if categorias else None
+
+
+def ejecutar(escenario, ruta_db, usuario_id, departamento, cargo_id, solicitudes):
+    contexto = multiprocessing.get_context('fork')
+    barrera = contexto.Manager().Barrier(solicitudes)
+    argumentos = []
+    for i in range(solicitudes):
+        if escenario == 'misma_clave':
+            clave = f'form-{cargo_id}'
+        elif escenario == 'claves_distintas':
+            clave = f'solicitud-{cargo_id}-{i}'
+        else:
+            clave = None
+        argumentos.append((ruta_db, usuario_id, departamento, cargo_id, clave, barrera))
+
+    inicio = time.perf_counter()
+    with contexto.Pool(solicitudes) as pool:
+        respuestas = pool.starmap(solicitud, argumentos)
+    return respuestas, time.perf_counter() - inicio
+
+
+def verificar(app, escenario, cargo_id, respuestas):
+    """Comprueba en la base que el cargo se pagó una sola vez"""
+    from models.finanzas_model import CargoMensual, HistorialPago, SaldoDepartamento, ResumenMensual
+
+    with app.app_context():
+        historial = HistorialPago.query.filter_by(tipo_pago='cargo_mensual', objeto_id=cargo_id).count()
+        cargo = db.session.get(CargoMensual, cargo_id)
+        errores = []
+        if historial != 1:
+            errores.append(f'{historial} registros en historial_pagos')
+        if not cargo.pagado:
+            errores.append('el cargo quedó pendiente')
+        if SaldoDepartamento.verificar():
+            errores.append('saldos_departamento no coincide con las tablas')
+        if ResumenMensual.verificar():
+            errores.append('resumen_mensual no coincide con las tablas')
+
+        estados = Counter(categoria for _, categoria in respuestas)
+        exitos_esperados = len(respuestas) if escenario == 'misma_clave' else 1
+        if estados['success'] != exitos_esperados:
+            errores.append(f"{estados['success']} respuestas de éxito (se esperaban {exitos_esperados})")
+        if any(codigo != 302 for codigo, _ in respuestas):
+            errores.append('respuestas con código distinto de 302')
+        return historial, estados, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de pagos concurrentes sobre un mismo cargo')
+    parser.add_argument('--solicitudes', type=int, default=50, help='Solicitudes simultáneas por escenario')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='buildtech_concurrencia_')
+    ruta_db = os.path.join(directorio, 'concurrencia.db')
+    app = crear_app(ruta_db)
+    usuario_id, cargos = preparar(app)
+    with app.app_context():
+        db.engine.dispose()  # Cada proceso abre sus propias conexiones
+
+    fallos = 0
+    for escenario in ESCENARIOS:
+        departamento, cargo_id = cargos[escenario]
+        respuestas, segundos = ejecutar(escenario, ruta_db, usuario_id, departamento,
+                                        cargo_id, args.solicitudes)
+        historial, estados, errores = verificar(app, escenario, cargo_id, respuestas)
+
+        print(f"\n🔁 {escenario}: {args.solicitudes} solicitudes en {segundos:.2f} s")
+        print(f"   • respuestas: {dict(estados)}")
+        print(f"   • registros en historial: {historial}")
+        if errores:
+            fallos += 1
+            for error in errores:
+                print(f"   ❌ {error}")
+        else:
+            print("   ✅ Un solo pago registrado")
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    os.remove(ruta_db)
+    os.rmdir(directorio)
+    return 1 if fallos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
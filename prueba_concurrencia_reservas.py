@@ -0,0 +1,198 @@
+# prueba_concurrencia_reservas.py
+"""
+Prueba de carga de reservas simultáneas
+Lanza cientos de solicitudes de reserva al mismo horario de la misma área,
+cada una de un residente distinto, repartidas en varios procesos (como
+workers de gunicorn) con varios hilos cada uno. Verifica que haya un solo
+ganador: una reserva activa, un PagoReserva y saldos consistentes; el resto
+debe recibir el aviso de horario ocupado.
+
+Uso: python prueba_concurrencia_reservas.py [--procesos 10] [--hilos 20]
+No modifica buildtech.db: trabaja sobre un archivo temporal.
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+from datetime import date, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from flask_login import LoginManager
+from werkzeug.security import generate_password_hash
+from database import db
+
+HORA_INICIO = '18:00'
+HORA_FIN = '20:00'
+
+
+def crear_app(ruta_db, conexiones=5):
+    """App mínima con la base temporal y el blueprint de reservas"""
+    from controllers.reservas_controller import reservas_bp
+    from models.user_model import User
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{ruta_db}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': conexiones}
+    app.config['SECRET_KEY'] = 'prueba-concurrencia'
+    db.init_app(app)
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return User.get_by_id(int(user_id))
+
+    app.register_blueprint(reservas_bp)
+    return app
+
+
+def preparar(app, residentes):
+    """Crea las tablas, el área y un residente por solicitud"""
+    from models.user_model import User
+    from models.reservas_model import AreaComun
+
+    with app.app_context():
+        import models.finanzas_model  # noqa: F401 - registra las tablas
+        db.create_all()
+        area = AreaComun('Parrillero', capacidad=20, costo_hora=50)
+        area.save()
+
+        clave = generate_password_hash('residente')
+        db.session.execute(db.insert(User), [
+            {
+                'username': f'residente{n}',
+                'email': f'residente{n}@buildtech.local',
+                'password_hash': clave,
+                'first_name': 'Residente',
+                'last_name': str(n),
+                'role': 'residente',
+                'departamento': 100 + n,
+            }
+            for n in range(residentes)
+        ])
+        db.session.commit()
+        usuarios = [u.id for u in User.query.order_by(User.id).all()]
+        return area.id, usuarios
+
+
+def worker(ruta_db, area_id, fecha, usuarios, barrera):
+    """Un proceso: un hilo por residente, todos envían el formulario a la vez"""
+    app = crear_app(ruta_db, conexiones=len(usuarios))
+    respuestas = [None] * len(usuarios)
+
+    def solicitud(indice, usuario_id):
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['_user_id'] = str(usuario_id)
+            sesion['_fresh'] = True
+
+        barrera.wait()
+        try:
+            respuesta = cliente.post('/reservas/', data={
+                'area_id': area_id,
+                'fecha': fecha.isoformat(),
+                'hora_inicio': HORA_INICIO,
+                'hora_fin': HORA_FIN,
+                'motivo': 'Prueba de carga',
+                'num_personas': 5,
+            })
+        except Exception as e:
+            respuestas[indice] = (500, type(e).__name__)
+            return
+        with cliente.session_transaction() as sesion:
+            categorias = [categoria for categoria, _ in sesion.get('_flashes', [])]
+        respuestas[indice] = (respuesta.status_code, categorias[-1] if categorias else None)
+
+    hilos = [threading.Thread(target=solicitud, args=(i, u)) for i, u in enumerate(usuarios)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return respuestas
+
+
+def ejecutar(ruta_db, area_id, fecha, usuarios, procesos):
+    contexto = multiprocessing.get_context('fork')
+    barrera = contexto.Manager().Barrier(len(usuarios))
+    grupos = [usuarios[i::procesos] for i in range(procesos)]
+
+    inicio = time.perf_counter()
+    with contexto.Pool(procesos) as pool:
+        resultados = pool.starmap(worker, [
+            (ruta_db, area_id, fecha, grupo, barrera) for grupo in grupos
+        ])
+    respuestas = [respuesta for grupo in resultados for respuesta in grupo]
+    return respuestas, time.perf_counter() - inicio
+
+
+def verificar(app, area_id, fecha, respuestas):
+    """Comprueba en la base que el horario quedó reservado una sola vez"""
+    from models.reservas_model import Reserva, ESTADOS_ACTIVOS
+    from models.finanzas_model import PagoReserva, SaldoDepartamento
+
+    with app.app_context():
+        reservas = Reserva.query.filter(
+            Reserva.area_id == area_id, Reserva.fecha == fecha,
+            Reserva.estado.in_(ESTADOS_ACTIVOS)
+        ).all()
+        pagos = PagoReserva.query.count()
+        errores = []
+        if len(reservas) != 1:
+            errores.append(f'{len(reservas)} reservas activas para el mismo horario')
+        if pagos != len(reservas):
+            errores.append(f'{pagos} pagos para {len(reservas)} reservas')
+        if SaldoDepartamento.verificar():
+            errores.append('saldos_departamento no coincide con las tablas')
+
+        estados = Counter(categoria for _, categoria in respuestas)
+        if estados['success'] != 1:
+            errores.append(f"{estados['success']} respuestas de éxito (se esperaba 1)")
+        if any(codigo != 302 for codigo, _ in respuestas):
+            errores.append('respuestas con código distinto de 302')
+        return len(reservas), estados, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de reservas concurrentes sobre un mismo horario')
+    parser.add_argument('--procesos', type=int, default=10, help='Procesos (workers) simultáneos')
+    parser.add_argument('--hilos', type=int, default=20, help='Solicitudes simultáneas por proceso')
+    args = parser.parse_args()
+
+    solicitudes = args.procesos * args.hilos
+    directorio = tempfile.mkdtemp(prefix='buildtech_reservas_')
+    ruta_db = os.path.join(directorio, 'reservas.db')
+    app = crear_app(ruta_db)
+    area_id, usuarios = preparar(app, solicitudes)
+    with app.app_context():
+        db.engine.dispose()  # Cada proceso abre sus propias conexiones
+
+    fecha = date.today() + timedelta(days=7)
+    respuestas, segundos = ejecutar(ruta_db, area_id, fecha, usuarios, args.procesos)
+    reservas, estados, errores = verificar(app, area_id, fecha, respuestas)
+
+    print(f"\n🔁 {solicitudes} solicitudes ({args.procesos} procesos x {args.hilos} hilos) en {segundos:.2f} s")
+    print(f"   • respuestas: {dict(estados)}")
+    print(f"   • reservas activas: {reservas}")
+    for error in errores:
+        print(f"   ❌ {error}")
+    if not errores:
+        print("   ✅ Un solo residente obtuvo el horario")
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    os.remove(ruta_db)
+    os.rmdir(directorio)
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
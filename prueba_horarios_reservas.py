@@ -0,0 +1,96 @@
+# prueba_horarios_reservas.py
+"""
+Prueba de horarios de áreas que cierran a medianoche
+Un área abierta de 18:00 a 00:00 debe tener 6 horas por día: el mapa de
+disponibilidad del mes (/api/disponibilidad_mes/) y las ventanas libres
+(/api/ventanas_libres/) tienen que coincidir, sin horas ocupadas negativas
+ni días marcados como completos por error.
+
+Uso: python prueba_horarios_reservas.py
+No modifica buildtech.db: trabaja sobre una base en memoria.
+"""
+
+import sys
+import os
+from datetime import date, datetime, time, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from database import db
+
+
+def crear_app():
+    """App mínima con una base en memoria"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def main():
+    from models.reservas_model import AreaComun, Reserva, IndiceOcupacion, minutos
+    import models.finanzas_model  # noqa: F401 - registra las tablas
+
+    app = crear_app()
+    errores = []
+    with app.app_context():
+        db.create_all()
+        area = AreaComun('Salón Nocturno', 'Abierto hasta medianoche', capacidad=30,
+                         costo_hora=40, hora_apertura=time(18, 0), hora_cierre=time(0, 0))
+        area.save()
+
+        # Un mes completo en el futuro: ninguna ventana queda en el pasado
+        hoy = date.today()
+        anio, mes = (hoy.year + 1, 1) if hoy.month == 12 else (hoy.year, hoy.month + 1)
+        primero = date(anio, mes, 1)
+        reservas = {
+            primero + timedelta(days=2): (time(18, 0), time(20, 0)),
+            primero + timedelta(days=4): (time(20, 0), time(0, 0)),
+            primero + timedelta(days=6): (time(18, 0), time(0, 0)),
+        }
+        for fecha, (inicio, fin) in reservas.items():
+            Reserva(area.id, 101, 'Residente', fecha, inicio, fin).save()
+
+        if not area.admite_horario(time(22, 0), time(0, 0)):
+            errores.append('22:00-00:00 rechazado aunque el área cierra a medianoche')
+        if area.admite_horario(time(17, 0), time(19, 0)):
+            errores.append('17:00-19:00 aceptado antes de la apertura')
+
+        mapa = IndiceOcupacion.disponibilidad_mes([area], mes, anio)[0]
+        ultimo = primero + timedelta(days=len(mapa['completo']) - 1)
+        dias = Reserva.get_ventanas_libres(area, primero, ultimo, ahora=datetime(2000, 1, 1))
+
+        for n, dia in enumerate(dias):
+            horas_ventanas = sum(
+                ((minutos(v['fin']) or 24 * 60) - minutos(v['inicio'])) / 60
+                for v in dia['ventanas']
+            )
+            libres, ocupadas = mapa['horas_libres'][n], mapa['horas_ocupadas'][n]
+            completo = mapa['completo'][n]
+            fecha = dia['fecha'].isoformat()
+            if libres + ocupadas != 6:
+                errores.append(f'{fecha}: {libres} h libres + {ocupadas} h ocupadas (se esperaban 6)')
+            if ocupadas < 0:
+                errores.append(f'{fecha}: horas ocupadas negativas ({ocupadas})')
+            if libres != horas_ventanas:
+                errores.append(f'{fecha}: mapa {libres} h libres, ventanas {horas_ventanas} h')
+            if completo != int(not dia['ventanas']):
+                errores.append(f'{fecha}: completo={completo} con {len(dia["ventanas"])} ventanas')
+
+        esperado = {2: (4, 2), 4: (2, 4), 6: (0, 6), 0: (6, 0)}
+        for n, (libres, ocupadas) in esperado.items():
+            obtenido = (mapa['horas_libres'][n], mapa['horas_ocupadas'][n])
+            if obtenido != (libres, ocupadas):
+                errores.append(f'día {n + 1}: (libres, ocupadas) = {obtenido}, se esperaba {(libres, ocupadas)}')
+
+    print(f"\n🌙 Área 18:00-00:00, {len(dias)} días de {mes:02d}/{anio}")
+    for error in errores:
+        print(f"   ❌ {error}")
+    if not errores:
+        print("   ✅ El mapa del mes y las ventanas libres coinciden")
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# prueba_mora.py
+"""
+Prueba del cálculo de recargos por mora
+Crea cargos vencidos hace distinta cantidad de días y verifica el recargo
+guardado por CalculoMora.ejecutar contra el cálculo en Python: la tasa
+diaria se aplica por día de mora y la mensual por mes completo (la
+fracción de mes cuenta como un mes), con el tope como máximo.
+También verifica que repetir el cálculo del día con la misma configuración
+no falle y que con otra configuración se rechace.
+
+Uso: python prueba_mora.py
+No modifica buildtech.db: trabaja sobre una base en memoria.
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from database import db
+
+FECHA = date(2026, 10, 17)
+DIAS_VENCIDO = (6, 30, 35, 36, 65, 111, 200)
+ESCENARIOS = (
+    {'tasa_diaria': 0.0, 'tasa_mensual': 0.01, 'dias_gracia': 5, 'tope': None},
+    {'tasa_diaria': 0.0005, 'tasa_mensual': 0.02, 'dias_gracia': 5, 'tope': 0.05},
+)
+
+
+def crear_app():
+    """App mínima con una base en memoria"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def recargo_esperado(total, dias, config):
+    """Recargo calculado en Python para comparar con el SQL"""
+    dias_mora = dias - config['dias_gracia']
+    meses_mora = -(-dias_mora // 30)
+    recargo = total * (Decimal(str(config['tasa_diaria'])) * dias_mora +
+                       Decimal(str(config['tasa_mensual'])) * meses_mora)
+    if config['tope'] is not None:
+        recargo = min(recargo, total * Decimal(str(config['tope'])))
+    return recargo.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def preparar():
+    """Un cargo por cantidad de días vencido"""
+    from models.finanzas_model import CargoMensual
+
+    cargos = {}
+    for departamento, dias in enumerate(DIAS_VENCIDO, start=101):
+        cargo = CargoMensual(departamento, 1, 2026, luz=400, agua=40)
+        cargo.fecha_vencimiento = FECHA - timedelta(days=dias)
+        cargo.save()
+        cargos[cargo.id] = dias
+    return cargos
+
+
+def main():
+    from models.finanzas_model import CargoMensual, CalculoMora, AuditoriaMora, RecargoMora
+    import models.reservas_model  # noqa: F401 - registra las tablas
+
+    app = crear_app()
+    errores = []
+    with app.app_context():
+        for n, config in enumerate(ESCENARIOS):
+            db.drop_all()
+            db.create_all()
+            cargos = preparar()
+
+            CalculoMora.ejecutar(FECHA, **config)
+            for cargo_id, dias in cargos.items():
+                total = db.session.get(CargoMensual, cargo_id).total
+                esperado = recargo_esperado(total, dias, config)
+                auditoria = AuditoriaMora.query.filter_by(cargo_id=cargo_id, fecha=FECHA).one()
+                vigente = RecargoMora.query.filter_by(cargo_id=cargo_id).one()
+                for origen, valor in (('auditoría', auditoria.recargo), ('vigente', vigente.monto)):
+                    if Decimal(str(valor)) != esperado:
+                        errores.append(f'escenario {n + 1}, {dias} días: recargo {origen} '
+                                       f'{valor} (se esperaba {esperado})')
+
+            resultado = CalculoMora.ejecutar(FECHA, **config)
+            if not resultado['ya_calculado']:
+                errores.append(f'escenario {n + 1}: repetir con la misma configuración no fue idempotente')
+            try:
+                CalculoMora.ejecutar(FECHA, **dict(config, tasa_mensual=config['tasa_mensual'] * 2))
+                errores.append(f'escenario {n + 1}: se aceptó otra configuración el mismo día')
+            except ValueError:
+                pass
+
+    print(f"\n⏰ Mora al {FECHA.strftime('%d/%m/%Y')}: {len(ESCENARIOS)} configuraciones, "
+          f"{len(DIAS_VENCIDO)} cargos cada una")
+    for error in errores:
+        print(f"   ❌ {error}")
+    if not errores:
+        print("   ✅ Los recargos guardados coinciden con el cálculo esperado")
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,6 +23,7 @@ from controllers.mantenimiento_controller import mantenimiento_bp
 from controllers.comunicacion_controller import comunicacion_bp
 from controllers.finanzas_controller import finanzas_bp
 from controllers.reservas_controller import reservas_bp
+from controllers.reportes_controller import reportes_bp
 
 # Importar eventos de Socket.IO
 from socket_events import register_socket_events
@@ -38,6 +39,8 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'buildtech-secret-key-2025'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+    # Segundos que las APIs de estadísticas financieras se sirven desde caché
+    app.config['FINANZAS_CACHE_TTL'] = int(os.environ.get('FINANZAS_CACHE_TTL', 30))
     
     # Inicializar extensiones
     db.init_app(app)
@@ -60,6 +63,7 @@ def create_app():
     app.register_blueprint(comunicacion_bp)
     app.register_blueprint(finanzas_bp)
     app.register_blueprint(reservas_bp)
+    app.register_blueprint(reportes_bp)
     
     # Registrar eventos de Socket.IO
     register_socket_events(socketio)
@@ -75,6 +79,13 @@ def create_app():
         from models.reservas_model import inicializar_areas_comunes
         inicializar_areas_comunes()
         
+        # Poblar el resumen mensual y los saldos si las tablas son nuevas
+        from models.finanzas_model import ResumenMensual, SaldoDepartamento
+        if ResumenMensual.query.first() is None:
+            ResumenMensual.reconstruir()
+        if SaldoDepartamento.query.first() is None:
+            SaldoDepartamento.reconstruir()
+        
         print("\n" + "="*70)
         print("✓ Base de datos SQLite creada correctamente.")
         print("✓ Todas las tablas fueron creadas exitosamente.")
@@ -1,4 +1,5 @@
 from flask_socketio import emit, join_room, leave_room
+from flask_login import current_user
 from models.chat_model import ChatMessage, Notification
 from models.mantenimiento_model import Mantenimiento
 
@@ -99,6 +100,12 @@ def register_socket_events(socketio):
             'notifications': [n.to_dict() for n in notifications]
         })
     
+    @socketio.on('join_user')
+    def handle_join_user():
+        """Unirse a la sala personal del usuario (avisos de reportes listos)"""
+        if current_user.is_authenticated:
+            join_room(f'usuario_{current_user.id}')
+    
     @socketio.on('mark_notification_read')
     def handle_mark_read(data):
         """Marcar notificación como leída"""
@@ -0,0 +1,174 @@
+# tareas_finanzas.py
+"""
+Tareas administrativas de finanzas
+Uso: python tareas_finanzas.py <comando> [opciones]
+
+Comandos:
+    reconstruir_resumen   Recalcula la tabla resumen_mensual desde las tablas originales
+    generar_cargos        Genera los cargos faltantes de un mes para todos los departamentos
+    reconstruir_saldos    Recalcula los saldos por departamento desde las tablas originales
+    calcular_mora         Calcula los recargos por mora de los cargos vencidos
+    purgar_claves         Elimina las claves de idempotencia de pagos antiguas
+
+Para el cálculo nocturno de mora, por ejemplo con cron:
+    5 0 * * * cd /ruta/a/buildtech && python tareas_finanzas.py calcular_mora
+"""
+
+import sys
+import os
+import argparse
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run import create_app
+
+
+def reconstruir_resumen(args):
+    """Verifica el resumen mensual y lo reconstruye si hay diferencias"""
+    from models.finanzas_model import ResumenMensual
+
+    print("\n🔍 Verificando resumen mensual...")
+    diferencias = ResumenMensual.verificar()
+
+    if not diferencias:
+        print("✅ El resumen mensual coincide con las tablas originales")
+        return 0
+
+    print(f"⚠️  {len(diferencias)} diferencias encontradas:")
+    for (anio, mes, tipo, categoria), actual, esperado in diferencias:
+        etiqueta = f"{tipo}/{categoria}" if categoria else tipo
+        print(f"   • {mes:02d}/{anio} {etiqueta}: "
+              f"actual Bs. {actual[0]:,.2f} ({actual[1]}) → "
+              f"esperado Bs. {esperado[0]:,.2f} ({esperado[1]})")
+
+    if args.solo_verificar:
+        return 1
+
+    filas = ResumenMensual.reconstruir()
+    print(f"✅ Resumen reconstruido: {filas} filas")
+    return 0
+
+
+def reconstruir_saldos(args):
+    """Verifica los saldos por departamento y los reconstruye si hay diferencias"""
+    from models.finanzas_model import SaldoDepartamento
+
+    print("\n🔍 Verificando saldos por departamento...")
+    diferencias = SaldoDepartamento.verificar()
+
+    if not diferencias:
+        print("✅ Los saldos coinciden con las tablas originales")
+        return 0
+
+    print(f"⚠️  {len(diferencias)} diferencias encontradas:")
+    for departamento, actual, esperado in diferencias:
+        print(f"   • Dpto {departamento}: "
+              f"actual deuda Bs. {actual[0]:,.2f} / crédito Bs. {actual[1]:,.2f} ({actual[2]}) → "
+              f"esperado deuda Bs. {esperado[0]:,.2f} / crédito Bs. {esperado[1]:,.2f} ({esperado[2]})")
+
+    if args.solo_verificar:
+        return 1
+
+    filas = SaldoDepartamento.reconstruir()
+    print(f"✅ Saldos reconstruidos: {filas} departamentos")
+    return 0
+
+
+def generar_cargos(args):
+    """Genera en bloque los cargos del mes indicado"""
+    from models.finanzas_model import TARIFAS_DEFAULT, generar_cargos_todos_departamentos
+
+    tarifas = {campo: getattr(args, campo) for campo in TARIFAS_DEFAULT
+               if getattr(args, campo) is not None}
+    generar_cargos_todos_departamentos(args.mes, args.anio, tarifas)
+    return 0
+
+
+def calcular_mora(args):
+    """Calcula los recargos por mora del día (idempotente)"""
+    from models.finanzas_model import CalculoMora
+
+    fecha = datetime.strptime(args.fecha, '%Y-%m-%d').date() if args.fecha else None
+    try:
+        resultado = CalculoMora.ejecutar(
+            fecha,
+            tasa_diaria=args.tasa_diaria,
+            tasa_mensual=args.tasa_mensual,
+            dias_gracia=args.dias_gracia,
+            tope=args.tope,
+        )
+    except ValueError as e:
+        print(f"\n❌ {e}")
+        return 1
+
+    print(f"\n⏰ Mora al {resultado['fecha'].strftime('%d/%m/%Y')}")
+    if resultado['ya_calculado']:
+        print("ℹ️  El cálculo de esta fecha ya se había realizado; no hubo cambios")
+    print(f"   • Cargos con recargo: {resultado['cargos']} ({resultado['nuevos']} nuevos)")
+    print(f"   • Total de recargos: Bs. {resultado['total_recargos']:,.2f}")
+    print(f"   • Incremento del día: Bs. {resultado['incremento']:,.2f}")
+    return 0
+
+
+def purgar_claves(args):
+    """Elimina las claves de idempotencia con más de N días"""
+    from models.finanzas_model import ClaveIdempotencia
+
+    eliminadas = ClaveIdempotencia.purgar(datetime.utcnow() - timedelta(days=args.dias))
+    print(f"\n🧹 Claves de idempotencia eliminadas: {eliminadas}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tareas administrativas de finanzas')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p_resumen = subparsers.add_parser('reconstruir_resumen',
+                                      help='Recalcula el resumen mensual y reporta diferencias')
+    p_resumen.add_argument('--solo-verificar', action='store_true',
+                           help='Solo reporta diferencias, no modifica la tabla')
+    p_resumen.set_defaults(func=reconstruir_resumen)
+
+    p_saldos = subparsers.add_parser('reconstruir_saldos',
+                                     help='Recalcula los saldos por departamento y reporta diferencias')
+    p_saldos.add_argument('--solo-verificar', action='store_true',
+                          help='Solo reporta diferencias, no modifica la tabla')
+    p_saldos.set_defaults(func=reconstruir_saldos)
+
+    p_cargos = subparsers.add_parser('generar_cargos',
+                                     help='Genera los cargos faltantes de un mes')
+    p_cargos.add_argument('--mes', type=int, help='Mes (1-12), por defecto el actual')
+    p_cargos.add_argument('--anio', type=int, help='Año, por defecto el actual')
+    for campo in ('luz', 'agua', 'gas', 'mantenimiento', 'expensas_comunes'):
+        p_cargos.add_argument(f'--{campo.replace("_", "-")}', dest=campo, type=float,
+                              help=f'Tarifa de {campo.replace("_", " ")} (Bs.)')
+    p_cargos.set_defaults(func=generar_cargos)
+
+    p_mora = subparsers.add_parser('calcular_mora',
+                                   help='Calcula los recargos por mora de los cargos vencidos')
+    p_mora.add_argument('--fecha', help='Fecha de cálculo (YYYY-MM-DD), por defecto hoy')
+    p_mora.add_argument('--tasa-diaria', dest='tasa_diaria', type=float,
+                        help='Fracción del cargo por día de mora (ej. 0.0005)')
+    p_mora.add_argument('--tasa-mensual', dest='tasa_mensual', type=float,
+                        help='Fracción del cargo por mes o fracción de mora')
+    p_mora.add_argument('--dias-gracia', dest='dias_gracia', type=int,
+                        help='Días después del vencimiento sin recargo')
+    p_mora.add_argument('--tope', type=float,
+                        help='Recargo máximo como fracción del cargo')
+    p_mora.set_defaults(func=calcular_mora)
+
+    p_claves = subparsers.add_parser('purgar_claves',
+                                     help='Elimina las claves de idempotencia de pagos antiguas')
+    p_claves.add_argument('--dias', type=int, default=7,
+                          help='Antigüedad mínima en días (por defecto 7)')
+    p_claves.set_defaults(func=purgar_claves)
+
+    args = parser.parse_args()
+
+    app, socketio = create_app()
+    with app.app_context():
+        return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# app/utils/cache_utils.py
+"""
+Caché en memoria con expiración (TTL) e invalidación por etiquetas
+Cada entrada guarda las etiquetas de los datos de los que depende; al
+invalidar una etiqueta se descartan todas las entradas que la tienen.
+"""
+
+import time
+import threading
+
+# Etiqueta comodín: invalidarla descarta toda la caché
+TODAS = '*'
+
+_AUSENTE = object()
+
+
+class CacheTTL:
+    """Caché de proceso con contadores de aciertos y fallos"""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entradas = {}      # clave -> (expira, valor, etiquetas)
+        self._lock = threading.Lock()
+        self._generacion = 0     # Aumenta con cada invalidación
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    @property
+    def generacion(self):
+        """Contador de invalidaciones; se pasa a guardar() para no guardar valores viejos"""
+        return self._generacion
+
+    def obtener(self, clave, defecto=None):
+        """Retorna el valor vigente de la clave o el defecto (cuenta acierto o fallo)"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > time.monotonic():
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            return defecto
+
+    def guardar(self, clave, valor, etiquetas=(), ttl=None, generacion=None):
+        """
+        Guarda un valor con sus etiquetas
+        Si se indica la generación leída antes de calcular el valor y hubo una
+        invalidación durante el cálculo, el valor puede estar desactualizado y
+        no se guarda.
+        """
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return False
+            expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._entradas[clave] = (expira, valor, frozenset(etiquetas))
+            return True
+
+    def obtener_o_calcular(self, clave, calcular, etiquetas=(), ttl=None):
+        """Retorna el valor en caché o lo calcula y lo guarda"""
+        generacion = self._generacion
+        valor = self.obtener(clave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = calcular()
+            self.guardar(clave, valor, etiquetas, ttl, generacion)
+        return valor
+
+    def invalidar(self, etiquetas):
+        """Descarta las entradas que dependen de alguna de las etiquetas"""
+        etiquetas = set(etiquetas)
+        if not etiquetas:
+            return 0
+        with self._lock:
+            self._generacion += 1
+            if TODAS in etiquetas:
+                claves = list(self._entradas)
+            else:
+                claves = [clave for clave, (_, _, propias) in self._entradas.items()
+                          if propias & etiquetas]
+            for clave in claves:
+                del self._entradas[clave]
+            self.invalidaciones += len(claves)
+            return len(claves)
+
+    def limpiar(self):
+        """Vacía la caché y reinicia los contadores"""
+        with self._lock:
+            self._entradas.clear()
+            self.aciertos = self.fallos = self.invalidaciones = 0
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'entradas': len(self._entradas),
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'invalidaciones': self.invalidaciones,
+            'tasa_aciertos': round(self.aciertos / consultas * 100, 2) if consultas else 0.0,
+            'ttl': self.ttl,
+        }
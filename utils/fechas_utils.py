@@ -0,0 +1,43 @@
+# app/utils/fechas_utils.py
+"""
+Utilidades de fechas para consultas por período
+Los filtros por mes se expresan como rangos semiabiertos [inicio, fin)
+para que SQLite pueda usar los índices sobre columnas de fecha
+(extract('month', columna) obliga a recorrer toda la tabla).
+"""
+
+from datetime import date, datetime
+
+
+def rango_mes(mes, anio):
+    """
+    Rango semiabierto de fechas de un mes: (primer día, primer día del mes siguiente)
+    Usar con columnas Date: inicio <= columna < fin
+    """
+    inicio = date(anio, mes, 1)
+    fin = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    return inicio, fin
+
+
+def rango_mes_datetime(mes, anio):
+    """
+    Rango semiabierto de un mes como datetime (medianoche a medianoche)
+    Usar con columnas DateTime: inicio <= columna < fin
+    """
+    inicio, fin = rango_mes(mes, anio)
+    return (datetime.combine(inicio, datetime.min.time()),
+            datetime.combine(fin, datetime.min.time()))
+
+
+def filtro_mes(columna, mes, anio):
+    """
+    Condición SQL "columna dentro del mes" sobre un rango indexable
+    Elige el rango de fechas o de datetime según el tipo de la columna
+    """
+    from sqlalchemy import DateTime, and_
+
+    if isinstance(columna.type, DateTime):
+        inicio, fin = rango_mes_datetime(mes, anio)
+    else:
+        inicio, fin = rango_mes(mes, anio)
+    return and_(columna >= inicio, columna < fin)
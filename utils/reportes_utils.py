@@ -0,0 +1,275 @@
+# app/utils/reportes_utils.py
+"""
+Utilidades para reportes en PDF (finanzas y mantenimiento)
+Generación con ReportLab y caché en disco por versión de datos
+"""
+
+import io
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER
+
+
+def construir_pdf_reporte_mensual(mes, anio, ingresos_cargos, ingresos_reservas, total_gastos, gastos):
+    """
+    Construye el PDF del reporte mensual y retorna sus bytes
+
+    Args:
+        gastos: lista de (fecha_gasto, concepto, categoria, monto)
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#2c3e50'),
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+
+    # Título
+    mes_nombre = datetime(anio, mes, 1).strftime('%B %Y')
+    title = Paragraph(f"REPORTE FINANCIERO<br/>{mes_nombre.upper()}", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Tabla de resumen
+    data_resumen = [
+        ['CONCEPTO', 'MONTO (Bs.)'],
+        ['Ingresos por Cargos Mensuales', f'{ingresos_cargos:,.2f}'],
+        ['Ingresos por Reservas', f'{ingresos_reservas:,.2f}'],
+        ['TOTAL INGRESOS', f'{ingresos_cargos + ingresos_reservas:,.2f}'],
+        ['', ''],
+        ['TOTAL GASTOS', f'{total_gastos:,.2f}'],
+        ['', ''],
+        ['BALANCE', f'{(ingresos_cargos + ingresos_reservas) - total_gastos:,.2f}'],
+    ]
+
+    table_resumen = Table(data_resumen, colWidths=[4*inch, 2*inch])
+    table_resumen.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 2), (-1, 2), colors.lightblue),
+        ('BACKGROUND', (0, 4), (-1, 4), colors.lightcoral),
+        ('BACKGROUND', (0, 6), (-1, 6), colors.lightgreen),
+        ('FONTNAME', (0, 2), (-1, 2), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 4), (-1, 4), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 6), (-1, 6), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    elements.append(table_resumen)
+    elements.append(PageBreak())
+
+    # Detalle de gastos
+    if gastos:
+        elements.append(Paragraph("DETALLE DE GASTOS", styles['Heading2']))
+        elements.append(Spacer(1, 0.2*inch))
+
+        data_gastos = [['Fecha', 'Concepto', 'Categoría', 'Monto (Bs.)']]
+        for fecha_gasto, concepto, categoria, monto in gastos:
+            data_gastos.append([
+                fecha_gasto.strftime('%d/%m/%Y'),
+                concepto[:40],
+                categoria,
+                f'{float(monto):,.2f}'
+            ])
+
+        table_gastos = Table(data_gastos, colWidths=[1*inch, 3*inch, 1.5*inch, 1.5*inch])
+        table_gastos.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+
+        elements.append(table_gastos)
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def construir_pdf_mantenimiento(filas):
+    """
+    Construye el PDF de un ticket de mantenimiento y retorna sus bytes
+
+    Args:
+        filas: lista de [etiqueta, valor] para la tabla del ticket
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+
+    styles = getSampleStyleSheet()
+    title_style = styles['Heading1']
+    # Configurar el estilo del título
+    title_style.alignment = 1 # Centro
+
+    # Título
+    elements.append(Paragraph("REPORTE DE MANTENIMIENTO", title_style))
+    elements.append(Spacer(1, 0.3*inch))
+
+    table = Table(filas, colWidths=[2*inch, 4*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    elements.append(table)
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def datos_reporte_mantenimiento(ticket):
+    """Filas de la tabla del reporte de un ticket"""
+    return [
+        ['ID Ticket:', str(ticket.id_mantenimiento)],
+        ['Descripción:', ticket.descripcion or 'N/A'],
+        ['Prioridad:', ticket.prioridad or 'N/A'],
+        ['Responsable:', ticket.responsable or 'N/A'],
+        ['Fecha Inicio:', str(ticket.fecha_ini) if ticket.fecha_ini else 'N/A'],
+        ['Fecha Fin:', str(ticket.fecha_fin) if ticket.fecha_fin else 'N/A'],
+        ['Costo:', f'${ticket.costo}' if ticket.costo else 'N/A'],
+        ['Trabajo Realizado:', 'Sí' if ticket.trabajo_realizado else 'No'],
+        ['Evidencia:', 'Disponible' if ticket.evidencia_url else 'No disponible'],
+    ]
+
+
+def renderizar_reporte(tipo, parametros):
+    """
+    Punto de entrada de los procesos de reportes.
+    Solo recibe datos simples: no usa la base de datos ni la app Flask.
+    """
+    if tipo == 'financiero':
+        datos = parametros['datos']
+        contenido = construir_pdf_reporte_mensual(
+            datos['mes'], datos['anio'],
+            datos['ingresos_cargos'],
+            datos['ingresos_reservas'],
+            datos['total_gastos'],
+            datos['gastos']
+        )
+        guardar_reporte(parametros['directorio'], datos['mes'], datos['anio'],
+                        parametros['version'], contenido)
+    elif tipo == 'mantenimiento':
+        contenido = construir_pdf_mantenimiento(parametros['filas'])
+        os.makedirs(os.path.dirname(parametros['ruta']), exist_ok=True)
+        with open(parametros['ruta'], 'wb') as archivo:
+            archivo.write(contenido)
+    else:
+        raise ValueError(f'Tipo de reporte no válido: {tipo}')
+
+
+# ============================================================================
+# CACHÉ DE REPORTES MENSUALES
+# ============================================================================
+
+def datos_reporte_mensual(mes, anio):
+    """
+    Reúne los datos que se imprimen en el reporte de un mes
+    Retorna un dict con los totales y el detalle de gastos
+    """
+    from models.finanzas_model import ResumenMensual, GastoEdificio
+
+    totales = ResumenMensual.get_totales(mes, anio)
+    gastos = sorted(
+        GastoEdificio.get_by_mes(mes, anio),
+        key=lambda g: (g.fecha_gasto, g.id)
+    )
+
+    return {
+        'mes': mes,
+        'anio': anio,
+        'ingresos_cargos': totales['cargos'],
+        'ingresos_reservas': totales['reservas'],
+        'total_gastos': totales['gastos'],
+        'gastos': [(g.fecha_gasto, g.concepto, g.categoria, g.monto) for g in gastos],
+    }
+
+
+def version_datos(datos):
+    """Hash SHA-256 del contenido del reporte: cambia si cambia cualquier dato impreso"""
+    contenido = json.dumps(datos, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def ruta_reporte(directorio, mes, anio, version):
+    """Ruta del PDF cacheado para un mes y versión de datos"""
+    return os.path.join(directorio, f'reporte_{anio}_{mes:02d}_{version}.pdf')
+
+
+def guardar_reporte(directorio, mes, anio, version, contenido):
+    """Guarda el PDF y elimina las versiones anteriores del mismo mes"""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = ruta_reporte(directorio, mes, anio, version)
+
+    # Escritura atómica para no servir archivos incompletos
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+
+    prefijo = f'reporte_{anio}_{mes:02d}_'
+    for nombre in os.listdir(directorio):
+        if nombre.startswith(prefijo) and nombre.endswith('.pdf') and \
+                os.path.join(directorio, nombre) != ruta:
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except OSError:
+                pass
+
+    return ruta
+
+
+def preparar_reporte_mensual(directorio, mes, anio):
+    """
+    Determina la versión vigente del reporte de un mes.
+    Retorna (ruta, version, datos); datos es None si el PDF ya está en caché.
+    Los meses cerrados se sirven directamente sin consultar los datos.
+    """
+    from models.finanzas_model import CierreMes
+
+    cierre = CierreMes.get_by_mes(mes, anio)
+    if cierre:
+        ruta = ruta_reporte(directorio, mes, anio, cierre.version_reporte)
+        if os.path.exists(ruta):
+            return ruta, cierre.version_reporte, None
+
+    datos = datos_reporte_mensual(mes, anio)
+    version = version_datos(datos)
+    ruta = ruta_reporte(directorio, mes, anio, version)
+
+    if cierre and cierre.version_reporte != version:
+        cierre.version_reporte = version
+        cierre.save()
+
+    if os.path.exists(ruta):
+        return ruta, version, None
+    return ruta, version, datos
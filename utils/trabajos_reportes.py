@@ -0,0 +1,248 @@
+# app/utils/trabajos_reportes.py
+"""
+Cola de trabajos para la generación de reportes PDF
+Los PDFs se renderizan en procesos separados para no bloquear el servidor.
+Un supervisor (tarea en segundo plano de Socket.IO) lanza los procesos
+pendientes, revisa cuáles terminaron y avisa al usuario en su sala.
+
+La cola y los procesos viven en el worker que recibió la solicitud. El
+estado de cada trabajo se guarda además en un archivo JSON (en instance/),
+así las consultas de estado y descarga funcionan desde cualquier worker
+del mismo servidor; con varios servidores instance/ debe ser compartido.
+"""
+
+import os
+import re
+import json
+import uuid
+import multiprocessing
+from collections import deque
+from datetime import datetime, timedelta
+
+from utils.reportes_utils import renderizar_reporte
+
+
+# Tiempo que se conservan los trabajos terminados (y sus archivos temporales)
+DURACION_TRABAJOS = timedelta(hours=1)
+
+
+class TrabajoReporte:
+    """Trabajo de generación de un reporte PDF"""
+
+    def __init__(self, tipo, usuario_id, parametros, ruta, nombre_descarga, temporal=False):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo                        # 'financiero', 'mantenimiento'
+        self.usuario_id = usuario_id
+        self.parametros = parametros            # Datos simples que recibe el proceso
+        self.ruta = ruta                        # Archivo PDF resultante
+        self.nombre_descarga = nombre_descarga
+        self.temporal = temporal                # Se elimina el archivo al purgar el trabajo
+        self.estado = 'en_cola'                 # 'en_cola', 'en_proceso', 'completado', 'error'
+        self.error = None
+        self.url_estado = None
+        self.url_descarga = None
+        self.fecha_creacion = datetime.utcnow()
+        self.fecha_inicio = None
+        self.fecha_fin = None
+        self.archivo_estado = None              # JSON con el estado, visible para otros workers
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
+
+    def marcar_completado(self):
+        self.estado = 'completado'
+        self.fecha_fin = datetime.utcnow()
+
+    def marcar_error(self, mensaje):
+        self.estado = 'error'
+        self.error = mensaje
+        self.fecha_fin = datetime.utcnow()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'error': self.error,
+            'nombre_descarga': self.nombre_descarga,
+            'url_estado': self.url_estado,
+            'url_descarga': self.url_descarga if self.estado == 'completado' else None,
+            'fecha_creacion': self.fecha_creacion.isoformat(),
+            'fecha_inicio': self.fecha_inicio.isoformat() if self.fecha_inicio else None,
+            'fecha_fin': self.fecha_fin.isoformat() if self.fecha_fin else None,
+        }
+
+    def guardar_estado(self):
+        """Escribe el estado del trabajo en archivo_estado (escritura atómica)"""
+        if not self.archivo_estado:
+            return
+        os.makedirs(os.path.dirname(self.archivo_estado), exist_ok=True)
+        estado = dict(self.to_dict(), usuario_id=self.usuario_id, ruta=self.ruta,
+                      url_descarga=self.url_descarga, temporal=self.temporal)
+        temporal = f'{self.archivo_estado}.{os.getpid()}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo)
+        os.replace(temporal, self.archivo_estado)
+
+    @staticmethod
+    def cargar_estado(archivo_estado):
+        """Reconstruye un trabajo de otro worker desde su archivo de estado"""
+        try:
+            with open(archivo_estado, encoding='utf-8') as archivo:
+                estado = json.load(archivo)
+        except (OSError, ValueError):
+            return None
+
+        def fecha(valor):
+            return datetime.fromisoformat(valor) if valor else None
+
+        trabajo = TrabajoReporte(estado['tipo'], estado['usuario_id'], {}, estado['ruta'],
+                                 estado['nombre_descarga'], estado['temporal'])
+        trabajo.id = estado['id']
+        trabajo.estado = estado['estado']
+        trabajo.error = estado['error']
+        trabajo.url_estado = estado['url_estado']
+        trabajo.url_descarga = estado['url_descarga']
+        trabajo.fecha_creacion = fecha(estado['fecha_creacion'])
+        trabajo.fecha_inicio = fecha(estado['fecha_inicio'])
+        trabajo.fecha_fin = fecha(estado['fecha_fin'])
+        trabajo.archivo_estado = archivo_estado
+        return trabajo
+
+
+class ColaReportes:
+    """
+    Cola en memoria de trabajos de reportes.
+    Cada trabajo se ejecuta en su propio proceso (contexto 'spawn', compatible
+    con eventlet) y como máximo max_procesos a la vez.
+    """
+
+    def __init__(self, max_procesos=None):
+        self.max_procesos = max_procesos or int(os.environ.get('REPORTES_MAX_PROCESOS', 2))
+        self._trabajos = {}
+        self._pendientes = deque()
+        self._en_proceso = {}
+        self._socketio = None
+        self._supervisor_activo = False
+        self._contexto = multiprocessing.get_context('spawn')
+
+    def obtener(self, trabajo_id, directorio_estados=None):
+        """
+        Trabajo de este worker o, si no está en memoria, el guardado por otro
+        worker en directorio_estados
+        """
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo or not directorio_estados or not re.fullmatch(r'[0-9a-f]{32}', trabajo_id):
+            return trabajo
+        return TrabajoReporte.cargar_estado(os.path.join(directorio_estados, f'{trabajo_id}.json'))
+
+    def buscar_activo(self, ruta):
+        """Trabajo sin terminar que genera el archivo indicado (evita duplicados)"""
+        for trabajo in self._trabajos.values():
+            if trabajo.ruta == ruta and not trabajo.terminado:
+                return trabajo
+        return None
+
+    def encolar(self, trabajo, socketio=None):
+        """
+        Registra el trabajo y lo pone en cola.
+        Sin servidor Socket.IO (scripts, consola) se genera en el mismo hilo.
+        """
+        self._purgar()
+        self._trabajos[trabajo.id] = trabajo
+        trabajo.guardar_estado()
+
+        if trabajo.terminado:
+            return trabajo
+
+        if socketio is None:
+            self._ejecutar_local(trabajo)
+            return trabajo
+
+        self._socketio = socketio
+        self._pendientes.append(trabajo)
+        if not self._supervisor_activo:
+            self._supervisor_activo = True
+            socketio.start_background_task(self._supervisar)
+        return trabajo
+
+    def _ejecutar_local(self, trabajo):
+        trabajo.estado = 'en_proceso'
+        trabajo.fecha_inicio = datetime.utcnow()
+        try:
+            renderizar_reporte(trabajo.tipo, trabajo.parametros)
+            trabajo.marcar_completado()
+        except Exception as e:
+            trabajo.marcar_error(str(e))
+        trabajo.guardar_estado()
+
+    def _supervisar(self):
+        """Bucle del supervisor: termina cuando no quedan trabajos"""
+        try:
+            while self._pendientes or self._en_proceso:
+                self._revisar_procesos()
+                while self._pendientes and len(self._en_proceso) < self.max_procesos:
+                    self._iniciar(self._pendientes.popleft())
+                self._socketio.sleep(0.2)
+        finally:
+            self._supervisor_activo = False
+
+    def _iniciar(self, trabajo):
+        try:
+            proceso = self._contexto.Process(
+                target=renderizar_reporte,
+                args=(trabajo.tipo, trabajo.parametros),
+                daemon=True
+            )
+            proceso.start()
+        except Exception as e:
+            trabajo.marcar_error(f'No se pudo iniciar el proceso: {e}')
+            self._notificar(trabajo)
+            return
+
+        trabajo.estado = 'en_proceso'
+        trabajo.fecha_inicio = datetime.utcnow()
+        trabajo.guardar_estado()
+        self._en_proceso[trabajo.id] = (trabajo, proceso)
+
+    def _revisar_procesos(self):
+        for trabajo_id, (trabajo, proceso) in list(self._en_proceso.items()):
+            if proceso.is_alive():
+                continue
+
+            proceso.join(0)
+            del self._en_proceso[trabajo_id]
+
+            if proceso.exitcode == 0 and os.path.exists(trabajo.ruta):
+                trabajo.marcar_completado()
+            else:
+                trabajo.marcar_error(f'El proceso terminó con código {proceso.exitcode}')
+            self._notificar(trabajo)
+
+    def _notificar(self, trabajo):
+        """Guarda el estado final y avisa al usuario que solicitó el reporte"""
+        trabajo.guardar_estado()
+        if self._socketio and trabajo.usuario_id is not None:
+            self._socketio.emit('reporte_listo', trabajo.to_dict(),
+                                room=f'usuario_{trabajo.usuario_id}')
+
+    def _purgar(self):
+        """Elimina los trabajos terminados hace más de DURACION_TRABAJOS"""
+        limite = datetime.utcnow() - DURACION_TRABAJOS
+        for trabajo_id, trabajo in list(self._trabajos.items()):
+            if trabajo.terminado and trabajo.fecha_fin < limite:
+                del self._trabajos[trabajo_id]
+                archivos = [trabajo.archivo_estado]
+                if trabajo.temporal:
+                    archivos.append(trabajo.ruta)
+                for ruta in archivos:
+                    if ruta and os.path.exists(ruta):
+                        try:
+                            os.remove(ruta)
+                        except OSError:
+                            pass
+
+
+# Cola compartida por toda la aplicación
+cola_reportes = ColaReportes()
@@ -34,4 +34,12 @@ def generate_ticket(ticket):
         title="Ticket",
         ticket=ticket,
         download_url=url_for('mantenimiento.download_report', id=ticket.id_mantenimiento)
-    )
\ No newline at end of file
+    )
+
+def reporte_en_preparacion(trabajo, ticket):
+    return render_template(
+        "reportes/en_preparacion.html",
+        title="Preparando reporte",
+        trabajo=trabajo,
+        volver=url_for('mantenimiento.generate_ticket', id=ticket.id_mantenimiento)
+    )